@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+ADB Transport - Native adb smart-socket client for OTA sideload and multi-file push
+Talks to the adb server directly: sideload blocks are served from a memory-mapped
+package, and sync pushes stream SEND/DATA/DONE for every file without a round trip each
+"""
+
+import os
+import sys
+import time
+import mmap
+import shutil
+import socket
+import queue
+import struct
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+
+ADB_HOST = "127.0.0.1"
+ADB_PORT = 5037
+
+SIDELOAD_BLOCK = 64 * 1024   # Block size recovery's minadbd requests
+SIDELOAD_REQUEST = 8         # Block number as 8 ASCII digits
+SIDELOAD_DONE = b"DONEDONE"
+SIDELOAD_FAIL = b"FAILFAIL"
+SIDELOAD_WAIT = 10 * 60      # Recovery boot plus choosing "Apply update from ADB"
+
+SYNC_HEADER = struct.Struct("<4sI")
+SYNC_STAT = struct.Struct("<4sIII")  # id, mode, size, mtime
+SYNC_DATA_MAX = 64 * 1024
+SEND_BUFFER = 1024 * 1024    # Frames are coalesced up to this before each socket write
+DEFAULT_MODE = 0o644
+
+
+class AdbError(Exception):
+    pass
+
+
+def recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise AdbError(f"Connection closed with {size - len(data)} bytes outstanding")
+        data += chunk
+    return bytes(data)
+
+
+def read_status(sock):
+    """OKAY, or raise with the server's FAIL message"""
+    status = recv_exact(sock, 4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        length = int(recv_exact(sock, 4), 16)
+        raise AdbError(recv_exact(sock, length).decode(errors="replace"))
+    raise AdbError(f"Unexpected adb status {status!r}")
+
+
+def request(sock, service):
+    payload = service.encode()
+    sock.sendall(b"%04x" % len(payload) + payload)
+    read_status(sock)
+
+
+def map_file(path):
+    """Read-only mapping of a file (empty files map to b"")"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class AdbClient:
+    """One device through the adb server's smart socket"""
+
+    def __init__(self, serial=None, host=ADB_HOST, port=ADB_PORT, timeout=30.0):
+        self.serial = serial
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def connect(self, service):
+        """A socket with the device transport selected and the service opened"""
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            request(sock, f"host:transport:{self.serial}" if self.serial else "host:transport-any")
+            request(sock, service)
+        except (AdbError, OSError):
+            sock.close()
+            raise
+        return sock
+
+    def wait_for(self, state, timeout=None):
+        """Block until the device is in state ("device", "recovery", "sideload", ...)
+
+        The server answers OKAY once for the request and again when the state is reached.
+        """
+        prefix = f"host-serial:{self.serial}" if self.serial else "host"
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        try:
+            request(sock, f"{prefix}:wait-for-any-{state}")
+            sock.settimeout(timeout)
+            read_status(sock)
+        except socket.timeout:
+            raise AdbError(f"Device not in {state} state after {timeout:g}s")
+        finally:
+            sock.close()
+
+    def sideload(self, package, log=print):
+        """Serve an OTA package to recovery's "Apply update from ADB" on demand"""
+        size = os.path.getsize(package)
+        blocks = (size + SIDELOAD_BLOCK - 1) // SIDELOAD_BLOCK
+        data = map_file(package)
+        view = memoryview(data)
+        sock = self.connect(f"sideload-host:{size}:{SIDELOAD_BLOCK}")
+        sock.settimeout(None)  # Recovery can go quiet for minutes while it verifies and installs
+        served = requests = 0
+        started = time.perf_counter()
+        try:
+            while True:
+                ask = recv_exact(sock, SIDELOAD_REQUEST)
+                if ask == SIDELOAD_DONE:
+                    break
+                if ask == SIDELOAD_FAIL:
+                    raise AdbError("Recovery rejected the package")
+                block = int(ask)
+                if block >= blocks:
+                    raise AdbError(f"Recovery asked for block {block}, package has {blocks}")
+                offset = block * SIDELOAD_BLOCK
+                with view[offset:offset + SIDELOAD_BLOCK] as chunk:
+                    sock.sendall(chunk)
+                    served += len(chunk)
+                requests += 1
+                if requests % 256 == 0:
+                    log(f"Sideload: {served * 100 // max(size, 1)}% ({served // (1024 * 1024)} MB served)")
+        finally:
+            sock.close()
+            view.release()
+            if isinstance(data, mmap.mmap):
+                data.close()
+        return _stats(served, time.perf_counter() - started, requests=requests)
+
+    def push(self, files, pipelined=True):
+        """Push [(local, remote)] over one sync connection
+
+        Pipelined, every file's SEND/DATA/DONE goes out back to back and the
+        per-file statuses are collected by a reader thread; otherwise each file
+        waits for its status like a plain adb push.
+        """
+        sock = self.connect("sync:")
+        statuses, errors = [], []
+        reader = None
+        if pipelined:
+            reader = threading.Thread(target=self._read_statuses, args=(sock, len(files), statuses, errors),
+                                      name="adb-sync-status", daemon=True)
+            reader.start()
+        buffer = bytearray()
+        sent = 0
+        started = time.perf_counter()
+        try:
+            for local, remote in files:
+                stat = os.stat(local)
+                target = f"{remote},{stat.st_mode & 0o777 or DEFAULT_MODE}".encode()
+                buffer += SYNC_HEADER.pack(b"SEND", len(target)) + target
+                data = map_file(local)
+                view = memoryview(data)
+                try:
+                    for offset in range(0, len(view), SYNC_DATA_MAX):
+                        with view[offset:offset + SYNC_DATA_MAX] as chunk:
+                            buffer += SYNC_HEADER.pack(b"DATA", len(chunk))
+                            buffer += chunk
+                        if len(buffer) >= SEND_BUFFER:
+                            sock.sendall(buffer)
+                            buffer.clear()
+                    sent += len(view)
+                finally:
+                    view.release()
+                    if isinstance(data, mmap.mmap):
+                        data.close()
+                buffer += SYNC_HEADER.pack(b"DONE", int(stat.st_mtime))
+                if not pipelined:
+                    sock.sendall(buffer)
+                    buffer.clear()
+                    self._read_statuses(sock, 1, statuses, errors)
+                    if errors:
+                        break
+            sock.sendall(buffer)
+            if reader is not None:
+                reader.join(self.timeout)
+            if not errors and len(statuses) != len(files):
+                errors.append(f"no status from the device within {self.timeout:.0f}s")
+            if not errors:
+                sock.sendall(SYNC_HEADER.pack(b"QUIT", 0))
+        except OSError as e:
+            if reader is not None:
+                reader.join(1.0)
+            if not errors:
+                errors.append(str(e))
+        finally:
+            sock.close()
+        if errors:
+            raise AdbError(f"Push failed after {len(statuses)} of {len(files)} files: {errors[0]}")
+        return _stats(sent, time.perf_counter() - started, files=len(files))
+
+    @staticmethod
+    def _read_statuses(sock, count, statuses, errors):
+        try:
+            for _ in range(count):
+                status, length = SYNC_HEADER.unpack(recv_exact(sock, SYNC_HEADER.size))
+                if status == b"OKAY":
+                    statuses.append(True)
+                    continue
+                message = recv_exact(sock, length).decode(errors="replace") if status == b"FAIL" else repr(status)
+                errors.append(message)
+                return
+        except (AdbError, OSError) as e:
+            errors.append(str(e))
+
+
+def _stats(transferred, seconds, **extra):
+    return {"bytes": transferred, "seconds": round(seconds, 3),
+            "mb_per_s": round(transferred / seconds / 1e6, 1) if seconds > 0 else 0.0, **extra}
+
+
+def push_tree(local, remote):
+    """(local, remote) pairs for a file or every file under a directory"""
+    local = Path(local)
+    if local.is_file():
+        return [(str(local), remote.rstrip("/") + "/" + local.name if remote.endswith("/") else remote)]
+    return [(str(path), f"{remote.rstrip('/')}/{local.name}/{path.relative_to(local).as_posix()}")
+            for path in sorted(local.rglob("*")) if path.is_file()]
+
+
+class FakeAdbd:
+    """adb server + device stand-in: smart-socket host requests, recovery sideload and sync
+
+    latency is the one-way USB delay added to everything the device sends back,
+    so a client that waits for each reply pays a round trip per request.
+    """
+
+    SERIAL = "FAKEADB0001"
+
+    def __init__(self, root, latency=0.0005, host="127.0.0.1", port=0):
+        self.root = Path(root)
+        self.latency = latency
+        self.server = socket.create_server((host, port))
+        self.port = self.server.getsockname()[1]
+        self.received = {}  # remote path or "sideload" -> sha256
+        self.in_sideload = threading.Event()  # Clear it to simulate recovery still booting
+        self.in_sideload.set()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._accept, name="fake-adbd", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.server.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _deliver(self, conn, outbox):
+        """Device -> host replies, each arriving latency after it was sent"""
+        while True:
+            item = outbox.get()
+            if item is None:
+                return
+            due, data = item
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                conn.sendall(data)
+            except OSError:
+                return
+
+    def _serve(self, conn):
+        outbox = queue.Queue()
+        sender = threading.Thread(target=self._deliver, args=(conn, outbox), daemon=True)
+        sender.start()
+        send = lambda data: outbox.put((time.monotonic() + self.latency, data))
+        try:
+            while True:
+                service = recv_exact(conn, int(recv_exact(conn, 4), 16)).decode()
+                if service == "host:version":
+                    conn.sendall(b"OKAY0004%04x" % 41)
+                    return
+                if service.endswith("features"):
+                    conn.sendall(b"OKAY0005shell")
+                    return
+                if ":wait-for-" in service:
+                    conn.sendall(b"OKAY")
+                    if service.endswith("-sideload"):
+                        self.in_sideload.wait()
+                    conn.sendall(b"OKAY")
+                    return
+                if service.startswith("host:tport:"):
+                    conn.sendall(b"OKAY" + struct.pack("<Q", 1))
+                elif service.startswith(("host:transport", "host:tport")):
+                    conn.sendall(b"OKAY")
+                elif service.startswith("sideload-host:"):
+                    conn.sendall(b"OKAY")
+                    _, size, block = service.split(":")[:3]
+                    self._sideload(conn, send, int(size), int(block))
+                    return
+                elif service == "sync:":
+                    conn.sendall(b"OKAY")
+                    self._sync(conn, send)
+                    return
+                else:
+                    message = f"unknown service {service}".encode()
+                    conn.sendall(b"FAIL%04x" % len(message) + message)
+                    return
+        except (AdbError, OSError, ValueError):
+            pass
+        finally:
+            outbox.put(None)
+            sender.join(5.0)
+            conn.close()
+
+    def _sideload(self, conn, send, size, block_size):
+        digest = hashlib.sha256()
+        for block in range((size + block_size - 1) // block_size):
+            send(b"%08d" % block)
+            digest.update(recv_exact(conn, min(block_size, size - block * block_size)))
+        self.received["sideload"] = digest.hexdigest()
+        send(SIDELOAD_DONE)
+
+    def _sync(self, conn, send):
+        while True:
+            command, length = SYNC_HEADER.unpack(recv_exact(conn, SYNC_HEADER.size))
+            if command == b"QUIT":
+                return
+            if command == b"STAT":
+                path = recv_exact(conn, length).decode()
+                mode = 0o40755 if path.endswith("/") or (self.root / path.lstrip("/")).is_dir() else 0
+                send(SYNC_STAT.pack(b"STAT", mode, 0, 0))
+                continue
+            if command != b"SEND":
+                raise AdbError(f"Unexpected sync command {command!r}")
+            remote = recv_exact(conn, length).decode().rsplit(",", 1)[0]
+            digest = hashlib.sha256()
+            while True:
+                command, length = SYNC_HEADER.unpack(recv_exact(conn, SYNC_HEADER.size))
+                if command == b"DONE":
+                    break
+                digest.update(recv_exact(conn, length))
+            self.received[remote] = digest.hexdigest()
+            send(SYNC_HEADER.pack(b"OKAY", 0))
+
+
+def stock_adb():
+    """Path of a real adb binary, or None"""
+    from command_runner import run_command
+
+    adb = shutil.which("adb")
+    if adb is None:
+        return None
+    result = run_command([adb, "version"], timeout=10)
+    return adb if "Android Debug Bridge" in result.stdout else None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def benchmark(package_mb=256, files=400, file_kb=64, latency=0.0005):
+    """Sideload and push against FakeAdbd, native client vs stock adb when installed"""
+    from command_runner import run_command
+
+    workdir = Path(tempfile.mkdtemp(prefix="adb_bench_"))
+    fake = FakeAdbd(workdir / "device", latency).start()
+    try:
+        package = workdir / "ota.zip"
+        with open(package, "wb") as f:
+            for _ in range(package_mb):
+                f.write(os.urandom(1024 * 1024))
+        tree = workdir / "media"
+        tree.mkdir()
+        for i in range(files):
+            (tree / f"file_{i:04d}.bin").write_bytes(os.urandom(file_kb * 1024))
+        pairs = push_tree(tree, "/sdcard/")
+        expected = file_sha256(package)
+        print(f"Fake adbd on port {fake.port}, {latency * 1000:.1f} ms one-way latency")
+
+        client = AdbClient(FakeAdbd.SERIAL, port=fake.port)
+        stats = client.sideload(str(package), log=lambda message: None)
+        ok = fake.received.get("sideload") == expected
+        print(f"{'sideload native (mmap)':<26} {stats['mb_per_s']:7.1f} MB/s {stats['seconds']:7.2f}s "
+              f"{'verified' if ok else 'MISMATCH'}")
+        for label, pipelined in (("push sequential", False), ("push pipelined", True)):
+            fake.received.clear()
+            stats = client.push(pairs, pipelined=pipelined)
+            ok = len(fake.received) == len(pairs)
+            print(f"{label:<26} {stats['mb_per_s']:7.1f} MB/s {stats['seconds']:7.2f}s "
+                  f"({files} x {file_kb} KB) {'verified' if ok else 'MISMATCH'}")
+
+        adb = stock_adb()
+        if adb is None:
+            print("Stock adb not installed - skipped the binary comparison")
+            return
+        for label, args in (("sideload stock adb", ["sideload", str(package)]),
+                            ("push stock adb", ["push", str(tree), "/sdcard/"])):
+            started = time.perf_counter()
+            result = run_command([adb, "-P", str(fake.port), "-s", FakeAdbd.SERIAL] + args, timeout=600)
+            seconds = time.perf_counter() - started
+            size = package_mb * 1024 * 1024 if "sideload" in label else files * file_kb * 1024
+            status = "ok" if result.returncode == 0 else f"exit {result.returncode}: {result.stderr.strip()[-80:]}"
+            print(f"{label:<26} {size / seconds / 1e6:7.1f} MB/s {seconds:7.2f}s {status}")
+    finally:
+        fake.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    args = sys.argv[1:]
+    serial = None
+    if "-s" in args:
+        index = args.index("-s")
+        serial = args[index + 1] if index + 1 < len(args) else None
+        del args[index:index + 2]
+    if len(args) >= 2 and args[0] == "sideload":
+        print(AdbClient(serial).sideload(args[1]))
+        return
+    if len(args) >= 3 and args[0] == "push":
+        pairs = [pair for local in args[1:-1] for pair in push_tree(local, args[-1])]
+        print(AdbClient(serial).push(pairs))
+        return
+    if args and args[0] == "bench":
+        benchmark(int(args[1]) if len(args) > 1 else 256)
+        return
+    print("Usage: python adb_transport.py [-s serial] sideload <ota.zip> | push <local>... <remote> | bench [package_mb]")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,19 +7,38 @@ Automated phone repair and recovery tool for Nokia G11 boot loop issues
 import os
 import sys
 import time
-import subprocess
-import winreg
 import requests
 import zipfile
 from pathlib import Path
 import json
 import threading
 from datetime import datetime
+from device_profiles import get_database
+from command_runner import powershell, run_command
+from driver_index import get_driver_index, host_arch
+from script_templates import get_generator, profile_context, script_slug
+from firmware_extract import extract_firmware
+from firmware_prefetch import get_prefetcher
+from sparse_image import prepare_for_flash
+from adb_transport import SIDELOAD_WAIT, AdbClient, AdbError
+import log_capture
+from fastboot_state import get_fastboot_state
+from results_store import get_store
+from plugin_registry import get_registry
+
+BUNDLED_FLASH_TOOL = "MTK_FlashTool_v3.0912.zip"
+
+DEFAULT_MODEL = "Nokia G11"
 
 class AndroidDoctor:
-    def __init__(self):
+    def __init__(self, model=DEFAULT_MODEL):
         self.device_detected = False
         self.device_type = None
+        self.adb_serial = None
+        self.boot_log_findings = []
+        self.profile = get_database().by_model(model)
+        if self.profile is None:
+            raise ValueError(f"No device profile for {model}")
         self.working_dir = Path(__file__).parent
         self.firmware_dir = self.working_dir / "firmware"
         self.tools_dir = self.working_dir / "tools"
@@ -44,14 +63,12 @@ class AndroidDoctor:
         """Check Windows Device Manager for connected devices"""
         try:
             # Use WMI to query USB devices
-            result = subprocess.run([
-                "powershell", "-Command",
-                "Get-WmiObject -Class Win32_PnPEntity | Where-Object {$_.Name -like '*MediaTek*' -or $_.Name -like '*Android*' -or $_.Name -like '*Nokia*' -or $_.Name -like '*MTK*'} | Select-Object Name, DeviceID"
-            ], capture_output=True, text=True, shell=True)
+            result = powershell("Get-WmiObject -Class Win32_PnPEntity | Where-Object {$_.Name -like '*MediaTek*' -or $_.Name -like '*Android*' -or $_.Name -like '*Nokia*' -or $_.Name -like '*MTK*'} | Select-Object Name, DeviceID")
             
             if result.stdout:
                 self.log("Device Manager scan results:")
                 self.log(result.stdout)
+                self.prefetch_detected(result.stdout)
                 
                 if "MediaTek" in result.stdout or "PreLoader" in result.stdout:
                     self.device_detected = True
@@ -67,6 +84,20 @@ class AndroidDoctor:
             self.log(f"Error checking device manager: {e}", "ERROR")
             return False
     
+    def prefetch_detected(self, scan_output):
+        """Switch to the plugged-in model's profile and start preparing its firmware"""
+        database = get_database()
+        for line in scan_output.splitlines():
+            profile, mode = database.resolve(line)
+            if profile is None:
+                continue
+            if profile["model"] != self.profile["model"]:
+                self.log(f"Detected {profile['model']} ({mode}) - switching from {self.profile['model']}")
+                self.profile = profile
+            get_prefetcher().prefetch(profile["model"], f"{mode} detected")
+            return profile
+        return None
+    
     def monitor_device_connection(self, duration=30):
         """Monitor for device connection over specified duration"""
         self.log(f"Monitoring for device connection for {duration} seconds...")
@@ -88,10 +119,21 @@ class AndroidDoctor:
     def download_sp_flash_tool(self):
         """Download SP Flash Tool if not present"""
         sp_flash_path = self.tools_dir / "SP_Flash_Tool"
-        if sp_flash_path.exists():
+        if sp_flash_path.exists() and any(p.name.lower() == "flash_tool.exe" for p in sp_flash_path.iterdir()):
             self.log("SP Flash Tool already present")
             return True
         
+        bundled = self.working_dir / BUNDLED_FLASH_TOOL
+        if bundled.exists():
+            self.log(f"Unpacking bundled {bundled.name}...")
+            results = extract_firmware(bundled, sp_flash_path, strip_components=1)
+            self.log(f"SP Flash Tool unpacked ({len(results)} files)")
+            return True
+        
+        if sp_flash_path.exists():
+            self.log("SP Flash Tool placeholder already present")
+            return True
+        
         self.log("Downloading SP Flash Tool...")
         # Note: In real implementation, you'd download from official source
         # This is a placeholder for the download logic
@@ -108,6 +150,13 @@ class AndroidDoctor:
     
     def download_mtk_drivers(self):
         """Download MediaTek USB drivers"""
+        # Point at the INFs in the bundled driver package that cover this model
+        index = get_driver_index()
+        for usb in self.profile["usb"]:
+            matches = index.lookup(usb["vid"], usb["pid"], arch=host_arch())
+            if matches:
+                self.log(f"{usb['mode']} driver ({usb['vid']}:{usb['pid']}): {matches[0]['inf']}")
+        
         driver_path = self.tools_dir / "MTK_Drivers"
         if driver_path.exists():
             self.log("MTK Drivers already present")
@@ -128,209 +177,238 @@ class AndroidDoctor:
         self.log("MTK Drivers setup created")
         return True
     
-    def download_nokia_g11_firmware(self):
-        """Download Nokia G11 stock firmware"""
-        firmware_path = self.firmware_dir / "Nokia_G11"
-        if firmware_path.exists():
-            self.log("Nokia G11 firmware already present")
+    def download_firmware(self):
+        """Download stock firmware for the selected device profile"""
+        model = self.profile["model"]
+        firmware = self.profile["firmware"]
+        firmware_path = self.firmware_dir / firmware["dir"]
+        if (firmware_path / "firmware_info.txt").exists():
+            self.log(f"{model} firmware already present")
             return True
         
-        self.log("Setting up Nokia G11 firmware download...")
+        self.log(f"Setting up {model} firmware download...")
         firmware_path.mkdir(exist_ok=True)
         
         # Create firmware info file
         firmware_info = firmware_path / "firmware_info.txt"
         with open(firmware_info, "w") as f:
-            f.write("Nokia G11 Stock Firmware Sources:\n")
-            f.write("1. https://www.getdroidtips.com/nokia-g11-stock-firmware/\n")
-            f.write("2. https://nokiafirmware.com/\n")
-            f.write("3. https://www.androidfilehost.com/\n\n")
-            f.write("Required files:\n")
-            f.write("- scatter.txt (partition layout)\n")
-            f.write("- boot.img\n")
-            f.write("- system.img\n")
-            f.write("- recovery.img\n")
-            f.write("- userdata.img\n")
+            f.write(f"{model} Stock Firmware Sources:\n")
+            for i, url in enumerate(firmware["sources"], 1):
+                f.write(f"{i}. {url}\n")
+            f.write("\nRequired files:\n")
+            for name, note in firmware["files"]:
+                f.write(f"- {name} ({note})\n" if note else f"- {name}\n")
         
         # Create scatter file template
-        scatter_template = firmware_path / "scatter_template.txt"
-        with open(scatter_template, "w") as f:
-            f.write("# Nokia G11 Scatter File Template\n")
-            f.write("# This file defines partition layout for flashing\n")
-            f.write("# Download actual scatter file with firmware\n")
+        if self.profile["chipset"] == "MediaTek":
+            scatter_template = firmware_path / "scatter_template.txt"
+            with open(scatter_template, "w") as f:
+                f.write(f"# {model} Scatter File Template\n")
+                f.write("# This file defines partition layout for flashing\n")
+                f.write("# Download actual scatter file with firmware\n")
         
-        self.log("Nokia G11 firmware setup created")
+        self.log(f"{model} firmware setup created")
         return True
     
+    def unpack_firmware(self):
+        """Unpack firmware zips in the profile's firmware folder, reusing a finished prefetch"""
+        get_prefetcher().claim(self.profile["model"], log=self.log)
+        return True
+    
+    def flash_script_name(self):
+        return f"flash_{script_slug(self.profile)}.bat"
+    
     def create_flash_script(self):
         """Create automated flashing script"""
-        script_path = self.working_dir / "flash_nokia_g11.bat"
-        
-        script_content = """@echo off
-echo ========================================
-echo Nokia G11 Recovery Flash Script
-echo ========================================
-echo.
-echo IMPORTANT: Make sure device is detected in Device Manager
-echo Look for "MediaTek PreLoader USB VCOM Port"
-echo.
-echo Steps:
-echo 1. Open SP Flash Tool
-echo 2. Load scatter file from firmware folder
-echo 3. Select "Download Only" mode
-echo 4. Click Download button
-echo 5. Connect phone while holding Volume Down
-echo.
-echo Press any key to open SP Flash Tool...
-pause > nul
-
-cd /d "%~dp0tools\\SP_Flash_Tool"
-if exist "flash_tool.exe" (
-    start flash_tool.exe
-) else (
-    echo SP Flash Tool not found!
-    echo Please download and extract SP Flash Tool to tools\\SP_Flash_Tool\\
-    echo Download from: https://spflashtool.com/
-)
-
-echo.
-echo Opening firmware folder...
-start "" "%~dp0firmware\\Nokia_G11"
-
-echo.
-echo Flash process ready. Follow the on-screen instructions.
-pause
-"""
-        
-        with open(script_path, "w") as f:
-            f.write(script_content)
-        
-        self.log("Flash script created")
+        script_path = self.working_dir / self.flash_script_name()
+        if get_generator().write("flash.bat.tmpl", script_path, **profile_context(self.profile)):
+            self.log("Flash script created")
+        else:
+            self.log("Flash script up to date")
         return True
     
+    def sparse_images(self):
+        """Convert large raw firmware images to cached sparse copies for the fastboot script"""
+        firmware = self.profile["firmware"]["dir"]
+        images = {}
+        for name in ("boot", "recovery", "system"):
+            raw = self.firmware_dir / firmware / f"{name}.img"
+            if raw.exists():
+                images[f"{name}_image"] = f"firmware\\{firmware}\\{prepare_for_flash(raw, self.log).name}"
+        return images
+    
     def create_fastboot_script(self):
         """Create fastboot recovery script"""
         script_path = self.working_dir / "fastboot_recovery.bat"
-        
-        script_content = """@echo off
-echo ========================================
-echo Nokia G11 Fastboot Recovery
-echo ========================================
-echo.
-echo This script attempts fastboot recovery
-echo Make sure ADB/Fastboot tools are installed
-echo.
-echo Checking for fastboot...
-fastboot --version >nul 2>&1
-if errorlevel 1 (
-    echo Fastboot not found! Please install ADB/Fastboot tools
-    echo Download from: https://developer.android.com/studio/releases/platform-tools
-    pause
-    exit /b 1
-)
-
-echo.
-echo Waiting for device in fastboot mode...
-echo Try: Hold Volume Down + Power, then connect USB
-echo.
-fastboot devices
-
-echo.
-echo Available fastboot commands:
-echo 1. fastboot reboot
-echo 2. fastboot reboot-bootloader  
-echo 3. fastboot flash recovery recovery.img
-echo 4. fastboot flash boot boot.img
-echo 5. fastboot erase userdata
-echo.
-echo Enter command number (1-5) or 'q' to quit:
-set /p choice=
-
-if "%choice%"=="1" fastboot reboot
-if "%choice%"=="2" fastboot reboot-bootloader
-if "%choice%"=="3" (
-    if exist "firmware\\Nokia_G11\\recovery.img" (
-        fastboot flash recovery "firmware\\Nokia_G11\\recovery.img"
-    ) else (
-        echo recovery.img not found in firmware folder
-    )
-)
-if "%choice%"=="4" (
-    if exist "firmware\\Nokia_G11\\boot.img" (
-        fastboot flash boot "firmware\\Nokia_G11\\boot.img"
-    ) else (
-        echo boot.img not found in firmware folder
-    )
-)
-if "%choice%"=="5" (
-    echo WARNING: This will erase all user data!
-    set /p confirm=Type YES to confirm: 
-    if "%confirm%"=="YES" fastboot erase userdata
-)
-
-pause
-"""
-        
-        with open(script_path, "w") as f:
-            f.write(script_content)
-        
-        self.log("Fastboot script created")
+        context = profile_context(self.profile)
+        context.update(self.sparse_images())
+        if get_generator().write("fastboot_recovery.bat.tmpl", script_path, **context):
+            self.log("Fastboot script created")
+        else:
+            self.log("Fastboot script up to date")
         return True
     
     def run_diagnosis(self):
         """Run complete device diagnosis"""
-        self.log("=== Android Doctor - Nokia G11 Recovery ===")
+        self.log(f"=== Android Doctor - {self.profile['model']} Recovery ===")
         self.log("Starting comprehensive diagnosis...")
         
         # Check current device status
         self.log("Step 1: Checking device connection...")
-        if self.check_device_manager():
+        found = self.check_device_manager()
+        if found:
             self.log(f"Device detected in {self.device_type} mode!")
-            return True
         else:
-            self.log("No device detected. Starting monitoring...")
-            return self.monitor_device_connection(30)
+            self.log("Step 2: Checking for a boot-looping device on adb...")
+            found = self.capture_boot_logs(30)
+            if found:
+                self.log(f"Device detected on adb ({self.adb_serial})")
+            else:
+                self.log("No device detected. Starting monitoring...")
+                found = self.monitor_device_connection(30)
+        
+        self.record_diagnosis(found)
+        return found
+    
+    def record_diagnosis(self, found):
+        """Append this diagnosis to the results store"""
+        serial = None
+        if self.device_type == "fastboot":
+            serials = get_fastboot_state().devices()
+            serial = serials[0] if len(serials) == 1 else None
+        probes = {
+            "detected": found,
+            "device_type": self.device_type,
+            "boot_loop_signatures": ",".join(f["signature"] for f in self.boot_log_findings),
+        }
+        get_store().record_run("run_diagnosis", probes, serial=serial or self.adb_serial,
+                               model=self.profile["model"],
+                               verdict=self.device_type if found else "not detected")
+    
+    def capture_boot_logs(self, seconds=60, serial=None):
+        """Capture logcat/dmesg/last_kmsg while the device is up and report boot-loop signatures
+
+        Returns whether a device was on adb; the signatures found go to self.boot_log_findings.
+        """
+        try:
+            serials = [serial] if serial else log_capture.adb_devices()
+        except FileNotFoundError:
+            self.log("adb not found - skipping log capture")
+            return False
+        if not serials:
+            self.log("No device on adb")
+            return False
+        
+        self.adb_serial = serials[0]
+        self.device_detected = True
+        self.device_type = "adb"
+        capture = log_capture.LogCapture(serials[0], out_dir=self.logs_dir / f"capture_{serials[0]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        self.boot_log_findings = capture.capture(seconds)
+        log_capture.report(self.boot_log_findings, self.log)
+        return True
     
-    def setup_recovery_environment(self):
+    def sideload_package(self, package, serial=None):
+        """Send an OTA zip to a device waiting in recovery's "Apply update from ADB" """
+        if not Path(package).exists():
+            self.log(f"{package} not found", "ERROR")
+            return False
+        client = AdbClient(serial)
+        self.log("Waiting for sideload mode - choose 'Apply update from ADB' on the device")
+        try:
+            try:
+                client.wait_for("sideload", SIDELOAD_WAIT)
+            except ConnectionRefusedError:
+                run_command(["adb", "start-server"], timeout=30)  # Server not running yet
+                client.wait_for("sideload", SIDELOAD_WAIT)
+            self.log(f"Sideloading {Path(package).name}")
+            stats = client.sideload(package, self.log)
+        except (AdbError, OSError) as e:
+            self.log(f"Sideload failed: {e}", "ERROR")
+            return False
+        self.log(f"Sideload complete: {stats['bytes']} bytes in {stats['seconds']}s ({stats['mb_per_s']} MB/s)")
+        return True
+    
+    def detect_model(self):
+        """Model of the attached device: ro.product.model over adb, else the USB ID"""
+        try:
+            result = run_command(["adb", "shell", "getprop", "ro.product.model"], timeout=10)
+            model = result.stdout.strip()
+            if result.ok and model:
+                return model
+        except OSError:
+            pass
+        if self.check_device_manager():
+            return self.profile["model"]
+        return None
+    
+    def dispatch(self, capability, model=None, argv=()):
+        """Run the plugin that provides a capability for the attached (or named) model"""
+        model = model or self.detect_model()
+        if not model:
+            self.log("No device detected - name the model with --model", "ERROR")
+            return None
+        
+        registry = get_registry()
+        plugin = registry.find(model, capability)
+        if plugin is None:
+            offered = registry.capabilities(model)
+            self.log(f"No '{capability}' plugin for {model}" +
+                     (f" (available: {', '.join(offered)})" if offered else ""), "ERROR")
+            return None
+        self.log(f"{model}: running {plugin.module} {capability}")
+        return plugin.call(capability, argv)
+    
+    def setup_recovery_environment(self, firmware=True):
         """Set up complete recovery environment"""
         self.log("Setting up recovery environment...")
         
         # Download required tools
         self.download_sp_flash_tool()
         self.download_mtk_drivers()
-        self.download_nokia_g11_firmware()
+        if firmware:
+            self.prepare_model()
         
-        # Create scripts
+        self.log("Recovery environment setup complete!")
+    
+    def prepare_model(self):
+        """Firmware and scripts for the current profile"""
+        self.download_firmware()
+        self.unpack_firmware()
         self.create_flash_script()
         self.create_fastboot_script()
-        
-        self.log("Recovery environment setup complete!")
     
     def run_recovery(self):
         """Main recovery process"""
-        self.log("=== Nokia G11 Recovery Process ===")
+        self.log(f"=== {self.profile['model']} Recovery Process ===")
         
-        # Setup environment
-        self.setup_recovery_environment()
+        # Tools first; firmware follows the model that is actually plugged in,
+        # and detection has already started prefetching it
+        self.setup_recovery_environment(firmware=False)
         
         # Run diagnosis
         device_found = self.run_diagnosis()
+        self.prepare_model()
         
         if device_found:
             self.log("Device detected! Ready for recovery.")
             if self.device_type == "preloader":
                 self.log("Device in PreLoader mode - use SP Flash Tool")
-                self.log("Run: flash_nokia_g11.bat")
+                self.log(f"Run: {self.flash_script_name()}")
             elif self.device_type == "fastboot":
                 self.log("Device in Fastboot mode - use fastboot commands")
                 self.log("Run: fastboot_recovery.bat")
+            elif self.device_type == "adb":
+                self.log("Device booting on adb - switch it to fastboot before flashing")
+                self.log(f"Fastboot: {self.profile['boot_modes'].get('fastboot', 'adb reboot bootloader')}")
         else:
             self.log("Device not detected. Try these steps:")
             self.log("1. Let battery drain completely")
-            self.log("2. Hold Volume Down + connect USB")
-            self.log("3. Hold Volume Up + connect USB")
-            self.log("4. Try different USB cable/port")
-            self.log("5. Install MTK drivers from tools/MTK_Drivers/")
+            step = 2
+            for combo in self.profile["key_combos"][:2]:
+                self.log(f"{step}. {combo}")
+                step += 1
+            self.log(f"{step}. Try different USB cable/port")
+            self.log(f"{step + 1}. Install MTK drivers from tools/MTK_Drivers/")
         
         return device_found
 
@@ -345,8 +423,34 @@ def main():
             doctor.setup_recovery_environment()
         elif command == "diagnose":
             doctor.run_diagnosis()
+        elif command == "logs":
+            doctor.capture_boot_logs(float(sys.argv[3]) if len(sys.argv) > 3 else 60,
+                                     sys.argv[2] if len(sys.argv) > 2 else None)
+        elif command == "backup":
+            import partition_backup
+            partition_backup.main_backup(sys.argv[2:])
+        elif command == "batch":
+            import batch_runner
+            sys.exit(batch_runner.main(sys.argv[2:]))
+        elif command == "cluster":
+            import bench_cluster
+            sys.exit(bench_cluster.main(sys.argv[2:]))
+        elif command in ("analyze", "run"):
+            args = sys.argv[2:]
+            capability = "analyze" if command == "analyze" else (args.pop(0) if args else "analyze")
+            model = None
+            if "--model" in args:
+                index = args.index("--model")
+                model = args[index + 1] if index + 1 < len(args) else None
+                del args[index:index + 2]
+            doctor.dispatch(capability, model, args)
+        elif command == "sideload" and len(sys.argv) > 2:
+            sys.exit(0 if doctor.sideload_package(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None) else 1)
+        elif command == "plugins":
+            for plugin in get_registry().plugins:
+                print(f"{plugin.module:<22} {', '.join(plugin.models):<20} {', '.join(sorted(plugin.capabilities))}")
         else:
-            print("Usage: python android_doctor.py [monitor|setup|diagnose]")
+            print("Usage: python android_doctor.py [monitor|setup|diagnose|logs [serial] [seconds]|backup [serial] [partition ...]|batch <manifest.json>|cluster agent|coordinator ...|analyze|run <capability> [--model M]|plugins|sideload <ota.zip> [serial]]")
     else:
         # Run full recovery process
         doctor.run_recovery()
@@ -4,7 +4,8 @@ Auto Fix - No button pressing required
 Automatically attempts all recovery methods
 """
 
-import subprocess
+from command_runner import run_command
+from fastboot_state import get_fastboot_state
 import time
 
 def auto_fix():
@@ -14,31 +15,34 @@ def auto_fix():
     # Method 1: ADB network reset
     try:
         print("Trying ADB network reset...")
-        subprocess.run(["adb", "shell", "svc", "wifi", "disable"], timeout=5)
+        run_command(["adb", "shell", "svc", "wifi", "disable"], timeout=5)
         time.sleep(2)
-        subprocess.run(["adb", "shell", "svc", "wifi", "enable"], timeout=5)
-        subprocess.run(["adb", "shell", "svc", "data", "disable"], timeout=5)
+        run_command(["adb", "shell", "svc", "wifi", "enable"], timeout=5)
+        run_command(["adb", "shell", "svc", "data", "disable"], timeout=5)
         time.sleep(2)
-        subprocess.run(["adb", "shell", "svc", "data", "enable"], timeout=5)
+        run_command(["adb", "shell", "svc", "data", "enable"], timeout=5)
         print("Network reset completed")
     except:
         print("ADB method failed")
     
     # Method 2: Check if any device responds
     try:
-        result = subprocess.run(["adb", "devices"], capture_output=True, text=True, timeout=5)
+        result = run_command(["adb", "devices"], timeout=5)
         if "device" in result.stdout:
             print("Device found via ADB - attempting reboot")
-            subprocess.run(["adb", "reboot"], timeout=10)
+            run_command(["adb", "reboot"], timeout=10)
     except:
         pass
     
     # Method 3: Check fastboot
     try:
-        result = subprocess.run(["fastboot", "devices"], capture_output=True, text=True, timeout=5)
-        if result.stdout.strip():
+        fastboot = get_fastboot_state()
+        for serial in fastboot.devices():
+            snapshot = fastboot.snapshot(serial)
+            if snapshot:
+                print(f"Bootloader: unlocked={snapshot.unlocked} slot={snapshot.current_slot}")
             print("Device in fastboot - attempting reboot")
-            subprocess.run(["fastboot", "reboot"], timeout=10)
+            fastboot.reboot(serial)
     except:
         pass
     
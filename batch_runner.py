@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Batch Runner - Fleet mode for Android Doctor
+Runs a job manifest (diagnose, network-reset, flash, verify) across many devices
+"""
+
+import sys
+import json
+import time
+import random
+import threading
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from command_runner import run_command
+from fastboot_state import get_fastboot_state
+from results_store import get_store
+from sparse_image import prepare_for_flash
+from usb_topology import Topology, TransferScheduler, THROUGHPUT_PATH
+
+ACTIONS = ("diagnose", "network-reset", "flash", "verify")
+
+DEFAULT_CONCURRENCY = 4
+
+# getprop names used by diagnose -> probe names used by the analyzer and results store
+PROBE_KEYS = {"ro.product.model": "model", "ro.baseband": "baseband",
+              "gsm.sim.state": "sim_state", "gsm.network.type": "network_type"}
+
+
+def load_manifest(path):
+    """Load a job manifest and expand it into a list of jobs
+
+    Manifest layout (JSON):
+        {
+          "concurrency": 8,
+          "results": "logs/batch_results.jsonl",
+          "topology": "usb_topology.json",
+          "defaults": {"model": "Nokia G50", "action": "diagnose"},
+          "devices": [
+            {"serial": "G50A1B2C3", "action": "network-reset"},
+            {"port": "COM7", "model": "Nokia G11", "action": "flash",
+             "images": {"boot": "firmware/Nokia_G11/boot.img"}}
+          ]
+        }
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    defaults = manifest.get("defaults", {})
+    jobs = []
+    for index, entry in enumerate(manifest.get("devices", [])):
+        job = dict(defaults)
+        job.update(entry)
+        job.setdefault("action", "diagnose")
+        if not job.get("serial") and not job.get("port"):
+            raise ValueError(f"Manifest entry {index} has no serial or port")
+        if job["action"] not in ACTIONS:
+            raise ValueError(f"Manifest entry {index} has unknown action: {job['action']}")
+        job["id"] = job.get("id") or f"{index:04d}-{job.get('serial') or job.get('port')}"
+        jobs.append(job)
+
+    return manifest, jobs
+
+
+class AdbDeviceLayer:
+    """Device layer that talks to real phones through adb/fastboot"""
+
+    def __init__(self, timeout=30, topology=None):
+        self.timeout = timeout
+        self.topology = topology or Topology.detect()
+
+    def usb(self, job):
+        """Bus/port path and link speed of the job's device, when the topology knows it"""
+        device = self.topology.device(job.get("serial"))
+        return device.to_dict() if device else None
+
+    def _adb(self, job, *args):
+        result = run_command(["adb", "-s", job["serial"]] + list(args), timeout=self.timeout)
+        return result.stdout.strip()
+
+    def _fastboot(self, job, *args):
+        result = get_fastboot_state().command(job["serial"], *args, timeout=self.timeout)
+        return result.returncode, (result.stdout + result.stderr).strip()
+
+    def diagnose(self, job):
+        if not job.get("serial"):
+            return {"status": "skipped", "message": "diagnose needs an adb serial"}
+
+        props = {}
+        for key in ("ro.product.model", "ro.baseband", "gsm.sim.state", "gsm.network.type"):
+            props[key] = self._adb(job, "shell", "getprop", key)
+
+        findings = []
+        if "ABSENT" in props["gsm.sim.state"]:
+            findings.append("SIM card not detected")
+        if not props["ro.baseband"] or props["ro.baseband"] == "unknown":
+            findings.append("Baseband not detected")
+
+        result = {"status": "fail" if findings else "ok", "props": props, "findings": findings}
+        if self.usb(job):
+            result["usb"] = self.usb(job)
+        return result
+
+    def network_reset(self, job):
+        if not job.get("serial"):
+            return {"status": "skipped", "message": "network-reset needs an adb serial"}
+
+        for value in ("1", "0"):
+            self._adb(job, "shell", "settings", "put", "global", "airplane_mode_on", value)
+            self._adb(job, "shell", "am", "broadcast", "-a", "android.intent.action.AIRPLANE_MODE",
+                      "--ez", "state", "true" if value == "1" else "false")
+            time.sleep(2)
+        self._adb(job, "shell", "setprop", "ctl.restart", "ril-daemon")
+        return {"status": "ok"}
+
+    def prepare(self, job):
+        """Convert a flash job's images to sparse before it takes a hub slot
+
+        Runs ahead of admission so the scheduler only times the USB transfer;
+        anything that fails here is converted (and reported) again by flash.
+        """
+        for image in (job.get("images") or {}).values():
+            try:
+                prepare_for_flash(image)
+            except (OSError, ValueError):
+                pass
+
+    def flash(self, job):
+        images = job.get("images") or {}
+        if not job.get("serial"):
+            # PreLoader devices only expose a COM port, SP Flash Tool has to take over
+            return {"status": "skipped", "message": f"{job.get('port')} needs SP Flash Tool"}
+        if not images:
+            return {"status": "skipped", "message": "no images listed for flash"}
+
+        snapshot = get_fastboot_state().snapshot(job["serial"])
+        if snapshot and snapshot.unlocked is False:
+            return {"status": "fail", "message": "bootloader is locked"}
+
+        flashed = []
+        sent = 0
+        for partition, image in images.items():
+            if not Path(image).exists():
+                return {"status": "fail", "message": f"{image} not found", "flashed": flashed}
+            size = snapshot.partition_size(partition) if snapshot else None
+            if size is not None and Path(image).stat().st_size > size:
+                return {"status": "fail", "message": f"{image} is larger than {partition} ({size} bytes)",
+                        "flashed": flashed}
+            payload = prepare_for_flash(image)
+            code, output = self._fastboot(job, "flash", partition, str(payload))
+            if code != 0:
+                return {"status": "fail", "message": output, "flashed": flashed}
+            flashed.append(partition)
+            sent += payload.stat().st_size
+        return {"status": "ok", "flashed": flashed, "bytes": sent, "usb": self.usb(job)}
+
+    def verify(self, job):
+        if not job.get("serial"):
+            return {"status": "skipped", "message": "verify needs an adb serial"}
+
+        state = self._adb(job, "get-state")
+        if state != "device":
+            return {"status": "fail", "message": f"device state is '{state or 'missing'}'"}
+
+        mismatches = {}
+        for key, expected in (job.get("expect") or {}).items():
+            actual = self._adb(job, "shell", "getprop", key)
+            if actual != expected:
+                mismatches[key] = actual
+        return {"status": "fail" if mismatches else "ok", "mismatches": mismatches}
+
+
+class SimulatedDeviceLayer:
+    """Stand-in device layer so large manifests can run without phones attached"""
+
+    def __init__(self, latency=0.01, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def _act(self, job, action, extra=None):
+        with self.lock:
+            self.calls.append((job["id"], action))
+            failed = self.random.random() < self.failure_rate
+        time.sleep(self.latency)
+
+        result = {"status": "fail" if failed else "ok", "simulated": True}
+        if extra:
+            result.update(extra)
+        return result
+
+    def diagnose(self, job):
+        sim_state = job.get("sim_state", "READY")
+        return self._act(job, "diagnose", {
+            "props": {"ro.product.model": job.get("model", "Simulated"), "gsm.sim.state": sim_state},
+            "findings": ["SIM card not detected"] if "ABSENT" in sim_state else [],
+        })
+
+    def network_reset(self, job):
+        return self._act(job, "network-reset")
+
+    def flash(self, job):
+        return self._act(job, "flash", {"flashed": sorted((job.get("images") or {}).keys())})
+
+    def verify(self, job):
+        return self._act(job, "verify")
+
+
+class BatchRunner:
+    """Executes jobs across the fleet with a concurrency limit and streams results"""
+
+    def __init__(self, device_layer, concurrency=DEFAULT_CONCURRENCY, results_path=None, progress=None,
+                 store=None, scheduler=None):
+        self.device_layer = device_layer
+        self.store = store
+        self.scheduler = scheduler
+        self.concurrency = max(1, int(concurrency))
+        self.results_path = Path(results_path) if results_path else None
+        self.progress = progress or self.log
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.completed = 0
+
+    def log(self, message):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[{timestamp}] [BATCH] {message}", flush=True)
+
+    def run_job(self, job):
+        """Run a single job and return its result record"""
+        handler = getattr(self.device_layer, job["action"].replace("-", "_"))
+        started = time.time()
+        try:
+            result = handler(job)
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+        if self.scheduler is not None:
+            self.scheduler.release(job, result.get("bytes"))
+
+        record = {
+            "id": job["id"],
+            "serial": job.get("serial"),
+            "port": job.get("port"),
+            "model": job.get("model"),
+            "action": job["action"],
+            "started": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+            "duration": round(time.time() - started, 3),
+        }
+        record.update(result)
+        return record
+
+    def _finish(self, record, results_file, total):
+        with self.lock:
+            self.completed += 1
+            self.counts[record["status"]] = self.counts.get(record["status"], 0) + 1
+            if results_file:
+                results_file.write(json.dumps(record) + "\n")
+                results_file.flush()
+            if self.store is not None and record["action"] == "diagnose" and "props" in record:
+                probes = {PROBE_KEYS.get(key, key): value for key, value in record["props"].items()}
+                self.store.record_run("batch", probes, serial=record["serial"],
+                                      model=record["model"] or probes.get("model"),
+                                      verdict="; ".join(record.get("findings", [])) or record["status"])
+            self.progress(f"[{self.completed}/{total}] {record['id']} {record['action']}: "
+                          f"{record['status']} ({record['duration']}s)")
+
+    def _dispatch(self, pool, jobs, results_file, total):
+        """Submit jobs as the USB scheduler admits them; a heavy job waiting on a busy hub
+        holds no worker, so later light jobs still start. Heavy jobs are prepared (images
+        converted) before admission, so a hub slot is held only while data moves"""
+        free = threading.Semaphore(self.concurrency)
+        prepare = getattr(self.device_layer, "prepare", None)
+
+        def done(future):
+            free.release()
+            self._finish(future.result(), results_file, total)
+
+        pending, preparing = [], []
+
+        def prepared(job):
+            try:
+                prepare(job)
+            finally:
+                self.scheduler.enqueue(pending, job)
+                preparing.remove(job)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as converter:
+            for job in jobs:
+                if prepare is not None and self.scheduler.is_heavy(job):
+                    preparing.append(job)
+                    converter.submit(prepared, job)
+                else:
+                    pending.append(job)
+            while pending or preparing:
+                free.acquire()
+                job = self.scheduler.next_ready(pending)
+                pending.remove(job)
+                pool.submit(self.run_job, job).add_done_callback(done)
+
+    def run(self, jobs):
+        """Run every job, writing each result as soon as it completes"""
+        total = len(jobs)
+        self.counts = {}
+        self.completed = 0
+        self.progress(f"Running {total} jobs with concurrency {self.concurrency}")
+
+        results_file = None
+        if self.results_path:
+            self.results_path.parent.mkdir(parents=True, exist_ok=True)
+            results_file = open(self.results_path, "w", encoding="utf-8")
+
+        started = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                if self.scheduler is not None:
+                    self._dispatch(pool, jobs, results_file, total)
+                else:
+                    for job in jobs:
+                        future = pool.submit(self.run_job, job)
+                        future.add_done_callback(
+                            lambda f: self._finish(f.result(), results_file, total))
+        finally:
+            if results_file:
+                results_file.close()
+
+        if self.store is not None:
+            self.store.flush()
+        summary = {"total": total, "elapsed": round(time.time() - started, 3), "statuses": dict(self.counts)}
+        self.progress(f"Batch complete: {summary['statuses']} in {summary['elapsed']}s")
+        return summary
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run an Android Doctor job manifest across a fleet")
+    parser.add_argument("manifest", help="JSON job manifest")
+    parser.add_argument("--results", help="JSON Lines results file (overrides the manifest)")
+    parser.add_argument("--concurrency", type=int, help="Maximum jobs in flight (overrides the manifest)")
+    parser.add_argument("--simulate", action="store_true", help="Use the simulated device layer")
+    parser.add_argument("--topology", help="USB topology JSON (default: read from the host)")
+    args = parser.parse_args(argv)
+
+    manifest, jobs = load_manifest(args.manifest)
+    results = args.results or manifest.get("results") or \
+        f"logs/batch_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+    concurrency = args.concurrency or manifest.get("concurrency", DEFAULT_CONCURRENCY)
+    topology_path = args.topology or manifest.get("topology")
+    topology = Topology.from_file(topology_path) if topology_path else None
+    layer = SimulatedDeviceLayer() if args.simulate else AdbDeviceLayer(topology=topology)
+
+    store = None if args.simulate else get_store()
+    runner = BatchRunner(layer, concurrency=concurrency, results_path=results, store=store)
+    if topology or not args.simulate:
+        # Flash jobs share hub bandwidth: admit them per hub, diagnostics run freely
+        runner.scheduler = TransferScheduler(topology or layer.topology, log=runner.log, state_path=THROUGHPUT_PATH)
+    summary = runner.run(jobs)
+    if runner.scheduler is not None:
+        runner.scheduler.save()
+    runner.log(f"Results written to {results}")
+    return 0 if summary["statuses"].keys() <= {"ok", "skipped"} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Battery Drain Watch - Unattended watch mode for boot-looping devices
+Tracks USB appear/disappear cycles for hours, notices when the loop stops
+(battery dead), then polls at burst rate to catch the PreLoader window on recharge
+"""
+
+import sys
+import time
+import struct
+import threading
+from array import array
+from pathlib import Path
+from datetime import datetime
+from command_runner import powershell
+from poll_scheduler import AdaptivePoller, monotonic
+
+HISTORY = 256               # Cycle periods kept in memory (ring buffer)
+STOP_FACTOR = 4             # Loop considered stopped after this many missed periods
+MIN_QUIET = 120             # ...and never sooner than this many seconds
+FIRST_QUIET = STOP_FACTOR * MIN_QUIET  # Before a full period has been measured
+REST_PERIOD = 2 * 60 * 60   # Leave the dead device alone this long before recharging
+CATCH_WINDOW = 180          # Burst-poll this long after the charger goes back in
+
+# 16 bytes per cycle: appeared (epoch), visible seconds, appear-to-appear period seconds
+# (period 0 marks the last appearance before the loop stopped)
+CYCLE_RECORD = struct.Struct("<dff")
+
+LOOPING, DRAINED, CATCHING, CAUGHT = "looping", "drained", "catching", "caught"
+
+
+def probe_device():
+    """Default probe: is a MediaTek/Android/Nokia device visible right now?"""
+    try:
+        result = powershell("Get-WmiObject -Class Win32_PnPEntity | Where-Object {$_.Name -like '*MediaTek*' -or $_.Name -like '*Android*' -or $_.Name -like '*Nokia*' -or $_.Name -like '*PreLoader*'} | Select-Object Name", timeout=20)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+class CycleStats:
+    """Constant-memory cycle statistics: a float ring buffer plus running totals"""
+
+    def __init__(self, size=HISTORY):
+        self.periods = array("f", [0.0] * size)
+        self.size = size
+        self.count = 0
+        self.mean = 0.0
+        self.shortest = None
+        self.longest = None
+
+    def add(self, period):
+        self.periods[self.count % self.size] = period
+        self.count += 1
+        self.mean += (period - self.mean) / self.count
+        self.shortest = period if self.shortest is None else min(self.shortest, period)
+        self.longest = period if self.longest is None else max(self.longest, period)
+
+    def recent_median(self):
+        n = min(self.count, self.size)
+        if n == 0:
+            return None
+        values = sorted(self.periods[:n])
+        return values[n // 2]
+
+
+class BatteryDrainWatch:
+    """Watches a boot-looping device until the battery dies, then catches it on recharge"""
+
+    def __init__(self, probe=probe_device, log_path=None, rest_period=REST_PERIOD,
+                 catch_window=CATCH_WINDOW, on_caught=None, clock=monotonic, sleep=None):
+        self.probe = probe
+        self.rest_period = rest_period
+        self.catch_window = catch_window
+        self.on_caught = on_caught
+        self.clock = clock
+        self.poller = AdaptivePoller(normal=1.0, idle_max=2.0, clock=clock, sleep=sleep)
+        self.stats = CycleStats()
+        self.log_file = None
+        if log_path:
+            Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+            self.log_file = open(log_path, "ab")
+
+        self.state = LOOPING
+        self.present = False
+        self.appeared_at = None
+        self.appeared_epoch = None
+        self.visible = 0.0
+        self.last_appearance = None
+        self.drained_at = None
+        self.catch_expired = False
+        self.charger_event = threading.Event()
+        self.stopped = False
+
+    def log(self, message):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[{timestamp}] [DRAIN] {message}", flush=True)
+
+    def charger_connected(self):
+        """Signal (from any thread) that the charger/USB cable was plugged back in"""
+        self.charger_event.set()
+        self.catch_expired = False
+        self.poller.expect(self.catch_window)
+
+    def quiet_limit(self):
+        median = self.stats.recent_median()
+        if median is None:
+            return FIRST_QUIET
+        return max(MIN_QUIET, STOP_FACTOR * median)
+
+    def _record_cycle(self, period):
+        """Log the previous appearance once its period (or the end of the loop) is known"""
+        if period:
+            self.stats.add(period)
+        if self.log_file and self.appeared_epoch is not None:
+            self.log_file.write(CYCLE_RECORD.pack(self.appeared_epoch, self.visible, period))
+            self.log_file.flush()
+
+    def step(self):
+        """One poll: update state from the probe, return the current state"""
+        self.poller.begin_poll()
+        seen = self.probe()
+        now = self.clock()
+        activity = bool(seen) != self.present
+
+        if seen and not self.present:
+            self.appeared_at = now
+            if self.state == CATCHING:
+                self.state = CAUGHT
+                self.log("Device appeared after recharge - act NOW!")
+                self.log(str(seen))
+                if self.on_caught:
+                    self.on_caught(seen)
+            elif self.state == DRAINED:
+                self.state = CAUGHT
+                self.log("Device reappeared while resting - act NOW!")
+                self.log(str(seen))
+                if self.on_caught:
+                    self.on_caught(seen)
+            else:
+                if self.last_appearance is not None:
+                    self.log(f"Cycle #{self.stats.count + 1}: reappeared after {now - self.last_appearance:.0f}s")
+                    self._record_cycle(now - self.last_appearance)
+                self.last_appearance = now
+                self.appeared_epoch = time.time()
+        elif not seen and self.present:
+            if self.state == LOOPING:
+                self.visible = now - self.appeared_at
+        self.present = bool(seen)
+
+        if self.state == LOOPING and not self.present and self.last_appearance is not None:
+            if now - self.last_appearance > self.quiet_limit():
+                self.state = DRAINED
+                self.drained_at = now
+                self._record_cycle(0.0)
+                self.log(f"Boot loop stopped after {self.stats.count} cycles "
+                         f"(mean period {self.stats.mean:.0f}s) - battery likely dead")
+                self.log(f"Leave it for {self.rest_period / 3600:.1f}h, then reconnect the charger")
+                # Nothing to catch while resting: poll slowly
+                self.poller.idle_max = 30.0
+
+        if self.state == DRAINED and (self.charger_event.is_set() or now - self.drained_at >= self.rest_period):
+            if not self.charger_event.is_set():
+                self.log("Rest period over - connect the charger now (Volume Down held)")
+            self.state = CATCHING
+            self.poller.idle_max = 2.0
+            self.poller.expect(self.catch_window)
+
+        if self.state == CATCHING and not self.catch_expired and not self.poller.in_burst():
+            # Back to normal polling; Enter (charger_connected) opens a new window
+            self.catch_expired = True
+            self.log("Nothing seen in the catch window - still watching")
+
+        self.poller.record(activity)
+        return self.state
+
+    def run(self):
+        """Watch until the device is caught or stop() is called"""
+        self.log("Battery drain watch started - leave the device boot looping")
+        self.log("Press Enter at any time once the charger is reconnected")
+        try:
+            while not self.stopped:
+                if self.step() == CAUGHT:
+                    return True
+                if self.poller.status_due():
+                    self.log(f"State: {self.state}, cycles: {self.stats.count}, "
+                             f"quiet limit: {self.quiet_limit():.0f}s")
+                self.poller.wait()
+        except KeyboardInterrupt:
+            self.log("Watch stopped by user")
+        finally:
+            if self.log_file:
+                self.log_file.close()
+        return False
+
+    def stop(self):
+        self.stopped = True
+        self.poller.wakeup.set()
+
+
+def read_cycle_log(path):
+    """Yield (appeared_epoch, visible_seconds, period_seconds) from a cycle log"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CYCLE_RECORD.size)
+            if len(chunk) < CYCLE_RECORD.size:
+                return
+            yield CYCLE_RECORD.unpack(chunk)
+
+
+def watch_interactive(log_path, on_caught=None):
+    """Run a watch on the console; Enter signals the charger reconnect"""
+    watch = BatteryDrainWatch(log_path=log_path, on_caught=on_caught)
+
+    def wait_for_enter():
+        try:
+            sys.stdin.readline()
+        except (OSError, ValueError):
+            return
+        watch.log("Charger reconnect signalled - burst polling")
+        watch.charger_connected()
+
+    threading.Thread(target=wait_for_enter, daemon=True).start()
+    return watch.run()
+
+
+def main():
+    log_path = sys.argv[1] if len(sys.argv) > 1 else "logs/battery_drain_cycles.bin"
+    watch_interactive(log_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Bench Cluster - Spreads a job manifest across several workstations
+Each PC runs an agent that owns its local USB devices; the coordinator routes every
+job to the agent holding that device, within each agent's capacity, over HTTP/JSON
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import socket
+import secrets
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from batch_runner import AdbDeviceLayer, BatchRunner, SimulatedDeviceLayer, load_manifest
+
+DEFAULT_PORT = 8750
+HEARTBEAT_INTERVAL = 2.0
+AGENT_EXPIRY = 3 * HEARTBEAT_INTERVAL   # Missed heartbeats before an agent's devices are dropped
+ROUTE_TIMEOUT = 60.0                    # How long a job waits for its device to show up on an agent
+MAX_ATTEMPTS = 3
+JOB_TIMEOUT = 30 * 60                   # Longest a forwarded job (a full flash) may take on an agent
+TOKEN_HEADER = "X-Bench-Token"          # Shared secret every coordinator/agent request must carry
+TOKEN_ENV = "ANDROID_DOCTOR_BENCH_TOKEN"
+
+
+def _headers(token):
+    return {TOKEN_HEADER: token} if token else {}
+
+
+def post_json(url, payload, timeout=None, token=None):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={"Content-Type": "application/json", **_headers(token)})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def never_delivered(error):
+    """True when a request failed before reaching the server, so it is safe to send again"""
+    if isinstance(error, urllib.error.HTTPError):
+        return False
+    if isinstance(error, urllib.error.URLError):
+        error = error.reason
+    return isinstance(error, ConnectionRefusedError)
+
+
+def get_json(url, timeout=10, token=None):
+    with urllib.request.urlopen(urllib.request.Request(url, headers=_headers(token)), timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    """Routes GET/POST paths to the owning server's routes dict
+
+    When the server has a token, requests without the matching header are refused
+    before their body is read: agents run flash jobs for whoever can reach them.
+    """
+
+    def _reply(self, code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method):
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, "").encode(), token.encode()):
+            self._reply(401, {"error": f"missing or wrong {TOKEN_HEADER}"})
+            return
+        route = self.server.routes.get((method, self.path))
+        if route is None:
+            self._reply(404, {"error": f"no route {method} {self.path}"})
+            return
+        payload = None
+        try:
+            if method == "POST":
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+                if not isinstance(payload, dict):
+                    self._reply(400, {"error": "request body must be a JSON object"})
+                    return
+            self._reply(200, route(payload))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self._reply(400, {"error": f"bad JSON: {e}"})
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(routes, host, port, token=None):
+    server = ThreadingHTTPServer((host, port), JsonHandler)
+    server.daemon_threads = True
+    server.routes = routes
+    server.token = token
+    threading.Thread(target=server.serve_forever, name=f"http-{port}", daemon=True).start()
+    return server
+
+
+def local_inventory():
+    """Devices this workstation can reach: adb and fastboot serials"""
+    from log_capture import adb_devices
+    from fastboot_state import get_fastboot_state
+
+    devices = []
+    try:
+        devices += [{"serial": serial, "mode": "adb"} for serial in adb_devices()]
+    except OSError:
+        pass
+    devices += [{"serial": serial, "mode": "fastboot"} for serial in get_fastboot_state().devices()]
+    return devices
+
+
+class BenchAgent:
+    """Runs jobs for the coordinator on the devices plugged into this PC"""
+
+    def __init__(self, name, coordinator, layer, inventory, capacity=4, host="127.0.0.1", port=0, token=None):
+        self.name = name
+        self.coordinator = coordinator.rstrip("/")
+        self.token = token
+        self.layer = layer
+        self.inventory = inventory
+        self.capacity = capacity
+        self.slots = threading.Semaphore(capacity)
+        self.runner = BatchRunner(layer, progress=lambda message: None)
+        self.running = 0
+        self.completed = 0
+        self.lock = threading.Lock()
+        self.server = serve({("GET", "/status"): self.status, ("POST", "/run"): self.run}, host, port, token)
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self.stopped = threading.Event()
+
+    def log(self, message):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[{timestamp}] [AGENT {self.name}] {message}", flush=True)
+
+    def status(self, payload=None):
+        return {"name": self.name, "url": self.url, "capacity": self.capacity,
+                "devices": self.inventory(), "running": self.running, "completed": self.completed}
+
+    def run(self, job):
+        with self.slots:
+            with self.lock:
+                self.running += 1
+            try:
+                record = self.runner.run_job(job)
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.completed += 1
+        record["agent"] = self.name
+        return record
+
+    def heartbeat_forever(self):
+        """Register with the coordinator and keep the device inventory fresh"""
+        registered = False
+        while not self.stopped.is_set():
+            try:
+                post_json(f"{self.coordinator}/register", self.status(), timeout=5, token=self.token)
+                if not registered:
+                    self.log(f"Registered with {self.coordinator} as {self.url}")
+                    registered = True
+            except (OSError, ValueError) as e:
+                if registered:
+                    self.log(f"Coordinator unreachable: {e}")
+                registered = False
+            self.stopped.wait(HEARTBEAT_INTERVAL)
+
+    def stop(self):
+        self.stopped.set()
+        self.server.shutdown()
+
+
+class AgentInfo:
+    def __init__(self, name):
+        self.name = name
+        self.url = None
+        self.capacity = 1
+        self.devices = set()
+        self.in_flight = 0
+        self.completed = 0
+        self.last_seen = 0.0
+
+
+def device_key(job):
+    return job.get("serial") or job.get("port")
+
+
+class ClusterDeviceLayer:
+    """Device layer that forwards each job to the agent owning its device
+
+    Plugs into BatchRunner like the adb and simulated layers, so results, the
+    JSON Lines stream and the results store work exactly as in single-PC mode.
+    """
+
+    def __init__(self, route_timeout=ROUTE_TIMEOUT, token=None):
+        self.route_timeout = route_timeout
+        self.token = token
+        self.agents = {}
+        self.cond = threading.Condition()
+
+    def register(self, status):
+        with self.cond:
+            agent = self.agents.get(status["name"])
+            if agent is None:
+                agent = self.agents[status["name"]] = AgentInfo(status["name"])
+            agent.url = status["url"]
+            agent.capacity = max(1, int(status.get("capacity", 1)))
+            agent.devices = {device_key(device) for device in status.get("devices", [])}
+            agent.last_seen = time.monotonic()
+            self.cond.notify_all()
+        return {"ok": True}
+
+    def live_agents(self):
+        cutoff = time.monotonic() - AGENT_EXPIRY
+        return [agent for agent in self.agents.values() if agent.last_seen >= cutoff]
+
+    def owner(self, job):
+        """The agent a job must run on, or None while no live agent has its device"""
+        live = self.live_agents()
+        if job.get("agent"):
+            return next((agent for agent in live if agent.name == job["agent"]), None)
+        owners = [agent for agent in live if device_key(job) in agent.devices]
+        if len(owners) > 1:
+            raise ValueError(f"{device_key(job)} is reported by {', '.join(a.name for a in owners)} - "
+                             f"pin the job with \"agent\"")
+        return owners[0] if owners else None
+
+    def acquire(self, job):
+        """Wait for the owning agent to have a free slot and take it"""
+        deadline = time.monotonic() + self.route_timeout
+        with self.cond:
+            while True:
+                agent = self.owner(job)
+                if agent is not None and agent.in_flight < agent.capacity:
+                    agent.in_flight += 1
+                    return agent
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return None
+                self.cond.wait(min(left, HEARTBEAT_INTERVAL))
+
+    def release(self, agent, failed=False):
+        with self.cond:
+            agent.in_flight -= 1
+            if failed:
+                agent.last_seen = 0.0  # Treat as gone until its next heartbeat
+            else:
+                agent.completed += 1
+            self.cond.notify_all()
+
+    def _forward(self, job):
+        """Run a job on its agent; only a request the agent never received is retried
+
+        A refused connection means the agent is gone, so it is dropped until its next
+        heartbeat. An HTTP error, reset or timeout after delivery may have left the job
+        half done (a flash), so it fails the job and the agent stays in rotation.
+        """
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            agent = self.acquire(job)
+            if agent is None:
+                return {"status": "error", "message": f"no agent has {device_key(job)} attached"}
+            try:
+                record = post_json(f"{agent.url}/run", job, timeout=JOB_TIMEOUT, token=self.token)
+            except (OSError, ValueError) as e:
+                retry = never_delivered(e)
+                self.release(agent, failed=retry)
+                if not retry or attempt == MAX_ATTEMPTS:
+                    return {"status": "error", "message": f"agent {agent.name} failed: {e}", "agent": agent.name}
+                continue
+            self.release(agent)
+            # run_job's own bookkeeping is redone by the coordinator's runner
+            for key in ("id", "serial", "port", "model", "action", "started", "duration"):
+                record.pop(key, None)
+            return record
+
+    diagnose = network_reset = flash = verify = _forward
+
+    def summary(self):
+        with self.cond:
+            return {name: {"capacity": agent.capacity, "devices": len(agent.devices), "completed": agent.completed}
+                    for name, agent in self.agents.items()}
+
+
+class Coordinator:
+    """Accepts agent registrations and runs manifests across them"""
+
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT, route_timeout=ROUTE_TIMEOUT, token=None):
+        self.layer = ClusterDeviceLayer(route_timeout, token)
+        self.server = serve({("POST", "/register"): self.layer.register,
+                             ("GET", "/status"): lambda payload: self.layer.summary()}, host, port, token)
+        self.port = self.server.server_address[1]
+
+    def wait_for_agents(self, count, timeout=30):
+        deadline = time.monotonic() + timeout
+        with self.layer.cond:
+            while len(self.layer.live_agents()) < count and time.monotonic() < deadline:
+                self.layer.cond.wait(0.5)
+            return len(self.layer.live_agents())
+
+    def run(self, jobs, results_path=None, store=None, progress=None):
+        # Per-agent capacity is the real limit; enough threads that a busy agent never starves an idle one
+        runner = BatchRunner(self.layer, concurrency=min(len(jobs), 256) or 1, results_path=results_path,
+                             store=store, progress=progress)
+        summary = runner.run(jobs)
+        summary["agents"] = self.layer.summary()
+        return summary
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def run_agent(args):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="bench_cluster.py agent", description="Serve local devices to a coordinator")
+    parser.add_argument("--coordinator", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    parser.add_argument("--name", default=socket.gethostname())
+    parser.add_argument("--host", default=None, help="Address the coordinator reaches this PC on")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--capacity", type=int, default=4)
+    parser.add_argument("--simulate", help="Comma-separated serials served by the simulated device layer")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token", default=os.environ.get(TOKEN_ENV),
+                        help=f"Shared secret, same as the coordinator's (default: ${TOKEN_ENV})")
+    args = parser.parse_args(args)
+
+    host = args.host or ("127.0.0.1" if args.simulate else socket.gethostbyname(socket.gethostname()))
+    if args.simulate:
+        devices = [{"serial": serial, "mode": "simulated"} for serial in args.simulate.split(",")]
+        layer, inventory = SimulatedDeviceLayer(latency=args.latency), lambda: devices
+    else:
+        layer, inventory = AdbDeviceLayer(), local_inventory
+    if not args.token and not args.simulate:
+        parser.error(f"--token (or ${TOKEN_ENV}) is required: the agent accepts flash jobs from the network")
+    agent = BenchAgent(args.name, args.coordinator, layer, inventory, args.capacity, host, args.port, args.token)
+    agent.log(f"Serving on {agent.url} (capacity {args.capacity})")
+    try:
+        agent.heartbeat_forever()
+    except KeyboardInterrupt:
+        agent.stop()
+
+
+def run_coordinator(args):
+    import argparse
+    from results_store import get_store
+
+    parser = argparse.ArgumentParser(prog="bench_cluster.py coordinator", description="Run a manifest across agents")
+    parser.add_argument("manifest")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--agents", type=int, default=1, help="Agents to wait for before starting")
+    parser.add_argument("--results")
+    parser.add_argument("--token", default=os.environ.get(TOKEN_ENV),
+                        help=f"Shared secret the agents are started with (default: ${TOKEN_ENV})")
+    args = parser.parse_args(args)
+    if not args.token:
+        parser.error(f"--token (or ${TOKEN_ENV}) is required: the coordinator listens on every interface")
+
+    manifest, jobs = load_manifest(args.manifest)
+    results = args.results or manifest.get("results") or \
+        f"logs/cluster_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+    coordinator = Coordinator(port=args.port, token=args.token)
+    print(f"Coordinator listening on port {coordinator.port}, waiting for {args.agents} agent(s)...")
+    coordinator.wait_for_agents(args.agents)
+    summary = coordinator.run(jobs, results, store=get_store())
+    for name, stats in summary["agents"].items():
+        print(f"  {name}: {stats['completed']} jobs, {stats['devices']} devices, capacity {stats['capacity']}")
+    print(f"Results written to {results}")
+    return 0 if summary["statuses"].keys() <= {"ok", "skipped"} else 1
+
+
+def demo(agents=3, devices=8, capacity=2, latency=0.2):
+    """Local agent processes with simulated devices; compares against one agent holding everything"""
+    serials = [f"SIM{a}{d:02d}" for a in range(agents) for d in range(devices)]
+    jobs = [{"id": f"{i:04d}-{serial}", "serial": serial, "action": action, "model": "Nokia G50"}
+            for i, (serial, action) in enumerate((s, a) for a in ("diagnose", "flash") for s in serials)]
+
+    def run(layout):
+        token = secrets.token_hex(16)
+        coordinator = Coordinator(host="127.0.0.1", port=0, token=token)
+        url = f"http://127.0.0.1:{coordinator.port}"
+        processes = [subprocess.Popen([sys.executable, __file__, "agent", "--coordinator", url, "--name", name,
+                                       "--simulate", ",".join(owned), "--capacity", str(capacity),
+                                       "--latency", str(latency), "--token", token], stdout=subprocess.DEVNULL)
+                     for name, owned in layout]
+        try:
+            coordinator.wait_for_agents(len(layout))
+            return coordinator.run(jobs, progress=lambda message: None)
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+            coordinator.stop()
+
+    print(f"{len(jobs)} jobs on {len(serials)} simulated devices, {latency}s per job, capacity {capacity} per agent")
+    single = run([("pc0", serials)])
+    print(f"1 agent:  {single['elapsed']:6.2f}s {single['statuses']}")
+    spread = run([(f"pc{a}", serials[a * devices:(a + 1) * devices]) for a in range(agents)])
+    print(f"{agents} agents: {spread['elapsed']:6.2f}s {spread['statuses']}")
+    for name, stats in sorted(spread["agents"].items()):
+        print(f"  {name}: {stats['completed']} jobs")
+    print(f"Speedup: {single['elapsed'] / spread['elapsed']:.2f}x")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "agent":
+        return run_agent(argv[1:])
+    if argv and argv[0] == "coordinator":
+        return run_coordinator(argv[1:])
+    if argv and argv[0] == "demo":
+        return demo(int(argv[1]) if len(argv) > 1 else 3)
+    print("Usage: python bench_cluster.py agent --token T [--coordinator URL] [--name N] [--capacity N] [--simulate S1,S2]")
+    print("       python bench_cluster.py coordinator <manifest.json> --token T [--port N] [--agents N] [--results F]")
+    print(f"       (or set {TOKEN_ENV} instead of --token)")
+    print("       python bench_cluster.py demo [agents]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Command Runner - Shared asyncio runner for adb, fastboot and powershell
+Streams output line by line, enforces deadlines and kills wedged process trees
+"""
+
+import os
+import sys
+import time
+import signal
+import asyncio
+import subprocess
+import locale
+import threading
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_CONCURRENT = 8
+STREAM_LIMIT = 1024 * 1024  # Longest single line we accept from a child
+
+IS_WINDOWS = sys.platform == "win32"
+
+
+class CommandResult:
+    """Outcome of one external command, shaped like subprocess.CompletedProcess"""
+
+    def __init__(self, args, returncode, stdout, stderr, timed_out, duration):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+        self.duration = duration
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out
+
+    def __repr__(self):
+        return (f"CommandResult(args={self.args!r}, returncode={self.returncode}, "
+                f"timed_out={self.timed_out}, duration={self.duration:.3f})")
+
+
+def deadline(seconds):
+    """Absolute monotonic deadline for a group of commands"""
+    return time.monotonic() + seconds
+
+
+class CommandRunner:
+    """Runs child processes on one background event loop with a concurrency cap
+
+    Async callers can await run() directly; synchronous code uses run_sync(),
+    which hands the command to the runner's loop thread and waits for it.
+    Line callbacks are invoked on the loop thread as lines arrive.
+    """
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self.encoding = locale.getpreferredencoding(False)
+        self._semaphores = {}
+        self._running = set()
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.recorder = None  # command_trace.TraceWriter
+        self.backend = None   # command_trace.ReplayBackend: serve results instead of spawning
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrent)
+        return semaphore
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                name="command-runner", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    async def _pump(self, stream, on_line, sink):
+        while True:
+            raw = await stream.readline()
+            if not raw:
+                return
+            line = raw.decode(self.encoding, errors="replace").rstrip("\r\n")
+            if sink is not None:
+                sink.append(line)
+            if on_line:
+                on_line(line)
+
+    async def _kill_tree(self, proc):
+        """Kill the child and everything it spawned"""
+        if proc.returncode is not None:
+            return
+        try:
+            if IS_WINDOWS:
+                killer = await asyncio.create_subprocess_exec(
+                    "taskkill", "/F", "/T", "/PID", str(proc.pid),
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+                await killer.wait()
+            else:
+                os.killpg(proc.pid, signal.SIGKILL)
+        except (OSError, ProcessLookupError):
+            pass
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        await proc.wait()
+
+    async def run(self, args, timeout=DEFAULT_TIMEOUT, deadline=None, on_line=None,
+                  on_stderr_line=None, capture=True, input=None):
+        """Run one command, streaming its output
+
+        timeout is per command; deadline is an absolute time.monotonic() value
+        shared by a group of commands, whichever comes first wins. Set
+        capture=False for large outputs that are only consumed via on_line.
+        Raises FileNotFoundError when the tool is not installed.
+        """
+        args = [str(arg) for arg in args]
+        async with self._semaphore():
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            if self.backend is not None:
+                return await self.backend.run(args, timeout, on_line, on_stderr_line, capture)
+
+            started = time.monotonic()
+            kwargs = {}
+            if IS_WINDOWS:
+                kwargs["creationflags"] = 0x00000200  # CREATE_NEW_PROCESS_GROUP
+            else:
+                kwargs["start_new_session"] = True
+
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=STREAM_LIMIT,
+                **kwargs)
+            self._running.add(proc)
+
+            keep = capture or self.recorder is not None
+            stdout_lines = [] if keep else None
+            stderr_lines = [] if keep else None
+            timed_out = False
+            try:
+                if input is not None:
+                    proc.stdin.write(input.encode(self.encoding) if isinstance(input, str) else input)
+                    await proc.stdin.drain()
+                    proc.stdin.close()
+
+                work = asyncio.gather(
+                    self._pump(proc.stdout, on_line, stdout_lines),
+                    self._pump(proc.stderr, on_stderr_line, stderr_lines),
+                    proc.wait())
+                try:
+                    await asyncio.wait_for(work, timeout)
+                except asyncio.TimeoutError:
+                    timed_out = True
+                    await self._kill_tree(proc)
+            except BaseException:
+                # Cancelled (or a callback blew up): never leave the tree running
+                await asyncio.shield(self._kill_tree(proc))
+                raise
+            finally:
+                self._running.discard(proc)
+
+            result = CommandResult(
+                args,
+                proc.returncode,
+                "\n".join(stdout_lines) if keep else "",
+                "\n".join(stderr_lines) if keep else "",
+                timed_out,
+                time.monotonic() - started)
+            if self.recorder is not None:
+                self.recorder.record(result, started)
+                if not capture:
+                    result.stdout = result.stderr = ""
+            return result
+
+    async def run_all(self, commands, total_timeout=None, **kwargs):
+        """Run several commands concurrently under one shared deadline"""
+        group_deadline = deadline(total_timeout) if total_timeout is not None else None
+        return await asyncio.gather(*[
+            self.run(args, deadline=group_deadline, **kwargs) for args in commands])
+
+    def run_sync(self, args, **kwargs):
+        """Blocking wrapper around run() for the synchronous tools"""
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self.run(args, **kwargs), loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def run_all_sync(self, commands, total_timeout=None, **kwargs):
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(
+            self.run_all(commands, total_timeout=total_timeout, **kwargs), loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def cancel_all(self):
+        """Kill every running child process tree"""
+        if self._loop is None:
+            return
+        for proc in list(self._running):
+            asyncio.run_coroutine_threadsafe(self._kill_tree(proc), self._loop)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """Process-wide runner shared by every tool module"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = CommandRunner()
+            _attach_trace(_runner)
+        return _runner
+
+
+def _attach_trace(runner):
+    """Record or replay when the command_trace environment switches are set"""
+    import command_trace
+
+    if os.environ.get(command_trace.REPLAY_ENV):
+        speed = float(os.environ.get(command_trace.SPEED_ENV, "1"))
+        runner.backend = command_trace.ReplayBackend(os.environ[command_trace.REPLAY_ENV], speed,
+                                                     loop_trace=bool(os.environ.get(command_trace.LOOP_ENV)))
+        if not speed:
+            import poll_scheduler
+
+            poll_scheduler.fast_forward()  # No command latency: no poll waits either
+    elif os.environ.get(command_trace.RECORD_ENV):
+        import atexit
+
+        runner.recorder = command_trace.TraceWriter(os.environ[command_trace.RECORD_ENV])
+        atexit.register(runner.recorder.close)
+
+
+def run_command(args, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """Run an external command through the shared runner and wait for it"""
+    return get_runner().run_sync(args, timeout=timeout, **kwargs)
+
+
+class CommandStream:
+    """Raw binary stdout of a long-running child (adb exec-out dd ...)
+
+    The line-oriented runner would decode and buffer the whole output, so
+    bulk readers get a file-like stream instead. close() kills the process tree.
+    """
+
+    def __init__(self, args):
+        self.args = [str(arg) for arg in args]
+        kwargs = {}
+        if IS_WINDOWS:
+            kwargs["creationflags"] = 0x00000200  # CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs["start_new_session"] = True
+        self.proc = subprocess.Popen(self.args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, **kwargs)
+
+    def read(self, size=-1):
+        return self.proc.stdout.read(size)
+
+    def readinto(self, buffer):
+        return self.proc.stdout.readinto(buffer)
+
+    def close(self):
+        if self.proc.poll() is None:
+            try:
+                if IS_WINDOWS:
+                    subprocess.run(["taskkill", "/F", "/T", "/PID", str(self.proc.pid)],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                else:
+                    os.killpg(self.proc.pid, signal.SIGKILL)
+            except OSError:
+                self.proc.kill()
+        self.proc.stdout.close()
+        return self.proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_stream(args):
+    """Start a command and return its stdout as a binary stream"""
+    return CommandStream(args)
+
+
+def powershell(script, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """Run a PowerShell snippet through the shared runner"""
+    return run_command(["powershell", "-NoProfile", "-Command", script], timeout=timeout, **kwargs)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python command_runner.py <command> [args...]")
+        sys.exit(2)
+    result = run_command(sys.argv[1:], on_line=print, capture=False)
+    print(f"[runner] exit={result.returncode} timed_out={result.timed_out} {result.duration:.2f}s")
+    sys.exit(0 if result.ok else 1)
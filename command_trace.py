@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Command Trace - Record and replay every external command the tools run
+A recorded bench session (adb, fastboot, powershell output and timings) can be
+replayed on any machine at original speed or with no command latency at all
+"""
+
+import os
+import sys
+import gzip
+import time
+import runpy
+import _thread
+import marshal
+import asyncio
+import threading
+from collections import defaultdict, deque
+import poll_scheduler
+
+TRACE_VERSION = 1
+
+# Environment switches picked up by command_runner.get_runner()
+RECORD_ENV = "ANDROID_DOCTOR_RECORD"
+REPLAY_ENV = "ANDROID_DOCTOR_REPLAY"
+SPEED_ENV = "ANDROID_DOCTOR_REPLAY_SPEED"
+LOOP_ENV = "ANDROID_DOCTOR_REPLAY_LOOP"
+
+
+class TraceWriter:
+    """Gzip stream of marshal records; every distinct string is stored once
+
+    Monitors re-run the same query with the same output hundreds of times,
+    so commands reference an interned string table instead of repeating text.
+    """
+
+    def __init__(self, path):
+        self.file = gzip.open(path, "wb", compresslevel=6)
+        self.lock = threading.Lock()
+        self.strings = {}
+        self.started = time.monotonic()
+        self.count = 0
+        marshal.dump(("trace", TRACE_VERSION, time.time()), self.file)
+
+    def _intern(self, text):
+        index = self.strings.get(text)
+        if index is None:
+            index = self.strings[text] = len(self.strings)
+            marshal.dump(("s", index, text), self.file)
+        return index
+
+    def record(self, result, started):
+        with self.lock:
+            if self.file is None:
+                return
+            args = tuple(self._intern(arg) for arg in result.args)
+            marshal.dump(("c", round(started - self.started, 6), round(result.duration, 6), args,
+                          result.returncode, self._intern(result.stdout), self._intern(result.stderr),
+                          result.timed_out), self.file)
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_trace(path):
+    """Yield command dicts from a trace file"""
+    strings = []
+    with gzip.open(path, "rb") as f:
+        header = marshal.load(f)
+        if header[0] != "trace" or header[1] != TRACE_VERSION:
+            raise ValueError(f"{path} is not a version {TRACE_VERSION} command trace")
+        while True:
+            try:
+                record = marshal.load(f)
+            except EOFError:
+                return
+            if record[0] == "s":
+                strings.append(record[2])
+                continue
+            _, at, duration, args, returncode, stdout, stderr, timed_out = record
+            yield {
+                "at": at,
+                "duration": duration,
+                "args": [strings[i] for i in args],
+                "returncode": returncode,
+                "stdout": strings[stdout],
+                "stderr": strings[stderr],
+                "timed_out": timed_out,
+            }
+
+
+class ReplayBackend:
+    """Serves commands from a trace instead of starting processes
+
+    Commands are matched on their exact argument list, in recorded order per
+    argument list; a command that was never recorded fails like a missing tool.
+    speed=1.0 reproduces the recorded durations, 0 returns immediately. Only
+    command time is scaled; at speed 0 (bench) poll waits are fast-forwarded as
+    well (poll_scheduler.fast_forward), other sleeps run in real time.
+
+    Once every recorded command has been served, the next request interrupts the
+    main thread (KeyboardInterrupt), so a monitor replay stops where the session
+    did. loop_trace=True serves the trace again instead.
+    """
+
+    def __init__(self, path, speed=1.0, loop_trace=False):
+        self.speed = speed
+        self.loop_trace = loop_trace
+        self.recorded = defaultdict(list)
+        for command in read_trace(path):
+            self.recorded[tuple(command["args"])].append(command)
+        self.queues = {args: deque(commands) for args, commands in self.recorded.items()}
+        self.remaining = sum(len(commands) for commands in self.recorded.values())
+        self.finished = False
+        self.lock = threading.Lock()
+        self.served = 0
+        self.command_time = 0.0
+        self.misses = defaultdict(int)
+        self.latencies = []
+
+    def next_command(self, args):
+        key = tuple(args)
+        with self.lock:
+            if not self.remaining and not self.loop_trace:
+                if not self.finished:
+                    self.finished = True
+                    _thread.interrupt_main()  # The recorded session is over
+                self.misses[key] += 1
+                return None
+            queue = self.queues.get(key)
+            if queue is None:
+                self.misses[key] += 1
+                return None
+            if not queue:
+                if not self.loop_trace:
+                    self.misses[key] += 1
+                    return None
+                queue.extend(self.recorded[key])  # Monitors poll longer than the session lasted
+            self.served += 1
+            if not self.loop_trace:
+                self.remaining -= 1
+            return queue.popleft()
+
+    async def run(self, args, timeout=None, on_line=None, on_stderr_line=None, capture=True):
+        from command_runner import CommandResult
+
+        started = time.monotonic()
+        command = self.next_command(args)
+        if command is None:
+            raise FileNotFoundError(f"Not in trace: {' '.join(args)}")
+
+        duration = command["duration"]
+        timed_out = command["timed_out"]
+        if timeout is not None and duration > timeout:
+            duration, timed_out = timeout, True
+        if self.speed:
+            await asyncio.sleep(duration / self.speed)
+
+        for line in command["stdout"].splitlines() if on_line else ():
+            on_line(line)
+        for line in command["stderr"].splitlines() if on_stderr_line else ():
+            on_stderr_line(line)
+
+        elapsed = time.monotonic() - started
+        with self.lock:
+            self.latencies.append(elapsed)
+            self.command_time += elapsed
+        return CommandResult(args, command["returncode"],
+                             command["stdout"] if capture else "", command["stderr"] if capture else "",
+                             timed_out, elapsed)
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        lines = [f"Served {self.served} commands from {len(self.recorded)} recorded command lines"
+                 f"{' (end of trace reached)' if self.finished else ''}",
+                 f"Command time {self.command_time:.3f}s; the rest is the tool's own work and sleeps"]
+        if latencies:
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            lines.append(f"Latency p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms")
+        for args, count in sorted(self.misses.items(), key=lambda item: -item[1]):
+            lines.append(f"MISS x{count}: {' '.join(args)[:120]}")
+        return lines
+
+
+def trace_stats(path):
+    """Per-tool counts and total recorded time"""
+    tools = defaultdict(lambda: [0, 0.0])
+    total = 0
+    for command in read_trace(path):
+        tool = os.path.basename(command["args"][0]) if command["args"] else "?"
+        tools[tool][0] += 1
+        tools[tool][1] += command["duration"]
+        total += 1
+    print(f"{path}: {total} commands, {os.path.getsize(path)} bytes")
+    for tool, (count, seconds) in sorted(tools.items()):
+        print(f"  {tool:<12} {count:6d} commands {seconds:9.2f}s")
+
+
+def run_script(script, args):
+    """Run a tool module as __main__ with its own argv"""
+    sys.argv = [script] + list(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except (SystemExit, KeyboardInterrupt):
+        pass  # KeyboardInterrupt: the tool ran past the end of a replayed trace
+
+
+def main():
+    if len(sys.argv) >= 4 and sys.argv[1] == "record":
+        trace = os.environ[RECORD_ENV] = sys.argv[2]
+        run_script(sys.argv[3], sys.argv[4:])
+        from command_runner import get_runner
+        runner = get_runner()
+        runner.recorder.close()
+        print(f"Recorded {runner.recorder.count} commands to {trace}")
+        return
+    if len(sys.argv) >= 4 and sys.argv[1] in ("replay", "bench"):
+        trace, args = sys.argv[2], sys.argv[3:]
+        speed = 0.0 if sys.argv[1] == "bench" else 1.0
+        if args[0] == "--loop":
+            os.environ[LOOP_ENV] = "1"
+            args = args[1:]
+        if args[0] == "--speed":
+            speed = float(args[1])
+            args = args[2:]
+        os.environ[REPLAY_ENV] = trace
+        os.environ[SPEED_ENV] = str(speed)
+        clock = None if speed else poll_scheduler.fast_forward()
+        started = time.perf_counter()
+        run_script(args[0], args[1:])
+        elapsed = time.perf_counter() - started
+        from command_runner import get_runner
+        print(f"\nReplay finished in {elapsed:.3f}s (command speed {'max' if not speed else speed})")
+        if clock is not None:
+            print(f"Fast-forwarded {clock.skipped:.1f}s of poll waits")
+        for line in get_runner().backend.report():
+            print(line)
+        return
+    if len(sys.argv) >= 3 and sys.argv[1] == "stats":
+        trace_stats(sys.argv[2])
+        return
+    print("Usage: python command_trace.py record <trace.bin> <tool.py> [args]")
+    print("       python command_trace.py replay <trace.bin> [--loop] [--speed N] <tool.py> [args]  (default 1.0)")
+    print("       python command_trace.py bench <trace.bin> [--loop] <tool.py> [args]  (no command latency or poll waits)")
+    print("Replays stop at the end of the trace unless --loop is given; --speed scales command time, "
+          "speed 0 also skips poll waits")
+    print("       python command_trace.py stats <trace.bin>")
+    print(f"Or set {RECORD_ENV} / {REPLAY_ENV} (+ {SPEED_ENV}, {LOOP_ENV}) when running any tool")
+
+
+if __name__ == "__main__":
+    main()
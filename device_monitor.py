@@ -4,24 +4,42 @@ Real-time Device Monitor for Nokia G11
 Continuously monitors USB connections and device state changes
 """
 
-import time
-import subprocess
+import re
 import threading
 from datetime import datetime
-import winsound
+try:
+    import winsound
+except ImportError:  # Replaying a trace on Linux
+    winsound = None
+from device_profiles import get_database
+from driver_index import get_driver_index, host_arch
+from poll_scheduler import AdaptivePoller, poll_until
+from command_runner import powershell
+from serial_port import COM_PORT_PATTERN
+from mtk_brom import wait_and_catch
+from firmware_prefetch import get_prefetcher
+from event_ring import EventRing
+
+DEVICE_ID_PATTERN = re.compile(r"\b[A-Z]+\\\S+")
 
 class DeviceMonitor:
     def __init__(self):
         self.monitoring = False
         self.last_devices = set()
         self.detection_count = 0
+        self.profiles = get_database()
+        self.drivers = get_driver_index()
+        self.poller = AdaptivePoller()
+        try:
+            self.events = EventRing.create()  # Workers and dashboards: python event_ring.py tail
+        except OSError as e:
+            print(f"Event ring unavailable: {e}")
+            self.events = None
         
     def get_current_devices(self):
         """Get currently connected USB devices"""
         try:
-            result = subprocess.run([
-                "powershell", "-Command",
-                """Get-WmiObject -Class Win32_PnPEntity | Where-Object {
+            result = powershell("""Get-WmiObject -Class Win32_PnPEntity | Where-Object {
                     $_.Name -like '*MediaTek*' -or 
                     $_.Name -like '*Android*' -or 
                     $_.Name -like '*Nokia*' -or 
@@ -29,9 +47,9 @@ class DeviceMonitor:
                     $_.Name -like '*PreLoader*' -or
                     $_.Name -like '*Bootloader*' -or
                     $_.Name -like '*9008*' -or
-                    $_.Name -like '*Qualcomm*'
-                } | Select-Object Name, DeviceID"""
-            ], capture_output=True, text=True, shell=True)
+                    $_.Name -like '*Qualcomm*' -or
+                    ($_.ConfigManagerErrorCode -eq 28 -and $_.DeviceID -like 'USB\\VID_*')
+                } | Select-Object Name, DeviceID, ConfigManagerErrorCode | Format-Table -AutoSize | Out-String -Width 4096""")
             
             devices = set()
             if result.stdout:
@@ -53,6 +71,38 @@ class DeviceMonitor:
         except:
             print("\a")  # Fallback beep
     
+    def suggest_driver(self, device_info):
+        """Name the bundled INF for a device that has no driver bound (error code 28)"""
+        if not device_info.rstrip().endswith(" 28"):
+            return
+        
+        matches = self.drivers.lookup_device_id(device_info, host_arch())
+        print("\n⚠️  NO DRIVER INSTALLED for this device")
+        if matches:
+            entry = matches[0]
+            print(f"Install: {entry['inf']} ({entry['description']})")
+            print("From: Mediatek Driver Auto Installer v1.1352\\SmartPhoneDriver")
+        else:
+            print("Bundled driver package has no INF for this hardware ID")
+    
+    def catch_preloader(self, device_info):
+        """Run the BROM/PreLoader handshake on the device's VCOM port, if it has one"""
+        match = COM_PORT_PATTERN.search(device_info)
+        if not match or not ("MediaTek" in device_info or "PreLoader" in device_info):
+            return None
+        try:
+            return wait_and_catch(port=match.group(1), log=lambda m: print(f"[BROM] {m}"))
+        except (RuntimeError, OSError) as e:
+            print(f"[BROM] Could not open {match.group(1)}: {e}")
+            return None
+    
+    def publish_event(self, device_info, kind, mode="", model=""):
+        """Share a hotplug event with worker and dashboard processes"""
+        if self.events is None:
+            return
+        match = DEVICE_ID_PATTERN.search(device_info)
+        self.events.publish(kind, match.group(0) if match else device_info.strip()[:64], mode or "", model)
+    
     def log_detection(self, device_info, detection_type="DETECTED"):
         """Log device detection with timestamp"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -63,12 +113,29 @@ class DeviceMonitor:
         print(f"{'='*60}")
         
         if detection_type == "DETECTED":
+            # Handshake first: the PreLoader window closes within seconds
+            held = self.catch_preloader(device_info)
             self.detection_count += 1
             print(f"Detection #{self.detection_count}")
             self.play_alert()
+            self.suggest_driver(device_info)
+            
+            profile, mode = self.profiles.resolve(device_info)
+            self.publish_event(device_info, "detected", mode, profile["model"] if profile else "")
+            if profile:
+                print(f"Profile: {profile['model']} ({profile['chipset']}) in {mode} mode")
+                hint = profile["boot_modes"].get(mode)
+                if hint:
+                    print(f"Boot mode hint: {hint}")
+                get_prefetcher().prefetch(profile["model"], f"{mode} detected")
+            elif mode:
+                print(f"Mode: {mode} (shared USB ID, model unknown)")
             
             # Provide immediate action guidance
-            if "MediaTek" in device_info or "PreLoader" in device_info:
+            if held:
+                print("\n✅ Device held in download mode (watchdog disabled)")
+                print("   → Start the SP Flash Tool download now")
+            elif "MediaTek" in device_info or "PreLoader" in device_info:
                 print("\n🚨 IMMEDIATE ACTION REQUIRED:")
                 print("1. Open SP Flash Tool NOW!")
                 print("2. Load scatter file")
@@ -79,6 +146,8 @@ class DeviceMonitor:
                 print("1. Open command prompt")
                 print("2. Run: fastboot devices")
                 print("3. Use fastboot commands for recovery")
+        else:
+            self.publish_event(device_info, "disconnected")
     
     def monitor_continuously(self):
         """Continuously monitor for device changes"""
@@ -96,6 +165,7 @@ class DeviceMonitor:
         
         try:
             while self.monitoring:
+                self.poller.begin_poll()
                 current_devices = self.get_current_devices()
                 
                 # Check for new devices
@@ -111,12 +181,13 @@ class DeviceMonitor:
                         self.log_detection(device, "DISCONNECTED")
                 
                 self.last_devices = current_devices
+                self.poller.record(bool(new_devices or removed_devices))
                 
                 # Show periodic status
-                if int(time.time()) % 30 == 0:  # Every 30 seconds
+                if self.poller.status_due():
                     print(f"[{datetime.now().strftime('%H:%M:%S')}] Monitoring... (Detections: {self.detection_count})")
                 
-                time.sleep(1)
+                self.poller.wait()
                 
         except KeyboardInterrupt:
             print("\n\n🛑 Monitoring stopped by user")
@@ -142,7 +213,7 @@ class DeviceMonitor:
                     print("   → Ready for fastboot commands")
                 elif "9008" in device or "Qualcomm" in device:
                     print("\n✅ Qualcomm EDL mode detected!")
-                    print("   → Ready for QFIL tool")
+                    print("   → Ready for QFIL tool, or natively: python edl_client.py info <prog_firehose.elf>")
         else:
             print("❌ No recovery-mode devices detected")
             print("💡 Try:")
@@ -167,12 +238,14 @@ class DeviceMonitor:
             print(f"\nStep {i}: {step}")
             if i < len(steps):
                 input("Press Enter when ready for next step...")
+                if i == 2:
+                    # Device can show up as soon as the cable goes in
+                    self.poller.expect(15)
             else:
                 print("\nScanning for device...")
-                time.sleep(2)
         
-        # Check for device
-        devices = self.get_current_devices()
+        # Check for device at burst rate while the PreLoader window is open
+        devices = poll_until(self.get_current_devices, 10, self.poller)
         if devices:
             print("\n✅ Device detected!")
             for device in devices:
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Device Profile Database
+Model knowledge (chipset, boot modes, partitions, firmware, probes) loaded from profiles/
+"""
+
+import re
+import sys
+import json
+import marshal
+from pathlib import Path
+
+PROFILES_DIR = Path(__file__).parent / "profiles"
+CACHE_NAME = "profiles.cache"
+CACHE_VERSION = 1
+
+USB_ID_PATTERN = re.compile(r"VID_([0-9A-Fa-f]{4})&PID_([0-9A-Fa-f]{4})")
+
+
+def usb_key(vid, pid):
+    """Normalise a VID/PID pair into an index key"""
+    return f"{vid.upper()}:{pid.upper()}"
+
+
+def parse_usb_id(text):
+    """Extract (vid, pid) from a Windows DeviceID such as USB\\VID_0E8D&PID_2000\\5&..."""
+    match = USB_ID_PATTERN.search(text or "")
+    if match:
+        return match.group(1).upper(), match.group(2).upper()
+    return None
+
+
+class ProfileDatabase:
+    """In-memory profile index keyed by USB VID/PID and ro.product.model"""
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self.by_model_index = {}
+        self.by_usb_index = {}
+
+        for profile in profiles:
+            for name in [profile["model"]] + profile.get("aliases", []):
+                self.by_model_index[name.strip().lower()] = profile
+            for usb in profile.get("usb", []):
+                key = usb_key(usb["vid"], usb["pid"])
+                self.by_usb_index.setdefault(key, []).append((profile, usb["mode"]))
+
+    @classmethod
+    def load(cls, profiles_dir=PROFILES_DIR):
+        """Load profiles, using the precompiled cache when it is up to date"""
+        profiles_dir = Path(profiles_dir)
+        sources = sorted(profiles_dir.glob("*.json"))
+        signature = [(p.name, p.stat().st_mtime_ns, p.stat().st_size) for p in sources]
+        cache_path = profiles_dir / CACHE_NAME
+
+        try:
+            with open(cache_path, "rb") as f:
+                version, cached_signature, profiles = marshal.load(f)
+            if version == CACHE_VERSION and cached_signature == signature:
+                return cls(profiles)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+        profiles = compile_profiles(sources, cache_path, signature)
+        return cls(profiles)
+
+    def by_model(self, model):
+        """Resolve a profile from ro.product.model (or a known alias)"""
+        if not model:
+            return None
+        return self.by_model_index.get(model.strip().lower())
+
+    def by_usb(self, vid, pid):
+        """Return [(profile, mode), ...] for a USB VID/PID, most specific first"""
+        return self.by_usb_index.get(usb_key(vid, pid), [])
+
+    def resolve(self, device_info):
+        """Resolve a device line from Device Manager into (profile, mode)
+
+        Returns (None, mode) when the VID/PID is known but shared by several models,
+        and (None, None) when nothing matches.
+        """
+        usb_id = parse_usb_id(device_info)
+        if not usb_id:
+            return None, None
+
+        matches = self.by_usb(*usb_id)
+        if len(matches) == 1:
+            return matches[0]
+        if matches:
+            return None, matches[0][1]
+        return None, None
+
+    def models(self):
+        return [profile["model"] for profile in self.profiles]
+
+
+def compile_profiles(sources, cache_path, signature):
+    """Parse JSON profile sources and write the marshal cache next to them"""
+    profiles = []
+    for source in sources:
+        with open(source, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+        profile.setdefault("aliases", [])
+        profile.setdefault("usb", [])
+        profile.setdefault("probes", {})
+        profile.setdefault("symptoms", [])
+        profiles.append(profile)
+
+    try:
+        with open(cache_path, "wb") as f:
+            marshal.dump((CACHE_VERSION, signature, profiles), f)
+    except OSError:
+        pass  # Read-only install, keep working from the JSON sources
+
+    return profiles
+
+
+_database = None
+
+
+def get_database():
+    """Shared database instance, loaded on first use"""
+    global _database
+    if _database is None:
+        _database = ProfileDatabase.load()
+    return _database
+
+
+def main():
+    database = ProfileDatabase.load()
+    if len(sys.argv) > 1:
+        profile = database.by_model(" ".join(sys.argv[1:]))
+        if not profile:
+            print(f"No profile for '{' '.join(sys.argv[1:])}'. Known models: {', '.join(database.models())}")
+            return
+        print(json.dumps(profile, indent=2))
+    else:
+        for profile in database.profiles:
+            modes = ", ".join(f"{usb['vid']}:{usb['pid']} ({usb['mode']})" for usb in profile["usb"])
+            print(f"{profile['model']:<12} {profile['chipset']:<10} {modes}")
+
+
+if __name__ == "__main__":
+    main()
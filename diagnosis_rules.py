@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Diagnosis Rule Engine
+Evaluates declarative rules against device facts and ranks the resulting verdicts
+"""
+
+import sys
+import json
+
+# Condition operators: fact value -> bool. A missing fact only satisfies "missing".
+OPERATORS = {
+    "equals": lambda value, arg: value == arg,
+    "not_equals": lambda value, arg: value != arg,
+    "in": lambda value, arg: value in arg,
+    "not_in": lambda value, arg: value not in arg,
+    "contains": lambda value, arg: arg in str(value),
+    "not_contains": lambda value, arg: arg not in str(value),
+    "empty": lambda value, arg: value in ("", None, "unknown"),
+    "not_empty": lambda value, arg: value not in ("", None, "unknown"),
+    "below": lambda value, arg: float(value) < arg,
+    "above": lambda value, arg: float(value) > arg,
+}
+
+MISSING = object()
+
+
+def describe(condition, value):
+    """Human readable evidence for a satisfied condition"""
+    if "rule" in condition:
+        return f"rule '{condition['rule']}' fired"
+    if value is MISSING:
+        return f"{condition['fact']} is missing"
+    return f"{condition['fact']} = {value!r}"
+
+
+class Rule:
+    """A compiled rule: all conditions must hold for the verdict to fire"""
+
+    def __init__(self, spec):
+        self.id = spec["id"]
+        self.verdict = spec["verdict"]
+        self.severity = spec.get("severity", 50)
+        self.actions = spec.get("actions", [])
+        self.conditions = []
+        for condition in spec["when"]:
+            if "rule" not in condition and condition.get("op", "equals") not in OPERATORS \
+                    and condition.get("op") != "missing":
+                raise ValueError(f"Rule {self.id}: unknown operator {condition.get('op')}")
+            self.conditions.append(condition)
+
+        self.facts = {c["fact"] for c in self.conditions if "fact" in c}
+        self.depends_on = {c["rule"] for c in self.conditions if "rule" in c}
+
+    def evaluate(self, facts, fired):
+        """Return the evidence list when the rule fires, otherwise None"""
+        evidence = []
+        for condition in self.conditions:
+            if "rule" in condition:
+                if condition["rule"] not in fired:
+                    return None
+                evidence.append(describe(condition, None))
+                continue
+
+            value = facts.get(condition["fact"], MISSING)
+            op = condition.get("op", "equals")
+            if op == "missing":
+                if value is not MISSING:
+                    return None
+            elif value is MISSING:
+                return None
+            else:
+                try:
+                    if not OPERATORS[op](value, condition.get("value")):
+                        return None
+                except (TypeError, ValueError):
+                    return None
+            evidence.append(describe(condition, value))
+        return evidence
+
+
+class RuleEngine:
+    """Incremental rule evaluation over a changing fact snapshot
+
+    Rules are indexed by the facts and rules they reference, so an update only
+    re-evaluates the rules whose inputs actually changed.
+    """
+
+    def __init__(self, rule_specs):
+        self.rules = {}
+        for spec in rule_specs:
+            rule = Rule(spec)
+            if rule.id in self.rules:
+                raise ValueError(f"Duplicate rule id: {rule.id}")
+            self.rules[rule.id] = rule
+
+        self.by_fact = {}
+        self.by_rule = {}
+        for rule in self.rules.values():
+            for fact in rule.facts:
+                self.by_fact.setdefault(fact, []).append(rule.id)
+            for dependency in rule.depends_on:
+                if dependency not in self.rules:
+                    raise ValueError(f"Rule {rule.id} depends on unknown rule {dependency}")
+                self.by_rule.setdefault(dependency, []).append(rule.id)
+
+        self.order = self._topological_order()
+        self.facts = {}
+        self.fired = {}
+        self.evaluations = 0
+
+    def _topological_order(self):
+        order = {}
+        visiting = set()
+
+        def visit(rule_id):
+            if rule_id in order:
+                return
+            if rule_id in visiting:
+                raise ValueError(f"Rule cycle through {rule_id}")
+            visiting.add(rule_id)
+            for dependency in self.rules[rule_id].depends_on:
+                visit(dependency)
+            visiting.discard(rule_id)
+            order[rule_id] = len(order)
+
+        for rule_id in self.rules:
+            visit(rule_id)
+        return order
+
+    def update(self, facts):
+        """Merge new fact values and re-evaluate affected rules
+
+        Returns the set of rule ids whose fired/not-fired state changed.
+        """
+        pending = set()
+        for key, value in facts.items():
+            if self.facts.get(key, MISSING) != value:
+                self.facts[key] = value
+                pending.update(self.by_fact.get(key, ()))
+        return self._propagate(pending)
+
+    def retract(self, *keys):
+        """Remove facts (e.g. device disconnected) and re-evaluate affected rules"""
+        pending = set()
+        for key in keys:
+            if self.facts.pop(key, MISSING) is not MISSING:
+                pending.update(self.by_fact.get(key, ()))
+        return self._propagate(pending)
+
+    def _propagate(self, pending):
+        changed = set()
+        while pending:
+            rule_id = min(pending, key=self.order.__getitem__)
+            pending.discard(rule_id)
+
+            self.evaluations += 1
+            evidence = self.rules[rule_id].evaluate(self.facts, self.fired)
+            was_fired = rule_id in self.fired
+            if evidence is None:
+                if not was_fired:
+                    continue
+                del self.fired[rule_id]
+            else:
+                if self.fired.get(rule_id) == evidence:
+                    continue
+                self.fired[rule_id] = evidence
+
+            if was_fired != (evidence is not None):
+                changed.add(rule_id)
+            pending.update(self.by_rule.get(rule_id, ()))
+        return changed
+
+    def verdicts(self):
+        """Fired rules ranked by severity, each with its evidence and actions"""
+        ranked = []
+        for rule_id, evidence in self.fired.items():
+            rule = self.rules[rule_id]
+            ranked.append({
+                "id": rule.id,
+                "verdict": rule.verdict,
+                "severity": rule.severity,
+                "evidence": evidence,
+                "actions": rule.actions,
+            })
+        ranked.sort(key=lambda v: (-v["severity"], self.order[v["id"]]))
+        return ranked
+
+
+def evaluate(rule_specs, facts):
+    """One-shot evaluation of a fact snapshot"""
+    engine = RuleEngine(rule_specs)
+    engine.update(facts)
+    return engine.verdicts()
+
+
+def main():
+    from device_profiles import get_database
+
+    if len(sys.argv) < 3:
+        print("Usage: python diagnosis_rules.py <model> <facts.json>")
+        return
+
+    profile = get_database().by_model(sys.argv[1])
+    if not profile or not profile.get("rules"):
+        print(f"No rules for '{sys.argv[1]}'")
+        return
+
+    with open(sys.argv[2], "r", encoding="utf-8") as f:
+        facts = json.load(f)
+    print(json.dumps(evaluate(profile["rules"], facts), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Driver Index - Maps USB hardware IDs to the INF files in the bundled driver package
+Parses the MediaTek Driver Auto Installer INFs once and keeps a precompiled lookup table
+"""
+
+import re
+import sys
+import marshal
+import platform
+from pathlib import Path
+
+WORKING_DIR = Path(__file__).parent
+DRIVER_PACKAGE_DIR = WORKING_DIR / "Mediatek Driver Auto Installer v1.1352" / "SmartPhoneDriver"
+CACHE_PATH = WORKING_DIR / "tools" / "driver_index.cache"
+CACHE_VERSION = 1
+
+HARDWARE_ID_PATTERN = re.compile(r"USB\\VID_([0-9A-F]{4})&PID_([0-9A-F]{4})(?:&MI_([0-9A-F]{2}))?", re.I)
+STRING_TOKEN_PATTERN = re.compile(r"%([^%]+)%")
+
+
+def read_inf_text(path):
+    """INF files are ANSI or UTF-16 (with BOM)"""
+    raw = Path(path).read_bytes()
+    if raw.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return raw.decode("utf-16")
+    if raw.startswith(b"\xef\xbb\xbf"):
+        return raw[3:].decode("utf-8", errors="replace")
+    return raw.decode("cp1252", errors="replace")
+
+
+def strip_comment(line):
+    """Drop a ';' comment unless it sits inside double quotes"""
+    in_quotes = False
+    for i, ch in enumerate(line):
+        if ch == '"':
+            in_quotes = not in_quotes
+        elif ch == ";" and not in_quotes:
+            return line[:i]
+    return line
+
+
+def parse_sections(text):
+    """Return {section name (lower case): [raw lines]}"""
+    sections = {}
+    current = None
+    for line in text.splitlines():
+        line = strip_comment(line).strip()
+        if not line:
+            continue
+        if line.startswith("[") and "]" in line:
+            current = sections.setdefault(line[1:line.index("]")].strip().lower(), [])
+        elif current is not None:
+            current.append(line)
+    return sections
+
+
+def split_entry(line):
+    if "=" not in line:
+        return None, line.strip()
+    key, value = line.split("=", 1)
+    return key.strip(), value.strip()
+
+
+def parse_inf(path, arch=None):
+    """Parse one INF and return a list of driver entries, one per hardware ID"""
+    sections = parse_sections(read_inf_text(path))
+
+    strings = {}
+    for line in sections.get("strings", []):
+        key, value = split_entry(line)
+        if key:
+            strings[key.lower()] = value.strip().strip('"')
+
+    def expand(value):
+        return STRING_TOKEN_PATTERN.sub(lambda m: strings.get(m.group(1).lower(), m.group(0)), value)
+
+    version = {}
+    for line in sections.get("version", []):
+        key, value = split_entry(line)
+        if key:
+            version[key.lower()] = expand(value)
+
+    entries = []
+    for line in sections.get("manufacturer", []):
+        key, value = split_entry(line)
+        parts = [part.strip() for part in value.split(",")]
+        models, decorations = parts[0], parts[1:]
+
+        for section_name in [models] + [f"{models}.{decoration}" for decoration in decorations]:
+            # The package directory (x64/x86) decides; the decoration only helps loose INFs
+            decoration = section_name[len(models) + 1:].lower()
+            if arch:
+                section_arch = arch
+            elif "amd64" in decoration:
+                section_arch = "x64"
+            elif "x86" in decoration:
+                section_arch = "x86"
+            else:
+                section_arch = None
+
+            for model_line in sections.get(section_name.lower(), []):
+                description, install = split_entry(model_line)
+                fields = [field.strip() for field in install.split(",")]
+                for hardware_id in fields[1:]:
+                    match = HARDWARE_ID_PATTERN.fullmatch(hardware_id)
+                    if not match:
+                        continue
+                    vid, pid, interface = match.group(1).upper(), match.group(2).upper(), match.group(3)
+                    entries.append({
+                        "vid": vid,
+                        "pid": pid,
+                        "interface": interface.upper() if interface else None,
+                        "hardware_id": hardware_id,
+                        "description": expand(description or ""),
+                        "install_section": fields[0],
+                        "class": version.get("class", ""),
+                        "provider": version.get("provider", ""),
+                        "driver_ver": version.get("driverver", ""),
+                        "catalog": version.get("catalogfile", ""),
+                        "arch": section_arch,
+                    })
+    return entries
+
+
+def index_key(vid, pid, interface=None):
+    key = f"{vid.upper()}:{pid.upper()}"
+    return f"{key}:{interface.upper()}" if interface else key
+
+
+class DriverIndex:
+    """Hardware ID -> driver entries, built from every INF in the package"""
+
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def load(cls, package_dir=DRIVER_PACKAGE_DIR, cache_path=CACHE_PATH):
+        """Load the precompiled table, rebuilding it only when an INF changed"""
+        package_dir = Path(package_dir)
+        infs = sorted(package_dir.rglob("*.inf")) if package_dir.exists() else []
+        signature = [(str(p.relative_to(package_dir)), p.stat().st_mtime_ns, p.stat().st_size) for p in infs]
+
+        try:
+            with open(cache_path, "rb") as f:
+                version, cached_signature, table = marshal.load(f)
+            if version == CACHE_VERSION and cached_signature == signature:
+                return cls(table)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+        table = build_table(package_dir, infs)
+        try:
+            Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_path, "wb") as f:
+                marshal.dump((CACHE_VERSION, signature, table), f)
+        except OSError:
+            pass
+        return cls(table)
+
+    def lookup(self, vid, pid, interface=None, arch=None):
+        """Driver entries for a device, interface-specific matches first"""
+        matches = []
+        if interface:
+            matches.extend(self.table.get(index_key(vid, pid, interface), []))
+        matches.extend(self.table.get(index_key(vid, pid), []))
+        if arch:
+            matches = [entry for entry in matches if entry["arch"] in (arch, None)]
+        return matches
+
+    def lookup_device_id(self, device_id, arch=None):
+        """Resolve a Windows DeviceID such as USB\\VID_0E8D&PID_2000\\5&1A2B..."""
+        match = HARDWARE_ID_PATTERN.search(device_id or "")
+        if not match:
+            return []
+        return self.lookup(match.group(1), match.group(2), match.group(3), arch)
+
+    def __len__(self):
+        return len(self.table)
+
+
+def build_table(package_dir, infs):
+    table = {}
+    for inf in infs:
+        relative = inf.relative_to(package_dir)
+        arch = relative.parts[0] if relative.parts[0] in ("x64", "x86") else None
+        for entry in parse_inf(inf, arch):
+            entry["inf"] = str(relative)
+            entry["signed"] = relative.parts[1:2] == ("Infs",) if len(relative.parts) > 2 else False
+            key = index_key(entry.pop("vid"), entry.pop("pid"), entry.pop("interface"))
+            bucket = table.setdefault(key, [])
+            if entry not in bucket:
+                bucket.append(entry)
+    return table
+
+
+def host_arch():
+    return "x64" if platform.machine().endswith("64") else "x86"
+
+
+_index = None
+
+
+def get_driver_index():
+    """Shared index instance, loaded on first use"""
+    global _index
+    if _index is None:
+        _index = DriverIndex.load()
+    return _index
+
+
+def main():
+    index = get_driver_index()
+    if len(sys.argv) < 2:
+        print(f"{len(index)} hardware IDs indexed from {DRIVER_PACKAGE_DIR}")
+        print("Usage: python driver_index.py <VID> <PID> [MI] | <DeviceID>")
+        return
+
+    if len(sys.argv) >= 3:
+        matches = index.lookup(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None, host_arch())
+    else:
+        matches = index.lookup_device_id(sys.argv[1], host_arch())
+
+    if not matches:
+        print("No driver in the bundled package for this device")
+    for entry in matches:
+        print(f"{entry['description']}: {entry['inf']} [{entry['install_section']}] "
+              f"{entry['driver_ver']} {'signed' if entry['signed'] else 'unsigned'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""
+Dumpsys Parser - Streaming parsers for dumpsys and service-call output
+Each parser takes one line at a time (run_command's on_line) and keeps only the typed
+fields it extracts, so multi-megabyte dumps are never buffered or regex-scanned
+"""
+
+import sys
+import time
+from command_runner import run_command
+
+UNAVAILABLE = (2147483647, -2147483648)  # CellInfo.UNAVAILABLE and its negative twin
+
+REG_STATES = {0: "IN_SERVICE", 1: "OUT_OF_SERVICE", 2: "EMERGENCY_ONLY", 3: "POWER_OFF"}
+DATA_STATES = {-1: "UNKNOWN", 0: "DISCONNECTED", 1: "CONNECTING", 2: "CONNECTED", 3: "SUSPENDED",
+               4: "DISCONNECTING"}
+CALL_STATES = {0: "IDLE", 1: "RINGING", 2: "OFFHOOK"}
+BATTERY_STATUS = {1: "unknown", 2: "charging", 3: "discharging", 4: "not_charging", 5: "full"}
+BATTERY_HEALTH = {1: "unknown", 2: "good", 3: "overheat", 4: "dead", 5: "over_voltage", 6: "failure",
+                  7: "cold"}
+
+# mLte=CellSignalStrengthLte: ... -> RAT and the field that carries its signal in dBm
+SIGNAL_RATS = {"mGsm": ("GSM", "rssi"), "mCdma": ("CDMA", "cdmaDbm"), "mWcdma": ("WCDMA", "rscp"),
+               "mTdscdma": ("TDSCDMA", "rscp"), "mLte": ("LTE", "rsrp"), "mNr": ("NR", "ssRsrp")}
+LTE_RSRP_LEVELS = (-115, -105, -95, -85)  # Android's default thresholds for levels 1-4
+
+
+def to_int(text):
+    """int, or None for non-numbers and Android's UNAVAILABLE markers"""
+    try:
+        value = int(text)
+    except (TypeError, ValueError):
+        return None
+    return None if value in UNAVAILABLE else value
+
+
+def typed(text):
+    """'true' -> True, '85' -> 85, anything else stays a string"""
+    if text == "true":
+        return True
+    if text == "false":
+        return False
+    value = to_int(text)
+    return text if value is None else value
+
+
+def split_top(text, separator=","):
+    """Split on separators that are not inside {} [] or () - one linear pass"""
+    parts, depth, start = [], 0, 0
+    for index, char in enumerate(text):
+        if char in "{[(":
+            depth += 1
+        elif char in "}])":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:index])
+            start = index + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def word_fields(text):
+    """'rssi=-67 rsrp=-95' or 'ssRsrp = -90 ssRsrq = -11' -> {name: int or None}"""
+    words = text.replace("{", " ").replace("}", " ").split()
+    fields = {}
+    index = 0
+    while index < len(words):
+        word = words[index]
+        if index + 2 < len(words) and words[index + 1] == "=":
+            fields[word] = to_int(words[index + 2])
+            index += 3
+            continue
+        name, equals, value = word.partition("=")
+        if equals and value:
+            fields[name] = to_int(value)
+        index += 1
+    return fields
+
+
+def luhn_valid(digits):
+    if not digits.isdigit():
+        return False
+    total = 0
+    for position, char in enumerate(reversed(digits)):
+        value = int(char) * (2 if position % 2 else 1)
+        total += value - 9 if value > 9 else value
+    return total % 10 == 0
+
+
+class StreamParser:
+    """feed() one line at a time, then read result() / facts()"""
+
+    service = None
+
+    def __init__(self):
+        self.lines = 0
+        self.done = False  # Set once the rest of the dump holds nothing this parser reads
+
+    def feed(self, line):
+        self.lines += 1
+        if not self.done:
+            self.parse_line(line)
+
+    def feed_text(self, text):
+        for line in text.splitlines():
+            self.feed(line)
+        return self
+
+    def parse_line(self, line):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+    def facts(self):
+        return {}
+
+
+class TelephonyRegistryParser(StreamParser):
+    """dumpsys telephony.registry: per-phone service state, signal strength and data state"""
+
+    service = "telephony.registry"
+
+    def __init__(self):
+        super().__init__()
+        self.phones = {}
+        self.phone = self.phones.setdefault(0, {})
+        self.handlers = {
+            "mCallState": self._call_state,
+            "mServiceState": self._service_state,
+            "mSignalStrength": self._signal_strength,
+            "mDataConnectionState": self._data_state,
+        }
+
+    def parse_line(self, line):
+        line = line.strip()
+        if line == "local logs:":
+            self.done = True  # Event history follows the last known state
+            return
+        if line.startswith("Phone Id="):
+            self.phone = self.phones.setdefault(to_int(line[9:]) or 0, {})
+            return
+        if not line.startswith("m"):
+            return
+        key, equals, value = line.partition("=")
+        handler = self.handlers.get(key)
+        if handler is not None and equals and key not in self.phone:
+            handler(key, value)
+
+    def _call_state(self, key, value):
+        self.phone[key] = CALL_STATES.get(to_int(value), value)
+
+    def _data_state(self, key, value):
+        self.phone[key] = DATA_STATES.get(to_int(value), value)
+
+    def _service_state(self, key, value):
+        state = {}
+        if value.startswith("{"):
+            for item in split_top(value.strip("{}")):
+                name, _, item_value = item.partition("=")
+                if name in ("mVoiceRegState", "mDataRegState"):
+                    state[name[1:-8].lower()] = REG_STATES.get(to_int(item_value.partition("(")[0]), item_value)
+                elif name == "mOperatorAlphaLong":
+                    state["operator"] = "" if item_value == "null" else item_value
+                elif name == "isEmergencyOnly":
+                    state["emergency_only"] = item_value == "true"
+        else:
+            # Pre-Android 10: "0 0 voice home data home Operator ..."
+            words = value.split()
+            if len(words) >= 2:
+                state["voice"] = REG_STATES.get(to_int(words[0]), words[0])
+                state["data"] = REG_STATES.get(to_int(words[1]), words[1])
+        self.phone[key] = state
+
+    def _signal_strength(self, key, value):
+        if value.startswith("SignalStrength:{"):
+            self.phone[key] = self._modern_signal(value[16:].rstrip("}"))
+        elif value.startswith("SignalStrength:"):
+            self.phone[key] = self._legacy_signal(value[15:].split())
+
+    @staticmethod
+    def _modern_signal(body):
+        cells, primary = {}, None
+        for item in split_top(body):
+            name, _, item_value = item.partition("=")
+            if name == "primary":
+                primary = item_value
+            elif name in SIGNAL_RATS and item_value != "Invalid":
+                rat, dbm_field = SIGNAL_RATS[name]
+                fields = word_fields(item_value.partition(":")[2])
+                cells[rat] = {"rat": rat, "dbm": fields.get(dbm_field), "level": fields.get("level"),
+                              "fields": fields}
+        if not cells:
+            return {"rat": None, "dbm": None, "level": 0, "fields": {}}
+        for cell in cells.values():
+            if primary == "CellSignalStrength" + cell["rat"].capitalize():
+                return cell
+        return max(cells.values(), key=lambda cell: cell["level"] or 0)
+
+    @staticmethod
+    def _legacy_signal(words):
+        # gsmSignalStrength gsmBitErrorRate cdmaDbm cdmaEcio evdoDbm evdoEcio evdoSnr
+        # lteSignalStrength lteRsrp lteRsrq lteRssnr lteCqi ...
+        values = [to_int(word) for word in words]
+        rsrp = values[8] if len(values) > 8 else None
+        if rsrp is not None and -140 <= rsrp <= -44:
+            level = sum(rsrp >= threshold for threshold in LTE_RSRP_LEVELS)
+            return {"rat": "LTE", "dbm": rsrp, "level": level, "fields": {"rsrp": rsrp}}
+        asu = values[0] if values else None
+        if asu is None or asu == 99:
+            return {"rat": None, "dbm": None, "level": 0, "fields": {}}
+        level = 4 if asu >= 12 else 3 if asu >= 8 else 2 if asu >= 5 else 1 if asu > 0 else 0
+        return {"rat": "GSM", "dbm": -113 + 2 * asu, "level": level, "fields": {"asu": asu}}
+
+    def result(self):
+        return {phone_id: dict(phone) for phone_id, phone in sorted(self.phones.items()) if phone}
+
+    def facts(self):
+        """The phone with the strongest signal, as flat analyzer facts"""
+        phones = [phone for phone in self.result().values() if "mSignalStrength" in phone or "mServiceState" in phone]
+        if not phones:
+            return {}
+        phone = max(phones, key=lambda p: (p.get("mSignalStrength") or {}).get("level") or 0)
+        signal = phone.get("mSignalStrength") or {}
+        service = phone.get("mServiceState") or {}
+        facts = {
+            "signal_rat": signal.get("rat"),
+            "signal_dbm": signal.get("dbm"),
+            "signal_level": signal.get("level"),
+            "voice_reg_state": service.get("voice"),
+            "data_reg_state": service.get("data"),
+            "data_connection": phone.get("mDataConnectionState"),
+        }
+        if signal:
+            facts["signal_strength"] = (f"{signal['rat']} {signal['dbm']} dBm (level {signal['level']})"
+                                        if signal.get("rat") else "no signal")
+        return {key: value for key, value in facts.items() if value is not None}
+
+
+class BatteryParser(StreamParser):
+    """dumpsys battery: 'key: value' lines of the battery service state"""
+
+    service = "battery"
+
+    def __init__(self):
+        super().__init__()
+        self.values = {}
+
+    def parse_line(self, line):
+        if not line.startswith("  "):
+            self.done = bool(self.values)  # Next section (battery history) after the state block
+            return
+        if line.startswith("   "):
+            return  # Only the service state's own two-space-indented fields
+        key, colon, value = line.strip().partition(": ")
+        if colon:
+            self.values.setdefault(key.lower().replace(" ", "_"), typed(value.strip()))
+
+    def result(self):
+        values = dict(self.values)
+        if isinstance(values.get("temperature"), int):
+            values["temperature_c"] = values["temperature"] / 10
+        if "status" in values:
+            values["status"] = BATTERY_STATUS.get(values["status"], values["status"])
+        if "health" in values:
+            values["health"] = BATTERY_HEALTH.get(values["health"], values["health"])
+        return values
+
+    def facts(self):
+        values = self.result()
+        if "level" not in values:
+            return {}
+        scale = values.get("scale") or 100
+        charger = next((name for name in ("ac", "usb", "wireless", "dock") if values.get(f"{name}_powered") is True),
+                       "none")
+        facts = {
+            "battery_level": round(values["level"] * 100 / scale),
+            "battery_status": values.get("status"),
+            "battery_health": values.get("health"),
+            "battery_temp_c": values.get("temperature_c"),
+            "battery_voltage_mv": values.get("voltage"),
+            "charger": charger,
+        }
+        return {key: value for key, value in facts.items() if value is not None}
+
+
+class ConnectivityParser(StreamParser):
+    """dumpsys connectivity: the default network and each connected network's transports"""
+
+    service = "connectivity"
+
+    def __init__(self):
+        super().__init__()
+        self.default = None
+        self.networks = {}
+
+    def parse_line(self, line):
+        line = line.strip()
+        if line.startswith("Active default network: "):
+            self.default = to_int(line[24:])
+        elif line.startswith("NetworkAgentInfo{"):
+            network = self._network(line)
+            if network["id"] is not None:
+                self.networks.setdefault(network["id"], network)
+
+    @staticmethod
+    def _between(line, start, end):
+        begin = line.find(start)
+        if begin < 0:
+            return ""
+        begin += len(start)
+        stop = line.find(end, begin)
+        return line[begin:stop if stop >= 0 else len(line)]
+
+    def _network(self, line):
+        info = self._between(line, "ni{", "}").lstrip("[")
+        kind = info[6:].split(",")[0].strip() if info.startswith("type: ") else info.split(" ")[0]
+        capabilities = self._between(line, "Capabilities: ", " ").split("&")
+        return {
+            "id": to_int(self._between(line, "network{", "}")),
+            "type": kind,
+            "transports": [t for t in self._between(line, "Transports: ", " ").split("|") if t],
+            "validated": "VALIDATED" in capabilities,
+            "internet": "INTERNET" in capabilities,
+        }
+
+    def result(self):
+        return {"default": self.default, "networks": list(self.networks.values())}
+
+    def facts(self):
+        default = self.networks.get(self.default)
+        if default is None:
+            return {"default_network": "none"} if self.lines else {}
+        return {
+            "default_network": default["type"],
+            "default_transport": "|".join(default["transports"]),
+            "internet_validated": default["validated"],
+        }
+
+
+class ParcelParser(StreamParser):
+    """`service call` output: the Parcel hex dump decoded to int32 words, then typed reads"""
+
+    def __init__(self):
+        super().__init__()
+        self.words = []
+
+    def parse_line(self, line):
+        line = line.strip()
+        if line.startswith("Result: Parcel("):
+            line = line[15:]
+        if line.startswith("0x"):
+            line = line.partition(": ")[2]
+        quote = line.find("'")
+        for word in (line[:quote] if quote >= 0 else line).split():
+            if len(word) == 8:
+                try:
+                    self.words.append(int(word, 16))
+                except ValueError:
+                    return
+
+    def data(self):
+        return b"".join(word.to_bytes(4, "little") for word in self.words)
+
+    def int32(self, index):
+        if index >= len(self.words):
+            return None
+        word = self.words[index]
+        return word - (1 << 32) if word & 0x80000000 else word
+
+    def string16(self, index):
+        """UTF-16 string starting at word index (length prefix, -1 = null)"""
+        length = self.int32(index)
+        if length is None or length < 0:
+            return None
+        start = (index + 1) * 4
+        return self.data()[start:start + length * 2].decode("utf-16-le", errors="replace")
+
+    def result(self):
+        """Exception code, and the string reply (or the exception message)"""
+        exception = self.int32(0)
+        return {"exception": exception, "value": self.string16(1) if exception is not None else None}
+
+    def facts(self):
+        """For iphonesubinfo calls: the IMEI when the reply is a valid one"""
+        reply = self.result()
+        if reply["exception"] != 0:
+            return {"imei_error": reply["value"] or "no reply"}
+        value = reply["value"] or ""
+        if len(value) == 15 and luhn_valid(value):
+            return {"imei": value}
+        return {"imei_error": f"not an IMEI: {value!r}"}
+
+
+PARSERS = {parser.service: parser for parser in (TelephonyRegistryParser, BatteryParser, ConnectivityParser)}
+
+
+def adb_shell(serial, *args):
+    return ["adb"] + (["-s", serial] if serial else []) + ["shell"] + list(args)
+
+
+def dumpsys(service, serial=None, timeout=60):
+    """Stream `dumpsys <service>` straight into its parser"""
+    parser = PARSERS[service]()
+    run_command(adb_shell(serial, "dumpsys", service), timeout=timeout, on_line=parser.feed, capture=False)
+    return parser
+
+
+def service_call(command, serial=None, timeout=15):
+    """Run a `service call ...` probe and decode its Parcel"""
+    parser = ParcelParser()
+    run_command(adb_shell(serial, *command.split()), timeout=timeout, on_line=parser.feed, capture=False)
+    return parser
+
+
+def parcel_dump(words):
+    """Format int32 words the way `service call` prints them"""
+    lines = []
+    for offset in range(0, len(words), 4):
+        chunk = words[offset:offset + 4]
+        data = b"".join(word.to_bytes(4, "little") for word in chunk)
+        text = "".join(chr(byte) if 32 <= byte < 127 else "." for byte in data)
+        prefix = "Result: Parcel(" if offset == 0 else "  "
+        suffix = "')" if offset + 4 >= len(words) else "'"
+        lines.append(f"{prefix}0x{offset * 4:08x}: {' '.join(f'{w:08x}' for w in chunk):<35} '{text:<16}{suffix}")
+    return "\n".join(lines)
+
+
+def string_parcel(value, exception=0):
+    """int32 words of a Parcel holding an exception code and a UTF-16 string"""
+    data = value.encode("utf-16-le") + b"\x00\x00"
+    data += b"\x00" * (-len(data) % 4)
+    return [exception & 0xFFFFFFFF, len(value)] + [int.from_bytes(data[i:i + 4], "little")
+                                                   for i in range(0, len(data), 4)]
+
+
+def sample_dump(service, size_mb=8):
+    """A dumpsys-shaped text of roughly size_mb, padded with history like real devices"""
+    if service == "telephony.registry":
+        head = [
+            "last known state:",
+            "  Phone Id=0",
+            "  mCallState=0",
+            "  mServiceState={mVoiceRegState=0(IN_SERVICE), mDataRegState=0(IN_SERVICE), mChannelNumber=1300,"
+            " mOperatorAlphaLong=Telia, mOperatorAlphaShort=Telia, isEmergencyOnly=false, mIsManualNetworkSelection=false}",
+            "  mSignalStrength=SignalStrength:{mCdma=Invalid,mGsm=Invalid,mWcdma=Invalid,mTdscdma=Invalid,"
+            "mLte=CellSignalStrengthLte: rssi=-67 rsrp=-95 rsrq=-11 rssnr=2147483647 cqi=2147483647 ta=2147483647"
+            " level=3 parametersUseForLevel=0,mNr=Invalid,primary=CellSignalStrengthLte,voiceRAT=13}",
+            "  mDataConnectionState=2",
+            "  Phone Id=1",
+            "  mServiceState={mVoiceRegState=1(OUT_OF_SERVICE), mDataRegState=1(OUT_OF_SERVICE), mOperatorAlphaLong=null}",
+            "  mSignalStrength=SignalStrength:{mCdma=Invalid,mGsm=Invalid,mWcdma=Invalid,mTdscdma=Invalid,"
+            "mLte=Invalid,mNr=Invalid,primary=CellSignalStrengthLte}",
+            "local logs:",
+        ]
+        filler = ("  2024-06-01 12:00:00.000 notifySignalStrength: subId=1 phoneId=0 ss=SignalStrength:{mLte="
+                  "CellSignalStrengthLte: rssi=-69 rsrp=-97 rsrq=-12 level=3}")
+    elif service == "battery":
+        head = ["Current Battery Service state:", "  AC powered: false", "  USB powered: true",
+                "  Wireless powered: false", "  Max charging current: 500000", "  status: 2", "  health: 2",
+                "  present: true", "  level: 85", "  scale: 100", "  voltage: 4203", "  temperature: 312",
+                "  technology: Li-ion", "Battery history:"]
+        filler = "    +1h02m03s004ms (2) 085 c0900020 status=charging health=good plug=usb temp=312 volt=4203"
+    else:
+        head = [
+            "Active default network: 100",
+            "Current Networks:",
+            "  NetworkAgentInfo{network{100}  handle{432902426637}  ni{MOBILE[LTE] CONNECTED extra: internet}"
+            "  created{2024-06-01T12:00:00Z}  nc{[ Transports: CELLULAR Capabilities: MMS&SUPL&INTERNET&NOT_RESTRICTED"
+            "&TRUSTED&NOT_VPN&VALIDATED&NOT_ROAMING LinkUpBandwidth>=51200Kbps ]}  score{...}}",
+            "  NetworkAgentInfo{network{101}  handle{437197393933}  ni{WIFI CONNECTED}"
+            "  nc{[ Transports: WIFI Capabilities: INTERNET&NOT_RESTRICTED&TRUSTED&NOT_VPN ]}}",
+            "Network Requests:",
+        ]
+        filler = ("  NetworkRequest [ REQUEST id=1, [ Capabilities: INTERNET&NOT_RESTRICTED&TRUSTED&NOT_VPN "
+                  "Uid: 1000 RequestorUid: 1000 RequestorPkg: android UnderlyingNetworks: Null] ]")
+    text = "\n".join(head) + "\n"
+    repeat = max(1, (size_mb * 1024 * 1024 - len(text)) // (len(filler) + 1))
+    return text + "\n".join([filler] * repeat) + "\n"
+
+
+def benchmark(size_mb=8):
+    """Streaming parse vs buffering the dump and regex-scanning it, per service"""
+    import re
+    import tracemalloc
+
+    patterns = {"telephony.registry": re.compile(r"^\s*(m\w+)=(.*)$", re.M),
+                "battery": re.compile(r"^\s+([\w ]+): (.*)$", re.M),
+                "connectivity": re.compile(r"^\s*NetworkAgentInfo\{network\{(\d+)\}.*Transports: (\S+).*$", re.M)}
+    print(f"{size_mb} MB dumps")
+    for service, parser_class in PARSERS.items():
+        text = sample_dump(service, size_mb)
+        lines = text.splitlines()
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        parser = parser_class()
+        for line in lines:  # Lines arrive one at a time from run_command
+            parser.feed(line)
+        facts = parser.facts()
+        streamed = time.perf_counter() - started
+        stream_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        buffered = "\n".join(lines)  # What capture=True + a regex over stdout costs
+        matches = patterns[service].findall(buffered)
+        regexed = time.perf_counter() - started
+        regex_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        mb = len(text) / 1e6
+        print(f"{service:<20} stream {mb / streamed:7.1f} MB/s peak {stream_peak / 1e6:6.2f} MB | "
+              f"buffer+regex {mb / regexed:7.1f} MB/s peak {regex_peak / 1e6:6.2f} MB ({len(matches)} matches)")
+        print(f"{'':<20} {facts}")
+
+    parcel = ParcelParser().feed_text(parcel_dump(string_parcel("490154203237518")))
+    print(f"{'iphonesubinfo':<20} {parcel.facts()}")
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 8)
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] in PARSERS:
+        parser = dumpsys(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+        print(parser.result())
+        print(parser.facts())
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] == "imei":
+        print(service_call("service call iphonesubinfo 1", sys.argv[2] if len(sys.argv) > 2 else None).facts())
+        return
+    print(f"Usage: python dumpsys_parser.py [{'|'.join(PARSERS)}|imei] [serial] | bench [mb]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+"""
+EDL Client - Native Qualcomm Emergency Download (05c6:9008) path
+Sahara handshake and programmer upload, then Firehose reads and writes with
+raw payloads sized to the maximum the programmer negotiates
+"""
+
+import sys
+import time
+import struct
+import threading
+from pathlib import Path
+import xml.etree.ElementTree as ET
+from serial_port import TransportClosed, find_ports, open_port, socket_pair, pty_pair
+
+EDL_VID_PID = ("05C6", "9008")
+EDL_PORT_NAMES = ["QDLoader 9008", "Qualcomm HS-USB QDLoader", "VID_05C6&PID_9008"]
+
+# Sahara commands
+SAHARA_HELLO = 0x01
+SAHARA_HELLO_RESP = 0x02
+SAHARA_READ_DATA = 0x03
+SAHARA_END_IMAGE_TX = 0x04
+SAHARA_DONE = 0x05
+SAHARA_DONE_RESP = 0x06
+SAHARA_RESET = 0x07
+SAHARA_READ_DATA_64 = 0x12
+SAHARA_MODE_IMAGE_TX_PENDING = 0x0
+SAHARA_VERSION = 2
+
+SAHARA_HEADER = struct.Struct("<II")
+SAHARA_HELLO_BODY = struct.Struct("<IIII24x")      # version, supported, max cmd len, mode
+SAHARA_HELLO_RESP_BODY = struct.Struct("<IIII24x")  # version, supported, status, mode
+SAHARA_READ_BODY = struct.Struct("<III")
+SAHARA_READ64_BODY = struct.Struct("<QQQ")
+SAHARA_END_BODY = struct.Struct("<II")
+SAHARA_DONE_RESP_BODY = struct.Struct("<I")
+
+SECTOR_SIZE = 512
+SECTOR_SIZES = {"emmc": 512, "ufs": 4096}  # Logical block size per MemoryName
+DEFAULT_MAX_PAYLOAD = 1024 * 1024
+XML_HEADER = b'<?xml version="1.0" encoding="UTF-8" ?>'
+DOCUMENT_END = b"</data>"
+
+GPT_HEADER = struct.Struct("<8sIII4xQQQQ16sQIII")
+GPT_ENTRY = struct.Struct("<16s16sQQQ72s")
+
+
+class SaharaError(Exception):
+    pass
+
+
+class FirehoseError(Exception):
+    pass
+
+
+def sahara_packet(command, body=b""):
+    return SAHARA_HEADER.pack(command, SAHARA_HEADER.size + len(body)) + body
+
+
+def read_sahara_packet(transport, timeout=5.0):
+    command, length = SAHARA_HEADER.unpack(transport.read_exact(SAHARA_HEADER.size, timeout))
+    if length < SAHARA_HEADER.size:
+        raise SaharaError(f"Bad Sahara packet length {length} for command {command:#x}")
+    body = transport.read_exact(length - SAHARA_HEADER.size, timeout) if length > SAHARA_HEADER.size else b""
+    return command, body
+
+
+class SaharaClient:
+    """Host side of Sahara: answer HELLO, then serve the programmer image on request"""
+
+    def __init__(self, transport, timeout=5.0):
+        self.transport = transport
+        self.timeout = timeout
+        self.hello = None
+
+    def handshake(self):
+        command, body = read_sahara_packet(self.transport, self.timeout)
+        if command != SAHARA_HELLO:
+            raise SaharaError(f"Expected Sahara HELLO, got command {command:#x} (device already in Firehose?)")
+        version, supported, max_command, mode = SAHARA_HELLO_BODY.unpack(body[:SAHARA_HELLO_BODY.size])
+        self.hello = {"version": version, "version_supported": supported,
+                      "max_command_length": max_command, "mode": mode}
+        self.transport.write(sahara_packet(SAHARA_HELLO_RESP, SAHARA_HELLO_RESP_BODY.pack(
+            SAHARA_VERSION, 1, 0, SAHARA_MODE_IMAGE_TX_PENDING)))
+        return self.hello
+
+    def upload(self, programmer):
+        """Serve READ_DATA requests from the programmer image until the device takes it"""
+        view = memoryview(programmer)
+        served = 0
+        while True:
+            command, body = read_sahara_packet(self.transport, self.timeout)
+            if command == SAHARA_READ_DATA:
+                _, offset, length = SAHARA_READ_BODY.unpack(body)
+            elif command == SAHARA_READ_DATA_64:
+                _, offset, length = SAHARA_READ64_BODY.unpack(body)
+            elif command == SAHARA_END_IMAGE_TX:
+                image_id, status = SAHARA_END_BODY.unpack(body)
+                if status != 0:
+                    raise SaharaError(f"Device rejected the programmer (image {image_id}, status {status:#x})")
+                self.transport.write(sahara_packet(SAHARA_DONE))
+                command, body = read_sahara_packet(self.transport, self.timeout)
+                if command != SAHARA_DONE_RESP:
+                    raise SaharaError(f"Expected DONE_RESP, got {command:#x}")
+                return served
+            else:
+                raise SaharaError(f"Unexpected Sahara command {command:#x} during upload")
+
+            if offset + length > len(view):
+                raise SaharaError(f"Device asked for {length} bytes at {offset}, programmer is {len(view)}")
+            self.transport.write(view[offset:offset + length])
+            served += length
+
+
+class FirehoseClient:
+    """Firehose XML commands; raw data moves in max-payload sized writes"""
+
+    def __init__(self, transport, memory="emmc", sector_size=None,
+                 max_payload=DEFAULT_MAX_PAYLOAD, timeout=10.0):
+        self.transport = transport
+        self.memory = memory
+        self.sector_size = sector_size or SECTOR_SIZES.get(memory.lower(), SECTOR_SIZE)
+        self.max_payload = max_payload
+        self.timeout = timeout
+        self.buffer = bytearray()
+        self.logs = []
+
+    def _send(self, tag, **attributes):
+        attrs = " ".join(f'{key}="{value}"' for key, value in attributes.items())
+        self.transport.write(XML_HEADER + f"<data><{tag} {attrs} /></data>".encode())
+
+    def _fill(self, deadline):
+        data = self.transport.read(1024 * 1024, max(0.0, deadline - time.monotonic()))
+        if not data and time.monotonic() >= deadline:
+            raise FirehoseError("Timed out waiting for the programmer")
+        self.buffer += data
+
+    def _document(self, deadline):
+        while True:
+            end = self.buffer.find(DOCUMENT_END)
+            if end >= 0:
+                end += len(DOCUMENT_END)
+                document = bytes(self.buffer[:end])
+                del self.buffer[:end]
+                return ET.fromstring(document[document.find(b"<data"):])
+            self._fill(deadline)
+
+    def response(self):
+        """Next <response>, collecting <log> lines on the way"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            for element in self._document(deadline):
+                if element.tag == "log":
+                    self.logs.append(element.get("value", ""))
+                elif element.tag == "response":
+                    return element
+
+    def _expect_ack(self, what):
+        element = self.response()
+        if element.get("value") != "ACK":
+            raise FirehoseError(f"{what} failed: {element.attrib} {self.logs[-1:] or ''}")
+        return element
+
+    def read_raw(self, size):
+        """Raw bytes following a rawmode ACK; drains what the XML reader over-read first"""
+        deadline = time.monotonic() + self.timeout
+        if len(self.buffer) >= size:
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            return data
+        parts = [bytes(self.buffer)]
+        remaining = size - len(self.buffer)
+        self.buffer.clear()
+        while remaining:
+            data = self.transport.read(remaining, max(0.0, deadline - time.monotonic()))
+            if not data:
+                if time.monotonic() >= deadline:
+                    raise FirehoseError(f"Timed out with {remaining} raw bytes outstanding")
+                continue
+            parts.append(data)
+            remaining -= len(data)
+            deadline = time.monotonic() + self.timeout
+        return b"".join(parts)
+
+    def configure(self):
+        """Negotiate the payload size; a NAK carries the largest the programmer accepts"""
+        for _ in range(2):
+            self._send("configure", MemoryName=self.memory, MaxPayloadSizeToTargetInBytes=self.max_payload,
+                       ZlpAwareHost=1, SkipStorageInit=0, Verbose=0)
+            element = self.response()
+            supported = int(element.get("MaxPayloadSizeToTargetInBytesSupported") or self.max_payload)
+            if element.get("value") == "ACK":
+                self.max_payload = int(element.get("MaxPayloadSizeToTargetInBytes") or self.max_payload)
+                return self.max_payload
+            self.max_payload = min(self.max_payload, supported)
+        raise FirehoseError(f"configure rejected: {element.attrib}")
+
+    def nop(self):
+        self._send("nop")
+        return self._expect_ack("nop")
+
+    def read(self, start_sector, sectors, out=None, partition=0):
+        """Read sectors; streams into out.write() when given, else returns the bytes"""
+        self._send("read", SECTOR_SIZE_IN_BYTES=self.sector_size, num_partition_sectors=sectors,
+                   physical_partition_number=partition, start_sector=start_sector)
+        self._expect_ack("read")
+        remaining = sectors * self.sector_size
+        parts = [] if out is None else None
+        while remaining:
+            data = self.read_raw(min(self.max_payload, remaining))
+            remaining -= len(data)
+            if out is None:
+                parts.append(data)
+            else:
+                out.write(data)
+        self._expect_ack("read completion")
+        return b"".join(parts) if out is None else sectors * self.sector_size
+
+    def program(self, start_sector, data, partition=0):
+        """Write data (padded to whole sectors) as back-to-back max-payload writes"""
+        padding = -len(data) % self.sector_size
+        view = memoryview(bytes(data) + bytes(padding) if padding else data)
+        sectors = len(view) // self.sector_size
+        self._send("program", SECTOR_SIZE_IN_BYTES=self.sector_size, num_partition_sectors=sectors,
+                   physical_partition_number=partition, start_sector=start_sector)
+        self._expect_ack("program")
+        for offset in range(0, len(view), self.max_payload):
+            self.transport.write(view[offset:offset + self.max_payload])
+        self._expect_ack("program completion")
+        return sectors
+
+    def reset(self):
+        self._send("power", value="reset")
+        return self._expect_ack("reset")
+
+    def partitions(self, partition=0):
+        """GPT partition table: {name: (first_sector, sectors)}"""
+        header = self.read(1, 1, partition=partition)
+        (signature, _, _, _, _, _, _, _, _, entries_lba, count, entry_size, _) = GPT_HEADER.unpack_from(header)
+        if signature != b"EFI PART":
+            raise FirehoseError("No GPT found on the device")
+        table_sectors = -(-count * entry_size // self.sector_size)
+        table = self.read(entries_lba, table_sectors, partition=partition)
+        result = {}
+        for i in range(count):
+            type_guid, _, first, last, _, raw_name = GPT_ENTRY.unpack_from(table, i * entry_size)
+            if type_guid == bytes(16):
+                continue
+            name = raw_name.decode("utf-16-le").rstrip("\x00")
+            result[name] = (first, last - first + 1)
+        return result
+
+
+class FirehoseStream:
+    """File-like sequential reader over a sector range (feeds partition_backup)"""
+
+    def __init__(self, client, first_sector, sectors, partition=0):
+        self.client = client
+        self.next_sector = first_sector
+        self.remaining = sectors
+        self.partition = partition
+
+    def read(self, size=-1):
+        if self.remaining == 0:
+            return b""
+        sector_size = self.client.sector_size
+        sectors = self.remaining if size < 0 else max(1, min(self.remaining, size // sector_size))
+        data = self.client.read(self.next_sector, sectors, partition=self.partition)
+        self.next_sector += sectors
+        self.remaining -= sectors
+        return data
+
+    def close(self):
+        pass
+
+
+class EdlDevice:
+    """partition_backup device source backed by Firehose reads"""
+
+    def __init__(self, client, serial="edl"):
+        self.client = client
+        self.serial = serial
+        self.table = None
+
+    def partitions(self):
+        if self.table is None:
+            self.table = self.client.partitions()
+        return {name: sectors * self.client.sector_size for name, (_, sectors) in self.table.items()}
+
+    def open(self, name):
+        self.partitions()
+        first, sectors = self.table[name]
+        return FirehoseStream(self.client, first, sectors)
+
+
+def find_programmer(*directories):
+    """Firehose programmer (prog_*.elf / *.mbn) shipped with the firmware"""
+    for directory in directories:
+        directory = Path(directory)
+        if not directory.exists():
+            continue
+        for pattern in ("prog_*firehose*.elf", "prog_*.elf", "prog_*.mbn", "*firehose*.mbn"):
+            matches = sorted(directory.rglob(pattern))
+            if matches:
+                return matches[0]
+    return None
+
+
+def connect(transport, programmer, log=print, memory="emmc"):
+    """Sahara handshake + programmer upload, then configure Firehose for the given storage"""
+    sahara = SaharaClient(transport)
+    hello = sahara.handshake()
+    log(f"Sahara HELLO: version {hello['version']}, mode {hello['mode']}")
+    sent = sahara.upload(programmer)
+    log(f"Programmer uploaded ({sent} bytes)")
+    firehose = FirehoseClient(transport, memory=memory)
+    payload = firehose.configure()
+    log(f"Firehose ready, max payload {payload} bytes")
+    return firehose
+
+
+def connect_port(programmer_path, port=None, log=print, memory="emmc"):
+    """Open the 9008 COM port (auto-detected unless given) and bring up Firehose"""
+    if port is None:
+        ports = find_ports(EDL_PORT_NAMES)
+        if not ports:
+            raise SaharaError("No Qualcomm 9008 port found")
+        port = ports[0]
+    log(f"EDL device on {port}")
+    return connect(open_port(port), Path(programmer_path).read_bytes(), log, memory)
+
+
+class SimulatedEdlDevice:
+    """Sahara + Firehose target over a transport, backed by an in-memory disk"""
+
+    def __init__(self, transport, disk_size=64 * 1024 * 1024, programmer_size=None,
+                 max_payload_supported=DEFAULT_MAX_PAYLOAD, sector_size=SECTOR_SIZE, request_size=0x10000):
+        self.transport = transport
+        self.disk = bytearray(disk_size)
+        self.programmer_size = programmer_size
+        self.max_payload_supported = max_payload_supported
+        self.max_payload = 4096
+        self.sector_size = sector_size
+        self.request_size = request_size
+        self.buffer = bytearray()
+        self.thread = None
+        self.error = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="sim-edl", daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self._sahara()
+            self._firehose()
+        except Exception as e:
+            self.error = e
+
+    def _sahara(self):
+        self.transport.write(sahara_packet(SAHARA_HELLO, SAHARA_HELLO_BODY.pack(SAHARA_VERSION, 1, 0x400, 0)))
+        command, _ = read_sahara_packet(self.transport, None)
+        if command != SAHARA_HELLO_RESP:
+            raise SaharaError("Host did not answer HELLO")
+        received = bytearray()
+        while len(received) < self.programmer_size:
+            length = min(self.request_size, self.programmer_size - len(received))
+            self.transport.write(sahara_packet(SAHARA_READ_DATA, SAHARA_READ_BODY.pack(13, len(received), length)))
+            received += self.transport.read_exact(length, None)
+        status = 0 if received[:4] == b"\x7fELF" else 0x0B
+        self.transport.write(sahara_packet(SAHARA_END_IMAGE_TX, SAHARA_END_BODY.pack(13, status)))
+        if status:
+            return
+        command, _ = read_sahara_packet(self.transport, None)
+        self.transport.write(sahara_packet(SAHARA_DONE_RESP, SAHARA_DONE_RESP_BODY.pack(0)))
+
+    def _respond(self, value, log=None, **attributes):
+        body = f'<log value="{log}" />' if log else ""
+        attrs = "".join(f' {key}="{item}"' for key, item in attributes.items())
+        self.transport.write(XML_HEADER + f'<data>{body}<response value="{value}"{attrs} /></data>'.encode())
+
+    def _command(self):
+        while True:
+            end = self.buffer.find(DOCUMENT_END)
+            if end >= 0:
+                end += len(DOCUMENT_END)
+                document = bytes(self.buffer[:end])
+                del self.buffer[:end]
+                return ET.fromstring(document[document.find(b"<data"):])[0]
+            data = self.transport.read(1024 * 1024, None)
+            if not data:
+                raise EOFError
+            self.buffer += data
+
+    def _raw(self, size):
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        if len(data) < size:
+            data += self.transport.read_exact(size - len(data), None)
+        return data
+
+    def _firehose(self):
+        while True:
+            try:
+                element = self._command()
+            except (EOFError, TransportClosed):
+                return
+            tag = element.tag
+            if tag == "configure":
+                requested = int(element.get("MaxPayloadSizeToTargetInBytes"))
+                if requested > self.max_payload_supported:
+                    self._respond("NAK", log="payload too large",
+                                  MaxPayloadSizeToTargetInBytesSupported=self.max_payload_supported)
+                    continue
+                self.max_payload = requested
+                self._respond("ACK", MaxPayloadSizeToTargetInBytes=requested,
+                              MaxPayloadSizeToTargetInBytesSupported=self.max_payload_supported)
+            elif tag in ("read", "program"):
+                start = int(element.get("start_sector")) * self.sector_size
+                size = int(element.get("num_partition_sectors")) * self.sector_size
+                if int(element.get("SECTOR_SIZE_IN_BYTES")) != self.sector_size:
+                    self._respond("NAK", log=f"sector size is {self.sector_size}")
+                    continue
+                if start + size > len(self.disk):
+                    self._respond("NAK", log="sector range beyond end of disk")
+                    continue
+                self._respond("ACK", rawmode="true")
+                if tag == "read":
+                    view = memoryview(self.disk)
+                    for offset in range(start, start + size, self.max_payload):
+                        self.transport.write(view[offset:min(offset + self.max_payload, start + size)])
+                else:
+                    for offset in range(start, start + size, self.max_payload):
+                        chunk = min(self.max_payload, start + size - offset)
+                        self.disk[offset:offset + chunk] = self._raw(chunk)
+                self._respond("ACK", rawmode="false")
+            elif tag == "power":
+                self._respond("ACK")
+                return
+            else:
+                self._respond("ACK")
+
+    def write_gpt(self, partitions):
+        """Lay out a GPT: partitions is [(name, sectors)], allocated from sector 34"""
+        entry_size, count = 128, 128
+        table = bytearray(entry_size * count)
+        first = 34
+        for i, (name, sectors) in enumerate(partitions):
+            GPT_ENTRY.pack_into(table, i * entry_size, b"\x01" * 16, struct.pack("<I", i + 1) * 4,
+                                first, first + sectors - 1, 0, name.encode("utf-16-le").ljust(72, b"\x00"))
+            first += sectors
+        header = GPT_HEADER.pack(b"EFI PART", 0x10000, 92, 0, 1, len(self.disk) // self.sector_size - 1,
+                                 34, first - 1, bytes(16), 2, count, entry_size, 0)
+        self.disk[self.sector_size:self.sector_size + len(header)] = header
+        self.disk[2 * self.sector_size:2 * self.sector_size + len(table)] = table
+
+
+def simulated_session(transport_pair=socket_pair, disk_size=64 * 1024 * 1024, log=lambda message: None,
+                      memory="emmc"):
+    """A connected FirehoseClient talking to a fresh simulated device"""
+    host, target = transport_pair()
+    programmer = b"\x7fELF" + bytes(300 * 1024)
+    sector_size = SECTOR_SIZES[memory]
+    device = SimulatedEdlDevice(target, disk_size=disk_size, programmer_size=len(programmer),
+                                sector_size=sector_size).start()
+    mb = 1024 * 1024 // sector_size
+    device.write_gpt([("boot", 8 * mb), ("system", 32 * mb), ("userdata", 16 * mb)])
+    return connect(host, programmer, log, memory), device
+
+
+def benchmark(megabytes=32):
+    """Firehose throughput over pty and socketpair, small vs negotiated payloads"""
+    size = megabytes * 1024 * 1024
+    data = bytes(range(256)) * (size // 256)
+    for label, pair in (("socketpair", socket_pair), ("pty", pty_pair)):
+        for payload in (4096, DEFAULT_MAX_PAYLOAD):
+            client, device = simulated_session(pair, disk_size=size + 1024 * 1024)
+            client.max_payload = payload
+            client.configure()
+
+            started = time.perf_counter()
+            client.program(2048, data)
+            write = time.perf_counter() - started
+            started = time.perf_counter()
+            back = client.read(2048, size // SECTOR_SIZE)
+            read = time.perf_counter() - started
+            assert back == data, "read-back mismatch"
+            client.reset()
+            print(f"{label:<11} payload {payload:>8}: write {size / write / 1e6:7.1f} MB/s, "
+                  f"read {size / read / 1e6:7.1f} MB/s")
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 32)
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] == "simulate":
+        client, _ = simulated_session(log=print)
+        for name, (first, sectors) in client.partitions().items():
+            print(f"  {name:<10} start {first:>8} sectors {sectors:>8}")
+        client.reset()
+        return
+    if len(sys.argv) >= 3 and sys.argv[1] == "info":
+        client = connect_port(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        for name, (first, sectors) in client.partitions().items():
+            print(f"  {name:<16} start {first:>10} size {sectors * client.sector_size / 1e6:10.1f} MB")
+        return
+    print("Usage: python edl_client.py info <programmer.elf> [COMx]")
+    print("       python edl_client.py simulate")
+    print("       python edl_client.py bench [megabytes]")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,30 @@
 #!/usr/bin/env python3
 """
-Emergency Recovery Tool for Nokia G11
+Emergency Recovery Tool for Nokia G11 / G50
 Last resort recovery methods for severely bricked devices
 """
 
 import os
 import sys
-import time
-import subprocess
 from pathlib import Path
+from command_runner import powershell
+from device_profiles import get_database
+from script_templates import get_generator, profile_context
+from poll_scheduler import poll_until
+from battery_watch import watch_interactive
+from edl_client import EDL_VID_PID, find_programmer, connect_port as edl_connect_port, SaharaError, FirehoseError
+from serial_port import TransportClosed, TransportTimeout
+
+PLUGIN_MANIFEST = {
+    "description": "Last-resort recovery: deep flash, test point, EDL, battery drain",
+    "models": ["Nokia G11", "Nokia G50"],
+    "capabilities": {"emergency": "main"},
+}
 
 class EmergencyRecovery:
-    def __init__(self):
+    def __init__(self, model="Nokia G11"):
         self.working_dir = Path(__file__).parent
+        self.profile = get_database().by_model(model)
         
     def log(self, message):
         print(f"[EMERGENCY] {message}")
@@ -33,10 +45,7 @@ class EmergencyRecovery:
         input("Press Enter when ready to check Device Manager...")
         
         # Check for device
-        result = subprocess.run([
-            "powershell", "-Command",
-            "Get-WmiObject -Class Win32_PnPEntity | Where-Object {$_.Name -like '*MediaTek*' -or $_.Name -like '*PreLoader*'} | Select-Object Name"
-        ], capture_output=True, text=True, shell=True)
+        result = powershell("Get-WmiObject -Class Win32_PnPEntity | Where-Object {$_.Name -like '*MediaTek*' -or $_.Name -like '*PreLoader*'} | Select-Object Name")
         
         if "MediaTek" in result.stdout or "PreLoader" in result.stdout:
             self.log("SUCCESS! Device detected in deep flash mode")
@@ -46,6 +55,39 @@ class EmergencyRecovery:
             self.log("Device not detected. Try next method...")
             return False
     
+    def edl_profile(self, device_info=None):
+        """Profile of the device in 05C6:9008 mode: from its Device Manager line, else the only EDL profile"""
+        database = get_database()
+        profile, mode = database.resolve(device_info) if device_info else (None, None)
+        if profile and mode == "edl":
+            return profile
+        if any(usb["mode"] == "edl" for usb in self.profile.get("usb", [])):
+            return self.profile
+        matches = [profile for profile, mode in database.by_usb(*EDL_VID_PID) if mode == "edl"]
+        return matches[0] if len(matches) == 1 else None
+
+    def native_edl(self, device_info=None):
+        """Bring up Firehose directly instead of handing over to QFIL"""
+        profile = self.edl_profile(device_info)
+        if profile is None:
+            self.log("Cannot tell which model is in EDL mode - run with --model")
+            return None
+        self.log(f"EDL device: {profile['model']}")
+        programmer = find_programmer(self.working_dir / "firmware" / profile["firmware"]["dir"],
+                                     self.working_dir / "tools")
+        if programmer is None:
+            self.log("No Firehose programmer (prog_*.elf/.mbn) in the firmware folder - use QFIL")
+            return None
+        try:
+            client = edl_connect_port(programmer, log=self.log,
+                                      memory=profile.get("firehose", {}).get("memory", "emmc"))
+            for name, (first, sectors) in client.partitions().items():
+                self.log(f"  {name}: {sectors * client.sector_size / 1e6:.1f} MB")
+            return client
+        except (SaharaError, FirehoseError, TransportTimeout, TransportClosed, RuntimeError, OSError) as e:
+            self.log(f"Native EDL failed: {e}")
+            return None
+    
     def test_point_method(self):
         """Guide for test point method (advanced)"""
         self.log("=== TEST POINT METHOD (ADVANCED) ===")
@@ -79,6 +121,12 @@ class EmergencyRecovery:
         
         self.log("Estimated time for complete drain: 2-6 hours")
         self.log("Monitor the device - when screen goes black, wait 2 more hours")
+        self.log("")
+        
+        response = input("Start unattended watch mode (tracks the loop and catches PreLoader on recharge)? (yes/no): ")
+        if response.lower() == "yes":
+            return watch_interactive(self.working_dir / "logs" / "battery_drain_cycles.bin")
+        return False
         
     def edl_mode_attempt(self):
         """Attempt Emergency Download Mode"""
@@ -91,19 +139,20 @@ class EmergencyRecovery:
         self.log("3. Volume Up + Power (hold 10 seconds)")
         self.log("")
         
+        def check():
+            result = powershell("Get-WmiObject -Class Win32_PnPEntity | Where-Object {$_.Name -like '*Qualcomm*' -or $_.Name -like '*9008*' -or $_.Name -like '*MediaTek*'} | Select-Object Name, DeviceID")
+            return result.stdout.strip()
+        
         for i in range(3):
             self.log(f"Attempt {i+1}/3 - Try key combination now...")
-            time.sleep(10)
-            
-            # Check device manager
-            result = subprocess.run([
-                "powershell", "-Command",
-                "Get-WmiObject -Class Win32_PnPEntity | Where-Object {$_.Name -like '*Qualcomm*' -or $_.Name -like '*9008*' -or $_.Name -like '*MediaTek*'} | Select-Object Name"
-            ], capture_output=True, text=True, shell=True)
             
-            if result.stdout.strip():
+            # Poll at burst rate for the whole attempt instead of one check after 10s
+            found = poll_until(check, 10)
+            if found:
                 self.log("Device detected!")
-                self.log(result.stdout)
+                self.log(found)
+                if "9008" in found or "Qualcomm" in found:
+                    self.native_edl(found)
                 return True
         
         return False
@@ -111,62 +160,14 @@ class EmergencyRecovery:
     def create_emergency_flash_script(self):
         """Create emergency flashing script"""
         script_path = self.working_dir / "emergency_flash.bat"
-        
-        script_content = """@echo off
-echo ========================================
-echo EMERGENCY FLASH - Nokia G11
-echo ========================================
-echo.
-echo WARNING: This is for severely bricked devices only!
-echo.
-echo Prerequisites:
-echo 1. SP Flash Tool installed
-echo 2. MediaTek drivers installed  
-echo 3. Nokia G11 firmware downloaded
-echo 4. Device detected as PreLoader
-echo.
-echo EMERGENCY FLASH STEPS:
-echo 1. Open SP Flash Tool
-echo 2. Load scatter file
-echo 3. Select "Format All + Download"
-echo 4. Uncheck "Preloader" (if visible)
-echo 5. Click "Format All"
-echo 6. When prompted, connect device in PreLoader mode
-echo.
-echo This will COMPLETELY WIPE the device!
-echo.
-set /p confirm=Type EMERGENCY to continue: 
-if not "%confirm%"=="EMERGENCY" (
-    echo Cancelled.
-    pause
-    exit /b 1
-)
-
-echo.
-echo Starting emergency flash process...
-echo Connect device in PreLoader mode when prompted by SP Flash Tool
-echo.
-
-cd /d "%~dp0tools\\SP_Flash_Tool"
-if exist "flash_tool.exe" (
-    start flash_tool.exe
-    echo SP Flash Tool started. Follow the emergency flash steps above.
-) else (
-    echo ERROR: SP Flash Tool not found!
-    echo Please install SP Flash Tool first.
-)
-
-pause
-"""
-        
-        with open(script_path, "w") as f:
-            f.write(script_content)
-        
-        self.log("Emergency flash script created")
+        if get_generator().write("emergency_flash.bat.tmpl", script_path, **profile_context(self.profile)):
+            self.log("Emergency flash script created")
+        else:
+            self.log("Emergency flash script up to date")
     
     def run_emergency_recovery(self):
         """Run all emergency recovery methods"""
-        self.log("=== NOKIA G11 EMERGENCY RECOVERY ===")
+        self.log(f"=== {self.profile['model'].upper()} EMERGENCY RECOVERY ===")
         self.log("Use these methods when normal recovery fails")
         self.log("")
         
@@ -200,7 +201,8 @@ pause
         self.create_emergency_flash_script()
 
 def main():
-    recovery = EmergencyRecovery()
+    model = sys.argv[sys.argv.index("--model") + 1] if "--model" in sys.argv[:-1] else "Nokia G11"
+    recovery = EmergencyRecovery(model)
     recovery.run_emergency_recovery()
 
 if __name__ == "__main__":
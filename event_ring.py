@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Event Ring - Shared-memory ring buffer of device events between processes
+The monitor appends fixed-size records to a memory-mapped file; any number of worker
+or dashboard processes read them in place, without pipes, pickling or locks
+"""
+
+import sys
+import mmap
+import time
+import socket
+import select
+import struct
+from pathlib import Path
+
+MAGIC = b"EVRG"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")        # magic, version, record size, capacity
+DOORBELLS = struct.Struct("<12I")       # Per-reader wake-up UDP port << 1 | asleep flag
+DOORBELL_OFFSET = 16
+WRITE_SEQ = struct.Struct("<Q")         # Last committed sequence, on its own cache line
+WRITE_SEQ_OFFSET = 64
+DATA_OFFSET = 128
+
+# seq, monotonic ns, wall clock, progress, kind, device id, mode, model
+RECORD = struct.Struct("<QqdfB3x64s16s16s")
+SEQ = struct.Struct("<Q")
+DEFAULT_CAPACITY = 4096                 # Power of two; 512 KB of 128-byte records
+
+DEFAULT_PATH = Path(__file__).parent / "logs" / "monitor_events.ring"
+
+KINDS = ("detected", "disconnected", "progress", "status")
+
+
+def _text(raw):
+    return raw.rstrip(b"\0").decode("utf-8", "replace")
+
+
+class Event:
+    __slots__ = ("seq", "mono_ns", "timestamp", "progress", "kind", "device", "mode", "model")
+
+    def __init__(self, seq, mono_ns, timestamp, progress, kind, device, mode, model):
+        self.seq = seq
+        self.mono_ns = mono_ns
+        self.timestamp = timestamp
+        self.progress = progress
+        self.kind = KINDS[kind] if kind < len(KINDS) else str(kind)
+        self.device = _text(device)
+        self.mode = _text(mode)
+        self.model = _text(model)
+
+    def __repr__(self):
+        progress = f" {self.progress:.0f}%" if self.progress >= 0 else ""
+        return f"#{self.seq} {self.kind} {self.device} {self.mode} {self.model}{progress}".rstrip()
+
+
+class EventRing:
+    """Single-writer, many-reader ring over a memory-mapped file
+
+    Each slot carries the sequence number of the record in it. The writer zeroes
+    that field before overwriting a slot and stores the new sequence last, so a
+    reader that sees the same sequence before and after copying a record knows
+    it was not torn; a reader that falls a full lap behind skips ahead.
+
+    Idle readers do not poll: each registers a local UDP doorbell in the header
+    and flags itself asleep, and the writer rings only the sleeping ones.
+    """
+
+    def __init__(self, path, writer=False, capacity=DEFAULT_CAPACITY):
+        self.path = Path(path)
+        self.writer = writer
+        if writer:
+            self._open_writer(capacity)
+        else:
+            self.file = open(self.path, "r+b")
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        magic, version, record_size, self.capacity = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError(f"{self.path} is not a version {VERSION} event ring")
+        self.mask = self.capacity - 1
+        self.next_seq = self.last_seq() + 1  # Readers start at the live edge
+        self.dropped = 0
+        self.bell = None
+        self.bell_slot = None
+        self.ringer = None
+
+    def _open_writer(self, capacity):
+        if capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+        size = DATA_OFFSET + capacity * RECORD.size
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        reuse = self.path.exists() and self.path.stat().st_size == size
+        self.file = open(self.path, "r+b" if reuse else "w+b")
+        if not reuse:
+            self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        if reuse and HEADER.unpack_from(self.map, 0) == (MAGIC, VERSION, RECORD.size, capacity):
+            # Continue the sequence so attached readers survive a monitor restart; drop
+            # doorbells of readers that died without closing (live ones re-arm on their next wait)
+            DOORBELLS.pack_into(self.map, DOORBELL_OFFSET, *[0] * 12)
+            return
+        self.map[:size] = bytes(size)
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, RECORD.size, capacity)
+
+    @classmethod
+    def create(cls, path=DEFAULT_PATH, capacity=DEFAULT_CAPACITY):
+        return cls(path, writer=True, capacity=capacity)
+
+    @classmethod
+    def attach(cls, path=DEFAULT_PATH):
+        return cls(path)
+
+    def last_seq(self):
+        return WRITE_SEQ.unpack_from(self.map, WRITE_SEQ_OFFSET)[0]
+
+    def publish(self, kind, device, mode="", model="", progress=-1.0):
+        """Append one event (writer only); returns its sequence number"""
+        seq = self.last_seq() + 1
+        offset = DATA_OFFSET + (seq & self.mask) * RECORD.size
+        SEQ.pack_into(self.map, offset, 0)
+        RECORD.pack_into(self.map, offset, 0, time.monotonic_ns(), time.time(), progress, KINDS.index(kind),
+                         device.encode()[:64], mode.encode()[:16], model.encode()[:16])
+        SEQ.pack_into(self.map, offset, seq)
+        WRITE_SEQ.pack_into(self.map, WRITE_SEQ_OFFSET, seq)
+        for bell in DOORBELLS.unpack_from(self.map, DOORBELL_OFFSET):
+            if bell & 1:
+                self._ring_bell(bell >> 1)
+        return seq
+
+    def _ring_bell(self, port):
+        if self.ringer is None:
+            self.ringer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.ringer.sendto(b"!", ("127.0.0.1", port))
+        except OSError:
+            pass  # Reader gone; its slot is cleared when the writer next starts
+
+    def _set_bell(self, value):
+        struct.pack_into("<I", self.map, DOORBELL_OFFSET + 4 * self.bell_slot, value)
+
+    def _register_bell(self):
+        """Claim a doorbell slot; returns False when all are taken (the reader then polls)"""
+        self.bell = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.bell.bind(("127.0.0.1", 0))
+        self.bell.setblocking(False)
+        port = self.bell.getsockname()[1]
+        for slot, bell in enumerate(DOORBELLS.unpack_from(self.map, DOORBELL_OFFSET)):
+            if bell == 0:
+                self.bell_slot = slot
+                self._set_bell(port << 1)
+                return True
+        self.bell.close()
+        self.bell = False
+        return False
+
+    def read(self, limit=None):
+        """Events published since the last call, oldest first"""
+        events = []
+        last = self.last_seq()
+        if last - self.next_seq + 1 > self.capacity:
+            self.dropped += last - self.capacity + 1 - self.next_seq
+            self.next_seq = last - self.capacity + 1
+        while self.next_seq <= last and (limit is None or len(events) < limit):
+            offset = DATA_OFFSET + (self.next_seq & self.mask) * RECORD.size
+            fields = RECORD.unpack_from(self.map, offset)
+            if fields[0] == self.next_seq and SEQ.unpack_from(self.map, offset)[0] == self.next_seq:
+                events.append(Event(*fields))
+                self.next_seq += 1
+                continue
+            # The writer lapped us mid-read: skip to the oldest slot it is not about to reuse
+            oldest = self.last_seq() - self.capacity + 2
+            self.dropped += max(1, oldest - self.next_seq)
+            self.next_seq = max(self.next_seq + 1, oldest)
+        return events
+
+    def wait(self, timeout=None, spin=0.0):
+        """Block until events arrive and return them ([] on timeout)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        spin_until = time.monotonic() + spin
+        if self.bell is None:
+            self._register_bell()
+        while True:
+            if self.last_seq() >= self.next_seq:
+                return self.read()
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return []
+            if now < spin_until:
+                continue
+            left = 0.05 if deadline is None else min(0.05, deadline - now)
+            if not self.bell:
+                time.sleep(min(left, 0.005))
+                continue
+            port = self.bell.getsockname()[1]
+            self._set_bell(port << 1 | 1)
+            if self.last_seq() < self.next_seq:  # Published between the check and the flag
+                select.select([self.bell], [], [], left)
+            self._set_bell(port << 1)
+            try:
+                while self.bell.recv(64):
+                    pass
+            except OSError:
+                pass
+
+    def close(self):
+        if self.bell:
+            self._set_bell(0)
+            self.bell.close()
+        if self.ringer is not None:
+            self.ringer.close()
+        self.map.close()
+        self.file.close()
+
+
+SAMPLE = ("USB\\VID_0E8D&PID_2000\\5&2A1B", "preloader", "Nokia G11")
+
+
+def _pace(started, index, rate):
+    """Hold a steady event rate"""
+    if rate:
+        delay = started + index / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _ring_reader(path, count, spin, results):
+    ring = EventRing.attach(path)
+    ring.next_seq = 1
+    latencies = []
+    first = None
+    while ring.next_seq <= count:
+        events = ring.wait(timeout=5, spin=spin)
+        if not events:
+            break
+        now = time.monotonic_ns()
+        first = first or time.perf_counter()
+        latencies.extend(now - event.mono_ns for event in events)
+    results.put((len(latencies), ring.dropped, time.perf_counter() - (first or time.perf_counter()), latencies))
+
+
+def _queue_reader(queue, results):
+    latencies = []
+    first = None
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        latencies.append(time.monotonic_ns() - item[1])
+        first = first or time.perf_counter()
+    results.put((len(latencies), 0, time.perf_counter() - (first or time.perf_counter()), latencies))
+
+
+def benchmark(count=200000, readers=2, rate=2000):
+    """Throughput flat out and end-to-end latency at a steady rate: ring vs multiprocessing.Queue"""
+    import shutil
+    import tempfile
+    import multiprocessing
+
+    def collect(label, results, rate_limit):
+        rows = [results.get() for _ in range(readers)]
+        if rate_limit:
+            latencies = sorted(value for row in rows for value in row[3])
+            p50 = latencies[len(latencies) // 2] / 1000
+            p99 = latencies[int(len(latencies) * 0.99)] / 1000
+            print(f"{label:<24} latency at {rate_limit} ev/s: p50 {p50:8.1f} us  p99 {p99:8.1f} us")
+        else:
+            throughput = min(row[0] / row[2] for row in rows if row[2])
+            print(f"{label:<24} throughput: {throughput:>11,.0f} ev/s per reader, "
+                  f"{sum(row[0] for row in rows)} received, {sum(row[1] for row in rows)} dropped")
+
+    def run_ring(events, rate_limit):
+        workdir = Path(tempfile.mkdtemp(prefix="ring_bench_"))
+        path, capacity = workdir / "events.ring", 1 << 16
+        ring = EventRing.create(path, capacity)
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_ring_reader, args=(path, events, 0.0, results))
+                 for _ in range(readers)]
+        for proc in procs:
+            proc.start()
+        time.sleep(0.5)
+        started = time.perf_counter()
+        for i in range(events):
+            ring.publish("progress", *SAMPLE, progress=i % 101)
+            _pace(started, i + 1, rate_limit)
+        collect("mmap ring", results, rate_limit)
+        for proc in procs:
+            proc.join()
+        ring.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    def run_queue(events, rate_limit):
+        # One consumer per message, so every reader needs its own queue
+        queues = [multiprocessing.Queue() for _ in range(readers)]
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_queue_reader, args=(queue, results)) for queue in queues]
+        for proc in procs:
+            proc.start()
+        time.sleep(0.5)
+        started = time.perf_counter()
+        for i in range(events):
+            item = (i + 1, time.monotonic_ns(), time.time(), float(i % 101), 2) + SAMPLE
+            for queue in queues:
+                queue.put(item)
+            _pace(started, i + 1, rate_limit)
+        for queue in queues:
+            queue.put(None)
+        collect("multiprocessing.Queue", results, rate_limit)
+        for proc in procs:
+            proc.join()
+
+    print(f"{readers} reader processes, {RECORD.size}-byte records, {count} events")
+    run_ring(count, 0)
+    run_queue(count, 0)
+    run_ring(rate * 2, rate)
+    run_queue(rate * 2, rate)
+
+
+def tail(path=DEFAULT_PATH):
+    """Print monitor events as they arrive"""
+    ring = EventRing.attach(path)
+    print(f"Attached to {path} at event #{ring.next_seq}")
+    try:
+        while True:
+            for event in ring.wait():
+                stamp = time.strftime("%H:%M:%S", time.localtime(event.timestamp))
+                print(f"[{stamp}] {event}")
+            if ring.dropped:
+                print(f"(fell behind, {ring.dropped} events skipped)")
+                ring.dropped = 0
+    except KeyboardInterrupt:
+        ring.close()
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 200000)
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] == "tail":
+        tail(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATH)
+        return
+    print("Usage: python event_ring.py tail [ring]   (follow the device monitor's events)")
+    print("       python event_ring.py bench [events]")
+
+
+if __name__ == "__main__":
+    main()
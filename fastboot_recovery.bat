@@ -28,8 +28,9 @@ echo 2. fastboot reboot-bootloader
 echo 3. fastboot flash recovery recovery.img
 echo 4. fastboot flash boot boot.img
 echo 5. fastboot erase userdata
+echo 6. fastboot flash system system.img
 echo.
-echo Enter command number (1-5) or 'q' to quit:
+echo Enter command number (1-6) or 'q' to quit:
 set /p choice=
 
 if "%choice%"=="1" fastboot reboot
@@ -53,5 +54,12 @@ if "%choice%"=="5" (
     set /p confirm=Type YES to confirm: 
     if "%confirm%"=="YES" fastboot erase userdata
 )
+if "%choice%"=="6" (
+    if exist "firmware\Nokia_G11\system.img" (
+        fastboot flash system "firmware\Nokia_G11\system.img"
+    ) else (
+        echo system.img not found in firmware folder
+    )
+)
 
 pause
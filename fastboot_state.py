@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Fastboot State - One getvar all per bootloader visit, shared by every consumer
+Caches bootloader variables per serial and drops them on reboot or mode change
+"""
+
+import sys
+import time
+import threading
+from command_runner import run_command
+
+GETVAR_TIMEOUT = 15
+
+
+def parse_getvar_all(output):
+    """Parse 'fastboot getvar all' output into a dict
+
+    Lines look like '(bootloader) unlocked:yes' or
+    '(bootloader) partition-size:boot_a: 0x4000000'; the value is after the last colon.
+    """
+    variables = {}
+    for line in output.splitlines():
+        line = line.strip()
+        if not line.startswith("(bootloader)"):
+            continue
+        body = line[len("(bootloader)"):].strip()
+        if ":" not in body:
+            continue
+        key, value = body.rsplit(":", 1)
+        variables[key.strip()] = value.strip()
+    return variables
+
+
+def parse_size(value):
+    """Sizes come back as hex ('0x10000000') or decimal strings"""
+    if value is None:
+        return None
+    try:
+        return int(value, 0)
+    except ValueError:
+        return None
+
+
+class FastbootSnapshot:
+    """Bootloader variables collected during one fastboot mode entry"""
+
+    def __init__(self, serial, variables):
+        self.serial = serial
+        self.variables = variables
+        self.collected_at = time.time()
+
+    def get(self, name, default=None):
+        return self.variables.get(name, default)
+
+    @property
+    def unlocked(self):
+        value = self.variables.get("unlocked")
+        if value is None:
+            return None
+        return value.lower() in ("yes", "true", "1")
+
+    @property
+    def current_slot(self):
+        slot = self.variables.get("current-slot")
+        return slot.lstrip("_") if slot else None
+
+    @property
+    def max_download_size(self):
+        return parse_size(self.variables.get("max-download-size"))
+
+    @property
+    def product(self):
+        return self.variables.get("product")
+
+    def partition_size(self, partition):
+        """Size of a partition in bytes, trying the active slot suffix as well"""
+        size = self.variables.get(f"partition-size:{partition}")
+        if size is None and self.current_slot:
+            size = self.variables.get(f"partition-size:{partition}_{self.current_slot}")
+        return parse_size(size)
+
+    def partitions(self):
+        prefix = "partition-size:"
+        return {key[len(prefix):]: parse_size(value)
+                for key, value in self.variables.items() if key.startswith(prefix)}
+
+
+class FastbootState:
+    """Per-serial cache of getvar snapshots
+
+    The first question about a device in fastboot mode runs 'getvar all' once;
+    everything after that is served from memory until the device reboots,
+    leaves fastboot mode, or a command that changes bootloader state is sent.
+    """
+
+    def __init__(self):
+        self.snapshots = {}
+        self.present = set()
+        self.lock = threading.Lock()
+        self.interrogations = 0
+
+    def devices(self):
+        """Serials currently in fastboot mode; departed serials lose their snapshot"""
+        try:
+            result = run_command(["fastboot", "devices"], timeout=GETVAR_TIMEOUT)
+        except OSError:
+            return []
+
+        serials = []
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and parts[1] == "fastboot":
+                serials.append(parts[0])
+
+        with self.lock:
+            for serial in self.present - set(serials):
+                self.snapshots.pop(serial, None)
+            self.present = set(serials)
+        return serials
+
+    def snapshot(self, serial):
+        """Cached snapshot for a serial, interrogating the device on first use"""
+        with self.lock:
+            cached = self.snapshots.get(serial)
+        if cached:
+            return cached
+
+        # getvar prints to stderr on most bootloaders
+        result = run_command(["fastboot", "-s", serial, "getvar", "all"], timeout=GETVAR_TIMEOUT)
+        variables = parse_getvar_all(result.stderr + "\n" + result.stdout)
+        if not variables:
+            return None
+
+        snapshot = FastbootSnapshot(serial, variables)
+        with self.lock:
+            self.interrogations += 1
+            self.snapshots[serial] = snapshot
+            self.present.add(serial)
+        return snapshot
+
+    def invalidate(self, serial=None):
+        """Forget one serial (or all) after a reboot or mode change"""
+        with self.lock:
+            if serial is None:
+                self.snapshots.clear()
+            else:
+                self.snapshots.pop(serial, None)
+
+    def command(self, serial, *args, timeout=60):
+        """Run a fastboot command; state-changing ones invalidate the snapshot"""
+        result = run_command(["fastboot", "-s", serial] + list(args), timeout=timeout)
+        if args and args[0] in ("reboot", "reboot-bootloader", "reboot-fastboot", "reboot-recovery",
+                                "set_active", "flashing", "oem", "--set-active"):
+            self.invalidate(serial)
+            if args[0].startswith("reboot"):
+                with self.lock:
+                    self.present.discard(serial)
+        return result
+
+    def reboot(self, serial, target=None):
+        return self.command(serial, "reboot" if target is None else f"reboot-{target}")
+
+
+_state = None
+
+
+def get_fastboot_state():
+    """Shared cache instance for the whole process"""
+    global _state
+    if _state is None:
+        _state = FastbootState()
+    return _state
+
+
+def main():
+    state = get_fastboot_state()
+    serials = state.devices()
+    if not serials:
+        print("No devices in fastboot mode")
+        return
+
+    for serial in serials:
+        snapshot = state.snapshot(serial)
+        if not snapshot:
+            print(f"{serial}: getvar all returned nothing")
+            continue
+        print(f"{serial}: product={snapshot.product} unlocked={snapshot.unlocked} "
+              f"slot={snapshot.current_slot} max-download-size={snapshot.max_download_size}")
+        if "-v" in sys.argv:
+            for name, size in sorted(snapshot.partitions().items()):
+                print(f"   {name:<24} {size}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Firmware Extract - Parallel, streaming unpacking of firmware and tool zips
+Members are decompressed across a process pool, streamed to disk in bounded chunks
+and CRC-checked on the fly; each image is handed back as soon as it lands
+"""
+
+import os
+import sys
+import time
+import zlib
+import shutil
+import hashlib
+import zipfile
+import tempfile
+from pathlib import Path, PurePosixPath
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+CHUNK_SIZE = 1024 * 1024
+
+# Images needed first by SP Flash Tool / fastboot are extracted ahead of the rest
+PRIORITY_NAMES = ("scatter", "preloader", "lk", "boot", "recovery", "modem")
+
+_open_zips = {}
+
+
+def _zip_handle(zip_path):
+    """One open ZipFile per worker process, reused across members"""
+    handle = _open_zips.get(zip_path)
+    if handle is None:
+        handle = _open_zips[zip_path] = zipfile.ZipFile(zip_path)
+    return handle
+
+
+def member_target(dest_dir, name, strip_components=0):
+    """Safe destination for a member, or None if it is a directory or escapes dest_dir"""
+    parts = PurePosixPath(name).parts[strip_components:]
+    if not parts or name.endswith("/"):
+        return None
+    if any(part in ("..", "") or ":" in part for part in parts) or PurePosixPath(name).is_absolute():
+        raise ValueError(f"Unsafe path in archive: {name}")
+    return Path(dest_dir).joinpath(*parts)
+
+
+def extract_member(zip_path, name, target, chunk_size=CHUNK_SIZE, with_sha256=True):
+    """Stream one member to target, verifying its CRC while writing
+
+    Runs inside a pool worker. Writes to a temporary file next to the target and
+    renames it into place only after the CRC matched.
+    """
+    started = time.perf_counter()
+    archive = _zip_handle(zip_path)
+    info = archive.getinfo(name)
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+
+    crc = 0
+    digest = hashlib.sha256() if with_sha256 else None
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{target.name}.", dir=target.parent)
+    try:
+        with os.fdopen(fd, "wb") as out, archive.open(info) as stream:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                if digest:
+                    digest.update(chunk)
+                out.write(chunk)
+
+        if crc != info.CRC:
+            raise zipfile.BadZipFile(f"CRC mismatch for {name}: {crc:08x} != {info.CRC:08x}")
+        os.replace(tmp_path, target)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    return {
+        "name": name,
+        "path": str(target),
+        "size": info.file_size,
+        "crc": f"{crc:08x}",
+        "sha256": digest.hexdigest() if digest else None,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def priority(info):
+    """Sort key: priority images first, then largest first to balance the pool"""
+    stem = PurePosixPath(info.filename).name.lower()
+    for rank, prefix in enumerate(PRIORITY_NAMES):
+        if stem.startswith(prefix) or (prefix == "scatter" and prefix in stem):
+            return (0, rank, -info.file_size)
+    return (1, 0, -info.file_size)
+
+
+def lower_priority():
+    """Drop the calling process to background priority (pool initializer)"""
+    if hasattr(os, "nice"):
+        os.nice(10)
+        return
+    try:
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), 0x4000)  # BELOW_NORMAL_PRIORITY_CLASS
+    except (ImportError, AttributeError, OSError):
+        pass
+
+
+class FirmwareExtractor:
+    """Extracts a zip into a directory using a pool of worker processes"""
+
+    def __init__(self, workers=None, chunk_size=CHUNK_SIZE, with_sha256=True, low_priority=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.with_sha256 = with_sha256
+        self.low_priority = low_priority
+
+    def plan(self, zip_path, dest_dir, strip_components=0, members=None):
+        with zipfile.ZipFile(zip_path) as archive:
+            infos = [info for info in archive.infolist() if not info.is_dir()]
+        if members is not None:
+            wanted = set(members)
+            infos = [info for info in infos if info.filename in wanted]
+        infos.sort(key=priority)
+
+        jobs = []
+        for info in infos:
+            target = member_target(dest_dir, info.filename, strip_components)
+            if target is not None:
+                jobs.append((info.filename, target, info.file_size))
+        return jobs
+
+    def extract(self, zip_path, dest_dir, on_member=None, strip_components=0, members=None):
+        """Extract everything (or just members) and return per-member results
+
+        on_member(result) is called in this process as each member finishes, so
+        callers can start hashing or flashing early images while the rest unpack.
+        """
+        zip_path = str(Path(zip_path).resolve())
+        jobs = self.plan(zip_path, dest_dir, strip_components, members)
+        results = []
+
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 initializer=lower_priority if self.low_priority else None) as pool:
+            futures = [pool.submit(extract_member, zip_path, name, str(target),
+                                   self.chunk_size, self.with_sha256)
+                       for name, target, _ in jobs]
+            try:
+                for future in as_completed(futures):
+                    result = future.result()
+                    results.append(result)
+                    if on_member:
+                        on_member(result)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        return results
+
+
+def extract_firmware(zip_path, dest_dir, on_member=None, strip_components=0, workers=None, low_priority=False):
+    """Convenience wrapper used by the setup code"""
+    return FirmwareExtractor(workers=workers, low_priority=low_priority).extract(
+        zip_path, dest_dir, on_member, strip_components)
+
+
+def unpack_packages(firmware_path, log=print, workers=None, low_priority=False):
+    """Unpack every zip in a firmware folder once; a marker file records the member hashes
+
+    Returns the number of packages unpacked by this call.
+    """
+    firmware_path = Path(firmware_path)
+    unpacked = 0
+    for package in sorted(firmware_path.glob("*.zip")):
+        marker = firmware_path / f".{package.name}.unpacked"
+        if marker.exists() and marker.stat().st_mtime >= package.stat().st_mtime:
+            continue
+
+        log(f"Unpacking {package.name}...")
+        results = extract_firmware(
+            package, firmware_path,
+            on_member=lambda r: log(f"  {Path(r['name']).name} ready (sha256 {r['sha256'][:12]})"),
+            workers=workers, low_priority=low_priority)
+        with open(marker, "w") as f:
+            for result in results:
+                f.write(f"{result['sha256']}  {result['name']}\n")
+        log(f"{package.name}: {len(results)} files unpacked")
+        unpacked += 1
+    return unpacked
+
+
+def benchmark(zip_path, workers=None, rounds=3):
+    """Compare the pool pipeline with a plain zipfile.extractall"""
+    zip_path = Path(zip_path)
+    total = sum(info.file_size for info in zipfile.ZipFile(zip_path).infolist())
+    workers = workers or os.cpu_count() or 1
+
+    def timed(label, func):
+        best = None
+        for _ in range(rounds):
+            dest = Path(tempfile.mkdtemp(prefix="fwx_bench_"))
+            try:
+                started = time.perf_counter()
+                func(dest)
+                elapsed = time.perf_counter() - started
+            finally:
+                shutil.rmtree(dest, ignore_errors=True)
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{label:<34} {best:8.3f}s {total / best / 1e6:9.1f} MB/s")
+        return best
+
+    print(f"Archive: {zip_path.name} ({total / 1e6:.1f} MB uncompressed), best of {rounds}")
+    sequential = timed("zipfile.extractall (sequential)", lambda dest: zipfile.ZipFile(zip_path).extractall(dest))
+    streamed = timed(f"pool x{workers} (crc only)",
+                     lambda dest: FirmwareExtractor(workers, with_sha256=False).extract(zip_path, dest))
+    hashed = timed(f"pool x{workers} (crc + sha256)",
+                   lambda dest: FirmwareExtractor(workers).extract(zip_path, dest))
+    print(f"Speedup vs sequential: {sequential / streamed:.2f}x (crc only), {sequential / hashed:.2f}x (with sha256)")
+
+
+def main():
+    if len(sys.argv) >= 3 and sys.argv[1] == "bench":
+        benchmark(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else None)
+        return
+    if len(sys.argv) < 3:
+        print("Usage: python firmware_extract.py <firmware.zip> <dest_dir>")
+        print("       python firmware_extract.py bench <firmware.zip> [workers]")
+        return
+
+    started = time.perf_counter()
+    results = extract_firmware(sys.argv[1], sys.argv[2],
+                               on_member=lambda r: print(f"  {r['name']} ({r['size']} bytes, crc {r['crc']})"))
+    elapsed = time.perf_counter() - started
+    total = sum(r["size"] for r in results)
+    print(f"Extracted {len(results)} files, {total / 1e6:.1f} MB in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Firmware Prefetch - Starts preparing firmware the moment a device is recognised
+Detection queues the model's package for a background download/unpack at low priority,
+so the images are local by the time the user has the phone in download mode
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from device_profiles import get_database
+from firmware_extract import unpack_packages
+
+BASE_DIR = Path(__file__).parent
+FIRMWARE_DIR = BASE_DIR / "firmware"
+STATS_PATH = BASE_DIR / "logs" / "prefetch.jsonl"
+
+DOWNLOAD_CHUNK = 1024 * 1024
+
+
+def download_package(url, firmware_path, log=print):
+    """Fetch a direct package URL into the firmware folder (resumes a .part file)"""
+    import requests
+
+    target = firmware_path / url.rsplit("/", 1)[-1].split("?")[0]
+    if target.exists():
+        return target
+    partial = target.with_name(target.name + ".part")
+    offset = partial.stat().st_size if partial.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    log(f"Downloading {target.name}" + (f" (resuming at {offset} bytes)" if offset else ""))
+    with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        if offset and response.status_code != 206:
+            offset = 0  # Server ignored the range, start over
+        with open(partial, "ab" if offset else "wb") as f:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK):
+                f.write(chunk)
+    partial.replace(target)
+    return target
+
+
+def prepare_firmware(profile, firmware_dir=FIRMWARE_DIR, log=print, low_priority=False):
+    """Download (when the profile names a direct package) and unpack a model's firmware"""
+    firmware = profile["firmware"]
+    firmware_path = Path(firmware_dir) / firmware["dir"]
+    firmware_path.mkdir(parents=True, exist_ok=True)
+    if firmware.get("package_url"):
+        download_package(firmware["package_url"], firmware_path, log)
+    return unpack_packages(firmware_path, log, workers=1 if low_priority else None, low_priority=low_priority)
+
+
+class PrefetchJob:
+    """One model's background preparation"""
+
+    def __init__(self, model, reason):
+        self.model = model
+        self.reason = reason
+        self.requested = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.done = threading.Event()
+
+    @property
+    def duration(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+
+class FirmwarePrefetcher:
+    """Background queue of firmware preparations, one worker so it never competes with flashing
+
+    prefetch() is called from detection; claim() is called where the firmware is
+    actually needed and records whether the prefetch hit, partly hit or missed.
+    """
+
+    def __init__(self, firmware_dir=FIRMWARE_DIR, stats_path=STATS_PATH, log=print, preparer=prepare_firmware):
+        self.firmware_dir = Path(firmware_dir)
+        self.stats_path = Path(stats_path)
+        self.log = log
+        self.preparer = preparer
+        self.jobs = {}
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def prefetch(self, model, reason="detected"):
+        """Queue a model's firmware; returns the job, or None for an unknown model"""
+        profile = get_database().by_model(model)
+        if profile is None:
+            return None
+        with self.lock:
+            job = self.jobs.get(profile["model"])
+            if job is not None and job.error is None:
+                return job
+            job = self.jobs[profile["model"]] = PrefetchJob(profile["model"], reason)
+            self.queue.put((job, profile))
+            if self.worker is None:  # The worker clears this under the lock as it exits
+                self.worker = threading.Thread(target=self._work, name="firmware-prefetch", daemon=True)
+                self.worker.start()
+        self.log(f"Prefetching {profile['model']} firmware in the background ({reason})")
+        return job
+
+    def _work(self):
+        while True:
+            try:
+                job, profile = self.queue.get(timeout=5)
+            except queue.Empty:
+                # Exit only if nothing was queued meanwhile: prefetch() queues under the same lock
+                with self.lock:
+                    if self.queue.empty():
+                        self.worker = None
+                        return
+                continue
+            job.started = time.monotonic()
+            try:
+                self.preparer(profile, self.firmware_dir, lambda m: self.log(f"[prefetch] {m}"), low_priority=True)
+            except Exception as e:  # Reported at claim time; the synchronous path retries
+                job.error = e
+            job.finished = time.monotonic()
+            job.done.set()
+
+    def claim(self, model, log=None, timeout=None):
+        """Make sure a model's firmware is ready, waiting on or replacing its prefetch"""
+        log = log or self.log
+        profile = get_database().by_model(model)
+        if profile is None:
+            return None
+        with self.lock:
+            job = self.jobs.pop(profile["model"], None)  # A prefetch is credited once
+        claimed = time.monotonic()
+
+        if job is None:
+            outcome, saved = "miss", 0.0
+        elif job.done.is_set():
+            outcome, saved = "hit", job.duration
+        else:
+            outcome = "partial"
+            saved = claimed - job.started if job.started else 0.0
+            log(f"Waiting for the {profile['model']} firmware prefetch to finish...")
+            job.done.wait(timeout)
+
+        if job is not None and job.error is not None:
+            log(f"Prefetch failed ({job.error}) - preparing now")
+            outcome, saved = "failed", 0.0
+        if job is None or job.error is not None:
+            self.preparer(profile, self.firmware_dir, log)
+
+        self.record({
+            "at": round(time.time(), 3),
+            "model": profile["model"],
+            "outcome": outcome,
+            "lead_s": round(claimed - job.requested, 3) if job else 0.0,
+            "saved_s": round(saved, 3),
+            "wait_s": round(time.monotonic() - claimed, 3),
+        })
+        if outcome in ("hit", "partial"):
+            log(f"Firmware prefetch {outcome}: {saved:.1f}s of preparation already done")
+        return outcome
+
+    def record(self, entry):
+        self.stats_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock, open(self.stats_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def stats(self):
+        """Hit rate and time saved over every recorded claim"""
+        entries = []
+        if self.stats_path.exists():
+            with open(self.stats_path, encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+        counts = {outcome: 0 for outcome in ("hit", "partial", "miss", "failed")}
+        for entry in entries:
+            counts[entry["outcome"]] = counts.get(entry["outcome"], 0) + 1
+        saved = sum(entry["saved_s"] for entry in entries)
+        return {
+            "claims": len(entries),
+            **counts,
+            "hit_rate": round((counts["hit"] + counts["partial"]) / len(entries), 3) if entries else 0.0,
+            "saved_s": round(saved, 1),
+            "saved_per_job_s": round(saved / len(entries), 2) if entries else 0.0,
+        }
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    """Shared prefetcher for the monitors and the doctor"""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = FirmwarePrefetcher()
+        return _prefetcher
+
+
+def make_fake_package(firmware_path, size_mb=256):
+    """A firmware zip with a scatter file and incompressible images"""
+    import zipfile
+
+    firmware_path.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(firmware_path / "fake_firmware.zip", "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("scatter.txt", "- partition_index: SYS0\n  partition_name: preloader\n")
+        for name in ("preloader.bin", "boot.img", "recovery.img", "system.img"):
+            archive.writestr(name, os.urandom(size_mb * 1024 * 1024 // 4))
+
+
+def simulate(model="Nokia G11", combo_seconds=(0.2, 1.0, 5.0), size_mb=256):
+    """Detection -> key-combo delay -> claim, against the same claim with no prefetch"""
+    database = get_database()
+    profile = database.by_model(model)
+    print(f"{model}: {size_mb} MB fake package, key-combo delays {combo_seconds}")
+    workdir = Path(tempfile.mkdtemp(prefix="prefetch_sim_"))
+    try:
+        for delay in (None,) + tuple(combo_seconds):
+            firmware_dir = workdir / f"run_{delay}"
+            make_fake_package(firmware_dir / profile["firmware"]["dir"], size_mb)
+            prefetcher = FirmwarePrefetcher(firmware_dir, workdir / "stats.jsonl", log=lambda m: None)
+            if delay is not None:
+                prefetcher.prefetch(model, "simulated detection")
+                time.sleep(delay)
+            started = time.perf_counter()
+            outcome = prefetcher.claim(model)
+            wait = time.perf_counter() - started
+            label = "no prefetch" if delay is None else f"combo {delay:.1f}s"
+            print(f"{label:<14} {outcome:<8} firmware ready {wait:6.2f}s after the device entered download mode")
+            shutil.rmtree(firmware_dir, ignore_errors=True)
+        print(f"Stats: {prefetcher.stats()}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "simulate":
+        simulate(sys.argv[2] if len(sys.argv) > 2 else "Nokia G11")
+        return
+    if len(sys.argv) >= 3 and sys.argv[1] == "prefetch":
+        prefetcher = get_prefetcher()
+        prefetcher.prefetch(sys.argv[2], "manual")
+        prefetcher.claim(sys.argv[2])
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] == "stats":
+        for key, value in get_prefetcher().stats().items():
+            print(f"{key}: {value}")
+        return
+    print("Usage: python firmware_prefetch.py [stats|prefetch <model>|simulate [model]]")
+
+
+if __name__ == "__main__":
+    main()
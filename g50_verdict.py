@@ -1,29 +1,70 @@
 #!/usr/bin/env python3
 """
 Nokia G50 Final Verdict - Hardware Damage Assessment
+Ranks verdicts from the G50 rule set using live device facts or a saved snapshot
 """
 
-def g50_verdict():
-    print("=== Nokia G50 Final Diagnosis ===")
-    print("Drop damage caused baseband corruption")
-    print("SIM reader hardware may be damaged")
-    print("")
-    print("Evidence:")
-    print("- No baseband version detected")
-    print("- SIM shows 'No SIM' despite physical presence")
-    print("- Network shows Tesco but can't connect")
-    print("- Software fixes failed")
-    print("")
-    print("Verdict: HARDWARE DAMAGE")
-    print("")
-    print("Options:")
-    print("1. Professional repair (£50-80)")
-    print("2. Motherboard replacement (£100+)")
-    print("3. Use as WiFi-only device")
-    print("4. Sell for parts (£20-30)")
+import sys
+import json
+from device_profiles import get_database
+from diagnosis_rules import RuleEngine
+
+PLUGIN_MANIFEST = {
+    "description": "Ranked hardware/software verdict from live facts or a snapshot",
+    "models": ["Nokia G50"],
+    "capabilities": {"verdict": "g50_verdict"},
+}
+
+# Facts from the original dropped-G50 case, used when no device or snapshot is given
+RECORDED_CASE = {
+    "adb_connected": True,
+    "fastboot_connected": False,
+    "baseband": "",
+    "sim_state": "ABSENT",
+    "operator": "Tesco",
+    "data_state": "DISCONNECTED",
+}
+
+def load_facts(argv):
+    """Facts from a JSON snapshot, a live device, or the recorded case"""
+    if argv:
+        with open(argv[0], "r", encoding="utf-8") as f:
+            return json.load(f), f"snapshot {argv[0]}"
+
+    from nokia_g50_analyzer import NokiaG50Analyzer
+    facts = NokiaG50Analyzer().collect_facts()
+    if facts["adb_connected"] or facts["fastboot_connected"]:
+        return facts, "live device"
+    return RECORDED_CASE, "recorded case"
+
+def g50_verdict(argv=None):
+    profile = get_database().by_model("Nokia G50")
+    facts, source = load_facts(sys.argv[1:] if argv is None else argv)
+
+    engine = RuleEngine(profile["rules"])
+    engine.update(facts)
+    verdicts = engine.verdicts()
+
+    print(f"=== {profile['model']} Final Diagnosis ===")
+    print(f"Facts from: {source}")
     print("")
-    print("The drop likely damaged the RF chip or SIM reader circuit.")
-    print("This requires micro-soldering repair or board replacement.")
+    if not verdicts:
+        print("No rule matched - no known fault signature")
+        return verdicts
+
+    for rank, verdict in enumerate(verdicts, 1):
+        print(f"{rank}. {verdict['verdict']} (severity {verdict['severity']})")
+        print("   Evidence:")
+        for evidence in verdict["evidence"]:
+            print(f"   - {evidence}")
+        if verdict["actions"]:
+            print("   Options:")
+            for action in verdict["actions"]:
+                print(f"   - {action}")
+        print("")
+
+    print(f"Verdict: {verdicts[0]['verdict']}")
+    return verdicts
 
 if __name__ == "__main__":
-    g50_verdict()
\ No newline at end of file
+    g50_verdict()
@@ -4,6 +4,14 @@ iPhone 16 SIM Card Issue Diagnostic
 Brand new iPhone 16 not recognizing SIM card
 """
 
+from script_templates import get_generator
+
+PLUGIN_MANIFEST = {
+    "description": "SIM not recognised on a new iPhone 16",
+    "models": ["iPhone 16"],
+    "capabilities": {"analyze": "iphone16_sim_diagnosis", "fix-script": "create_iphone16_fix_script"},
+}
+
 def iphone16_sim_diagnosis():
     print("=== iPhone 16 SIM Card Diagnostic ===")
     print("Brand new iPhone 16 not recognizing SIM card")
@@ -90,39 +98,7 @@ def iphone16_sim_diagnosis():
 
 def create_iphone16_fix_script():
     """Create iPhone 16 SIM fix batch script"""
-    script_content = """@echo off
-echo ========================================
-echo iPhone 16 SIM Card Fix Guide
-echo ========================================
-echo.
-echo IMPORTANT: iPhone 16 models vary by region
-echo.
-echo US Models: eSIM ONLY (no physical SIM slot)
-echo International: Physical SIM + eSIM
-echo.
-echo Quick Checks:
-echo 1. Look for SIM tray on right side of phone
-echo 2. If no tray = eSIM only model
-echo 3. If has tray = physical SIM model
-echo.
-echo eSIM Only Fix:
-echo - Contact carrier for eSIM activation
-echo - Settings > Cellular > Add Cellular Plan
-echo - Scan carrier QR code
-echo.
-echo Physical SIM Fix:
-echo - Remove and reinsert SIM card
-echo - Settings > General > Reset > Reset Network Settings
-echo - Contact carrier for 5G-compatible SIM
-echo.
-echo Opening Apple Support page...
-start https://support.apple.com/en-us/HT201337
-echo.
-pause
-"""
-    
-    with open("iphone16_sim_fix.bat", "w") as f:
-        f.write(script_content)
+    get_generator().write("iphone16_sim_fix.bat.tmpl", "iphone16_sim_fix.bat")
     
     print("iPhone 16 SIM fix script created: iphone16_sim_fix.bat")
 
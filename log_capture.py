@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Log Capture - Streams logcat, dmesg and last_kmsg/pstore into compressed rotating
+buffers and scans them for known boot-loop signatures in a single pass
+"""
+
+import sys
+import gzip
+import time
+import threading
+from pathlib import Path
+from datetime import datetime
+from command_runner import run_command, open_stream
+
+READ_SIZE = 64 * 1024
+SEGMENT_SIZE = 8 * 1024 * 1024   # Raw bytes per compressed segment
+KEEP_SEGMENTS = 8                # Per source: at most 64 MB of raw log kept on disk
+MAX_SAMPLES = 3                  # Example lines kept per signature
+
+# (signature, category, patterns); patterns are matched case-insensitively
+SIGNATURES = [
+    ("kernel-panic", "kernel", ["kernel panic - not syncing", "unable to handle kernel",
+                                "internal error: oops", "kernel bug at"]),
+    ("watchdog", "kernel", ["watchdog bark", "hardware watchdog", "softlockup", "hard lockup",
+                            "wdt timeout", "aee_wdt"]),
+    ("dm-verity", "verity", ["dm-verity device corrupted", "verity: data block",
+                             "hash of data does not match digest", "androidboot.veritymode=eio",
+                             "avb_slot_verify failed", "dm_verity: corrupt"]),
+    # Only the failure lines: fs_mgr and e2fsck/fsck.f2fs also log on every healthy boot
+    ("fs-corruption", "storage", ["ext4-fs error", "f2fs-fs error", "failed to mount /data",
+                                  "fs_mgr_mount_all returned an error",
+                                  "failed to mount required partitions",
+                                  "unexpected inconsistency; run fsck manually",
+                                  "e2fsck: aborted", "please run fsck"]),
+    ("modem-crash", "modem", ["modem crashed", "md_ex_info", "mdee", "md1 exception", "ccci_md_exception",
+                              "restart sequence requested for modem", "modem subsystem failure reason",
+                              "ssr: modem", "modem_crash"]),
+    ("system-server-crash", "framework", ["fatal exception in system_server",
+                                          "*** fatal exception in system process",
+                                          "system_server crashed"]),
+    ("rescue-party", "framework", ["rescueparty", "sys.init.updatable_crashing", "rescue_level"]),
+    # Not "init: reboot": init logs "Reboot start" for every ordinary reboot
+    ("init-reboot", "init", ["reboot,bootloop", "init: critical process",
+                             "init: service 'zygote' exited"]),
+    ("battery-low", "power", ["battery is critically low", "shutdown due to low battery",
+                              "ro.boot.bootreason=kernel_panic,lowbat", "vbat too low"]),
+]
+
+# What each category usually means for the repair path
+ADVICE = {
+    "kernel": "Kernel crash during boot - reflash boot/lk/preloader from matching firmware",
+    "verity": "Verified boot failure - system/vendor modified or corrupt, reflash system and vbmeta",
+    "storage": "Filesystem damage on /data - back up, then format userdata",
+    "modem": "Modem crash loop - reflash modem/md1img and restore nvram/nvdata",
+    "framework": "Android framework crash - clear cache or factory reset after backup",
+    "init": "init keeps rebooting - check recent OTA, reflash system/vendor",
+    "power": "Battery too low to finish boot - charge for 30+ minutes before retrying",
+}
+
+
+class SignatureMatcher:
+    """Aho-Corasick automaton compiled to a dense 256-way transition table
+
+    Every byte costs one list lookup regardless of how many patterns there are,
+    and the state survives between feed() calls so matches spanning chunks are found.
+    """
+
+    def __init__(self, signatures=SIGNATURES):
+        goto = [{}]
+        outputs = [[]]
+        for signature, category, patterns in signatures:
+            for pattern in patterns:
+                state = 0
+                for byte in pattern.lower().encode():
+                    nxt = goto[state].get(byte)
+                    if nxt is None:
+                        nxt = goto[state][byte] = len(goto)
+                        goto.append({})
+                        outputs.append([])
+                    state = nxt
+                outputs[state].append((signature, category, len(pattern)))
+
+        # Breadth-first failure links folded straight into the dense table
+        delta = [[0] * 256 for _ in goto]
+        fail = [0] * len(goto)
+        queue = []
+        for byte, nxt in goto[0].items():
+            delta[0][byte] = nxt
+            queue.append(nxt)
+        for state in queue:
+            outputs[state] = outputs[state] + outputs[fail[state]]
+            row = delta[state]
+            fallback = delta[fail[state]]
+            for byte in range(256):
+                nxt = goto[state].get(byte)
+                if nxt is None:
+                    row[byte] = fallback[byte]
+                else:
+                    row[byte] = nxt
+                    fail[nxt] = fallback[byte] if state else 0
+                    queue.append(nxt)
+
+        self.delta = delta
+        self.outputs = [tuple(out) if out else None for out in outputs]
+        self.states = len(goto)
+
+    def scanner(self):
+        return SignatureScanner(self)
+
+
+class SignatureScanner:
+    """Per-stream matcher state: feed chunks, get (signature, category, line) back"""
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.state = 0
+        self.offset = 0
+        self.tail = b""  # Start of the current line carried over from the last chunk
+
+    def feed(self, data):
+        delta = self.matcher.delta
+        outputs = self.matcher.outputs
+        state = self.state
+        hits = []
+        lowered = data.lower()
+        for position, byte in enumerate(lowered):
+            state = delta[state][byte]
+            if outputs[state] is not None:
+                hits.append((position, outputs[state]))
+        self.state = state
+
+        matches = []
+        for position, found in hits:
+            start = data.rfind(b"\n", 0, position) + 1
+            end = data.find(b"\n", position)
+            line = (self.tail if start == 0 else b"") + data[start:end if end >= 0 else len(data)]
+            text = line.decode("utf-8", errors="replace").strip()
+            for signature, category, _ in found:
+                matches.append((signature, category, text))
+
+        last_newline = data.rfind(b"\n")
+        self.tail = (self.tail + data if last_newline < 0 else data[last_newline + 1:])[-4096:]
+        self.offset += len(data)
+        return matches
+
+
+class RotatingLog:
+    """Gzip segments of at most SEGMENT_SIZE raw bytes; the oldest are deleted"""
+
+    def __init__(self, directory, name, segment_size=SEGMENT_SIZE, keep=KEEP_SEGMENTS):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.name = name
+        self.segment_size = segment_size
+        self.keep = keep
+        self.index = 0
+        self.segments = []
+        self.current = None
+        self.written = 0
+
+    def _rotate(self):
+        if self.current:
+            self.current.close()
+        path = self.directory / f"{self.name}.{self.index:04d}.gz"
+        self.index += 1
+        self.current = gzip.open(path, "wb", compresslevel=1)
+        self.segments.append(path)
+        self.written = 0
+        while len(self.segments) > self.keep:
+            self.segments.pop(0).unlink(missing_ok=True)
+
+    def write(self, data):
+        if self.current is None or self.written >= self.segment_size:
+            self._rotate()
+        self.current.write(data)
+        self.written += len(data)
+
+    def close(self):
+        if self.current:
+            self.current.close()
+            self.current = None
+
+
+class Findings:
+    """Signature hit counts with a few sample lines, shared by all capture threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.samples = {}
+        self.categories = {}
+
+    def add(self, source, matches):
+        with self.lock:
+            for signature, category, line in matches:
+                self.counts[signature] = self.counts.get(signature, 0) + 1
+                self.categories[signature] = category
+                samples = self.samples.setdefault(signature, [])
+                sample = f"[{source}] {line}"
+                if len(samples) < MAX_SAMPLES and sample not in samples:
+                    samples.append(sample)
+
+    def ranked(self):
+        """Signatures by hit count, with the advice for their category"""
+        with self.lock:
+            return [{
+                "signature": signature,
+                "category": self.categories[signature],
+                "count": count,
+                "samples": list(self.samples[signature]),
+                "advice": ADVICE.get(self.categories[signature], ""),
+            } for signature, count in sorted(self.counts.items(), key=lambda item: -item[1])]
+
+
+class LogCapture:
+    """Captures one device's logs into logs/capture_<serial>_<time>/ while scanning them"""
+
+    def __init__(self, serial=None, out_dir=None, matcher=None):
+        self.serial = serial
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.out_dir = Path(out_dir or Path(__file__).parent / "logs" / f"capture_{serial or 'device'}_{stamp}")
+        self.matcher = matcher or get_matcher()
+        self.findings = Findings()
+        self.streams = []
+        self.threads = []
+        self.bytes = {}
+        self.lock = threading.Lock()
+
+    def log(self, message):
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        print(f"[{timestamp}] [LOGS] {message}")
+
+    def _adb(self, *args):
+        return (["adb", "-s", self.serial] if self.serial else ["adb"]) + list(args)
+
+    def sources(self):
+        """(name, command, streaming) for each log the device can give us"""
+        return [
+            ("logcat", self._adb("logcat", "-b", "all", "-v", "threadtime"), True),
+            ("dmesg", self._adb("exec-out", "dmesg -w 2>/dev/null || su -c 'dmesg -w'"), True),
+            ("last_kmsg", self._adb("exec-out", "cat /sys/fs/pstore/console-ramoops* /sys/fs/pstore/dmesg-ramoops* "
+                                    "/proc/last_kmsg 2>/dev/null"), False),
+        ]
+
+    def consume(self, name, stream):
+        """Copy a binary stream into a rotating log while scanning it"""
+        log = RotatingLog(self.out_dir, name)
+        scanner = self.matcher.scanner()
+        total = 0
+        try:
+            while True:
+                data = stream.read1(READ_SIZE) if hasattr(stream, "read1") else stream.read(READ_SIZE)
+                if not data:
+                    break
+                log.write(data)
+                total += len(data)
+                matches = scanner.feed(data)
+                if matches:
+                    self.findings.add(name, matches)
+        except (OSError, ValueError):
+            pass  # Stream closed by stop()
+        finally:
+            log.close()
+            with self.lock:
+                self.bytes[name] = total
+        return total
+
+    def _run_source(self, name, command):
+        try:
+            stream = open_stream(command)
+        except FileNotFoundError:
+            self.log("adb not found")
+            return
+        with self.lock:
+            self.streams.append(stream)
+        try:
+            self.consume(name, stream.proc.stdout)
+        finally:
+            stream.close()
+
+    def start(self):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        for name, command, _ in self.sources():
+            thread = threading.Thread(target=self._run_source, args=(name, command), name=f"capture-{name}",
+                                      daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        with self.lock:
+            streams = list(self.streams)
+        for stream in streams:
+            stream.close()
+        for thread in self.threads:
+            thread.join(5)
+
+    def capture(self, seconds):
+        """Capture for a fixed time (or until the device drops off) and return the findings"""
+        self.log(f"Capturing logcat, dmesg and last_kmsg for {seconds}s into {self.out_dir}")
+        self.start()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end and any(thread.is_alive() for thread in self.threads[:2]):
+            time.sleep(0.5)
+        self.stop()
+        self.log(", ".join(f"{name}: {size / 1024:.0f} KB" for name, size in sorted(self.bytes.items())))
+        return self.findings.ranked()
+
+
+def analyze_files(paths, matcher=None):
+    """Scan saved logs (plain or .gz) for boot-loop signatures"""
+    matcher = matcher or get_matcher()
+    findings = Findings()
+    for path in paths:
+        path = Path(path)
+        opener = gzip.open if path.suffix == ".gz" else open
+        scanner = matcher.scanner()
+        with opener(path, "rb") as f:
+            while True:
+                data = f.read(READ_SIZE)
+                if not data:
+                    break
+                matches = scanner.feed(data)
+                if matches:
+                    findings.add(path.name, matches)
+    return findings.ranked()
+
+
+def report(ranked, log=print):
+    if not ranked:
+        log("No known boot-loop signature found")
+        return
+    for finding in ranked:
+        log(f"{finding['signature']} ({finding['category']}): {finding['count']} hits")
+        for sample in finding["samples"]:
+            log(f"    {sample[:160]}")
+        log(f"    -> {finding['advice']}")
+
+
+def adb_devices():
+    result = run_command(["adb", "devices"], timeout=10)
+    return [line.split()[0] for line in result.stdout.splitlines()[1:]
+            if line.strip() and line.split()[-1] == "device"]
+
+
+_matcher = None
+
+
+def get_matcher():
+    """Shared automaton, compiled on first use"""
+    global _matcher
+    if _matcher is None:
+        _matcher = SignatureMatcher()
+    return _matcher
+
+
+def benchmark(megabytes=16):
+    """Throughput of the automaton against a naive per-pattern scan"""
+    import random
+
+    rng = random.Random(7)
+    words = [b"ActivityManager", b"Start proc", b"binder", b"healthd", b"battery l=57", b"audit",
+             b"avc: denied", b"WindowManager", b"I/chatty", b"uid=1000"]
+    lines = [b" ".join(rng.choice(words) for _ in range(12)) + b"\n" for _ in range(2000)]
+    lines[1234] = b"<0>[  12.345] Kernel panic - not syncing: Attempted to kill init!\n"
+    block = b"".join(lines)
+    data = block * max(1, megabytes * 1024 * 1024 // len(block))
+    patterns = [pattern.encode() for _, _, group in SIGNATURES for pattern in group]
+
+    started = time.perf_counter()
+    scanner = get_matcher().scanner()
+    hits = 0
+    for i in range(0, len(data), READ_SIZE):
+        hits += len(scanner.feed(data[i:i + READ_SIZE]))
+    automaton = time.perf_counter() - started
+
+    started = time.perf_counter()
+    naive_hits = 0
+    for i in range(0, len(data), READ_SIZE):
+        chunk = data[i:i + READ_SIZE].lower()
+        naive_hits += sum(chunk.count(pattern) for pattern in patterns)
+    naive = time.perf_counter() - started
+
+    size = len(data) / 1e6
+    print(f"{size:.1f} MB, {len(patterns)} patterns, {get_matcher().states} automaton states")
+    print(f"Aho-Corasick (one pass):      {automaton:7.3f}s {size / automaton:8.1f} MB/s, {hits} hits")
+    print(f"bytes.count per pattern:      {naive:7.3f}s {size / naive:8.1f} MB/s, {naive_hits} hits")
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 16)
+        return
+    if len(sys.argv) >= 3 and sys.argv[1] == "analyze":
+        report(analyze_files(sys.argv[2:]))
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] == "capture":
+        serial = sys.argv[2] if len(sys.argv) > 2 else None
+        seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 60
+        capture = LogCapture(serial)
+        report(capture.capture(seconds), capture.log)
+        return
+    print("Usage: python log_capture.py capture [serial] [seconds]")
+    print("       python log_capture.py analyze <log> [log.gz ...]")
+    print("       python log_capture.py bench [megabytes]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Modem Probe - Asks the modem itself over its AT command port
+Sends the whole query batch as one compound command line, splits the answers by
+response prefix and probes every modem on the bench concurrently
+"""
+
+import re
+import sys
+import time
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from serial_port import TransportClosed, TransportTimeout, find_ports, open_port, pty_pair
+
+# Query batch: (fact, command); ATE0 first so responses carry no echo
+QUERIES = [
+    (None, "ATE0"),
+    ("at_sim_state", "AT+CPIN?"),
+    ("signal", "AT+CSQ"),
+    ("registration", "AT+CREG?"),
+    ("at_imei", "AT+CGSN"),
+    ("modem_firmware", "AT+CGMR"),
+    ("modem_model", "AT+CGMM"),
+]
+
+AT_PORT_NAMES = ["USB Modem", "HS-USB Modem", "Modem Port", "AT Port", "MTK USB Modem"]
+FINAL_RESULT = re.compile(rb"^(OK|ERROR|NO CARRIER|\+CME ERROR: ?(.+)|\+CMS ERROR: ?(.+))$")
+
+REGISTRATION = {"0": "not registered", "1": "home", "2": "searching", "3": "denied",
+                "4": "unknown", "5": "roaming"}
+
+# +CME ERROR codes that matter for a dropped phone
+CME_ERRORS = {"10": "SIM not inserted", "13": "SIM failure", "14": "SIM busy", "15": "SIM wrong",
+              "11": "SIM PIN required", "12": "SIM PUK required", "100": "unknown error"}
+
+
+def read_responses(transport, count, timeout):
+    """Collect count responses, each a list of lines ending with a final result code"""
+    end = time.monotonic() + timeout
+    buffer = b""
+    responses = []
+    lines = []
+    while len(responses) < count:
+        newline = buffer.find(b"\r")
+        if newline < 0:
+            left = end - time.monotonic()
+            if left <= 0:
+                raise TransportTimeout(f"{len(responses)} of {count} AT responses before timeout")
+            buffer += transport.read(4096, left)
+            continue
+        line, buffer = buffer[:newline].strip(b"\n "), buffer[newline + 1:]
+        if not line:
+            continue
+        match = FINAL_RESULT.match(line)
+        if match:
+            responses.append((line.decode(errors="replace"), [l.decode(errors="replace") for l in lines]))
+            lines = []
+        else:
+            lines.append(line)
+    return responses
+
+
+def compound(commands):
+    """One V.250 command line: basic commands run together, extended ones joined by ';'
+
+    ["ATE0", "AT+CPIN?", "AT+CSQ"] -> "ATE0+CPIN?;+CSQ"
+    """
+    basic = "".join(command[2:] for command in commands if not command[2:].startswith("+"))
+    extended = ";".join(command[2:] for command in commands if command[2:].startswith("+"))
+    return f"AT{basic}{extended}"
+
+
+def split_compound(commands, final, lines):
+    """Share one compound line's intermediate lines out as per-command (final, lines)
+
+    Prefixed lines (+CSQ: ...) go to their command; unprefixed ones (+CGSN, +CGMR,
+    +CGMM answers) to the command after the last one answered. A failing command
+    ends the line, so it gets the error and the commands after it get None.
+    """
+    extended = [i for i, command in enumerate(commands) if command[2:].startswith("+")]
+    prefixes = {commands[i][2:].rstrip("?").split("=")[0].upper(): i for i in extended}
+    answered = {i: [] for i in range(len(commands))}
+    position = -1
+    for line in lines:
+        prefix = line.split(":", 1)[0].upper() if line.startswith("+") else None
+        if prefix in prefixes:
+            position = prefixes[prefix]
+        else:
+            position = next((i for i in extended if i > position), position)
+        answered.setdefault(position, []).append(line)
+    if final == "OK":
+        return [("OK", answered[i]) for i in range(len(commands))]
+
+    failed = next((i for i in extended if i > position and not answered[i]), extended[-1] if extended else 0)
+    return [("OK", answered[i]) if i < failed else (final, answered[i]) if i == failed else None
+            for i in range(len(commands))]
+
+
+def parse_response(fact, command, final, lines):
+    """One query's result -> fact value ("ERROR: ..." when the modem refused it)"""
+    body = [line for line in lines if line.upper() != command.upper()]  # Echo before ATE0 took effect
+    if final != "OK":
+        if final.startswith("+CME ERROR"):
+            code = final.split(":", 1)[1].strip()
+            return f"ERROR: {CME_ERRORS.get(code, code)}"
+        return f"ERROR: {final}"
+    if not body:
+        return ""
+
+    value = body[0]
+    if ":" in value and value.startswith("+"):
+        value = value.split(":", 1)[1].strip()
+    if fact == "at_sim_state":
+        return value  # READY, SIM PIN, ...
+    if fact == "signal":
+        rssi = value.split(",")[0].strip()
+        if not rssi.isdigit() or rssi == "99":
+            return "unknown"
+        return f"{-113 + 2 * int(rssi)} dBm"
+    if fact == "registration":
+        stat = value.split(",")[1].strip() if "," in value else value.strip()
+        return REGISTRATION.get(stat, stat)
+    if fact == "at_imei":
+        digits = re.sub(r"\D", "", value)
+        return digits if len(digits) >= 14 else value
+    return value
+
+
+class ModemProbe:
+    """One AT session: the whole batch goes out as one compound command line
+
+    If a command fails the modem abandons the rest of the line, so the commands
+    after it are sent again as a shorter compound line.
+    """
+
+    def __init__(self, transport, timeout=5.0, pipelined=True):
+        self.transport = transport
+        self.timeout = timeout
+        self.pipelined = pipelined
+
+    def query(self, queries=QUERIES):
+        facts = {"modem_responding": False}
+        started = time.perf_counter()
+        if self.pipelined:
+            commands = [command for _, command in queries]
+            responses = []
+            while len(responses) < len(commands):
+                pending = commands[len(responses):]
+                line = compound(pending)
+                self.transport.write(f"{line}\r".encode())
+                final, lines = read_responses(self.transport, 1, self.timeout)[0]
+                lines = [text for text in lines if text.upper() != line.upper()]  # Echo before E0 applied
+                for response in split_compound(pending, final, lines):
+                    if response is None:
+                        break
+                    responses.append(response)
+        else:
+            responses = []
+            for _, command in queries:
+                self.transport.write(f"{command}\r".encode())
+                responses.extend(read_responses(self.transport, 1, self.timeout))
+
+        facts["modem_responding"] = True
+        for (fact, command), (final, lines) in zip(queries, responses):
+            if fact:
+                facts[fact] = parse_response(fact, command, final, lines)
+        facts["modem_query_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return facts
+
+
+def probe_port(port, timeout=5.0):
+    """Open a COM port and run the query batch; errors become facts, not exceptions"""
+    try:
+        transport = open_port(port)
+    except (RuntimeError, OSError) as e:
+        return {"port": port, "modem_responding": False, "modem_error": str(e)}
+    try:
+        facts = ModemProbe(transport, timeout).query()
+    except (TransportTimeout, TransportClosed) as e:
+        facts = {"modem_responding": False, "modem_error": str(e)}
+    finally:
+        transport.close()
+    facts["port"] = port
+    return facts
+
+
+def probe_all(ports=None, timeout=5.0, workers=8):
+    """Probe every AT port on the bench at once; returns {port: facts}"""
+    ports = ports if ports is not None else find_ports(AT_PORT_NAMES)
+    if not ports:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(ports))) as pool:
+        return dict(zip(ports, pool.map(lambda port: probe_port(port, timeout), ports)))
+
+
+class FakeModem:
+    """AT modem on the device end of a pty; replies arrive latency seconds after each command
+
+    Replies are scheduled rather than slept on, like a USB link whose round trip
+    dominates: a pipelined batch costs one latency, a lock-step batch one per command.
+    """
+
+    def __init__(self, transport, sim="READY", rssi=18, creg=1, imei="356938035643809",
+                 firmware="MOLY.LR12A.R3.MP.V98", model="TA-1358", latency=0.02):
+        self.transport = transport
+        self.sim = sim
+        self.rssi = rssi
+        self.creg = creg
+        self.imei = imei
+        self.firmware = firmware
+        self.model = model
+        self.latency = latency
+        self.echo = True
+        self.outbox = []
+        self.cond = threading.Condition()
+        self.running = True
+
+    def start(self):
+        threading.Thread(target=self._reader, name="fake-modem", daemon=True).start()
+        threading.Thread(target=self._writer, name="fake-modem-tx", daemon=True).start()
+        return self
+
+    def reply(self, line):
+        """Answer a command line; a compound line stops at its first failing command"""
+        if not line.upper().startswith("AT"):
+            return "ERROR"
+        body = line[2:]
+        plus = body.find("+")
+        basic, extended = (body, "") if plus < 0 else (body[:plus], body[plus:])
+        commands = ([f"AT{basic}"] if basic else []) + [f"AT{part}" for part in extended.split(";") if part]
+        intermediate = []
+        for command in commands or ["AT"]:
+            answer = self.execute(command).split("\r\n")
+            if answer[-1] != "OK":
+                return "\r\n".join(intermediate + answer[-1:])
+            intermediate += answer[:-1]
+        return "\r\n".join(intermediate + ["OK"])
+
+    def execute(self, command):
+        upper = command.upper()
+        if upper == "ATE0":
+            self.echo = False
+            return "OK"
+        if upper == "AT+CPIN?":
+            if self.sim == "ABSENT":
+                return "+CME ERROR: 10"
+            return f"+CPIN: {self.sim}\r\nOK"
+        if upper == "AT+CSQ":
+            return f"+CSQ: {self.rssi},99\r\nOK"
+        if upper == "AT+CREG?":
+            return f"+CREG: 0,{self.creg}\r\nOK"
+        if upper == "AT+CGSN":
+            return f"{self.imei}\r\nOK"
+        if upper == "AT+CGMR":
+            return f"{self.firmware}\r\nOK"
+        if upper == "AT+CGMM":
+            return f"{self.model}\r\nOK"
+        if upper == "AT":
+            return "OK"
+        return "ERROR"
+
+    def _reader(self):
+        buffer = b""
+        while self.running:
+            try:
+                data = self.transport.read(4096, 0.5)
+            except TransportClosed:
+                return
+            buffer += data
+            while b"\r" in buffer:
+                line, buffer = buffer.split(b"\r", 1)
+                command = line.strip(b"\n ").decode(errors="replace")
+                if not command:
+                    continue
+                text = (f"{command}\r\n" if self.echo and command.upper() != "ATE0" else "") + \
+                    f"\r\n{self.reply(command)}\r\n"
+                with self.cond:
+                    heapq.heappush(self.outbox, (time.monotonic() + self.latency, len(self.outbox), text))
+                    self.cond.notify()
+
+    def _writer(self):
+        with self.cond:
+            while self.running:
+                if not self.outbox:
+                    self.cond.wait(0.5)
+                    continue
+                due, _, text = self.outbox[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+                heapq.heappop(self.outbox)
+                try:
+                    self.transport.write(text.encode())
+                except OSError:
+                    return
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify()
+
+
+def benchmark(devices=8, latency=0.02):
+    """Lock-step vs pipelined queries, sequential vs concurrent across fake modems"""
+    def bench(label, pipelined, concurrent):
+        pairs = [pty_pair() for _ in range(devices)]
+        modems = [FakeModem(target, latency=latency, sim="ABSENT" if i % 3 == 0 else "READY").start()
+                  for i, (_, target) in enumerate(pairs)]
+        started = time.perf_counter()
+        probe = lambda host: ModemProbe(host, pipelined=pipelined).query()
+        if concurrent:
+            with ThreadPoolExecutor(max_workers=devices) as pool:
+                results = list(pool.map(probe, [host for host, _ in pairs]))
+        else:
+            results = [probe(host) for host, _ in pairs]
+        elapsed = time.perf_counter() - started
+        for modem in modems:
+            modem.stop()
+        for host, target in pairs:
+            host.close()
+        print(f"{label:<32} {elapsed * 1000:8.1f} ms for {devices} modems")
+        return results
+
+    print(f"{len(QUERIES)} queries per modem, {latency * 1000:.0f} ms link latency")
+    bench("lock-step, one modem at a time", False, False)
+    bench("compound line, one modem at a time", True, False)
+    results = bench("compound line, all modems at once", True, True)
+    print(f"Sample: {results[0]}")
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 8)
+        return
+    ports = sys.argv[1:] or None
+    results = probe_all(ports)
+    if not results:
+        print("No AT modem port found (enable the diagnostic/modem USB interface first)")
+    for port, facts in results.items():
+        print(f"{port}:")
+        for key, value in facts.items():
+            if key != "port":
+                print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
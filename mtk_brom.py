@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+MTK BROM - MediaTek BootROM/PreLoader download-mode client
+Opens the VCOM port the moment it appears, runs the 4-byte start handshake,
+disables the watchdog so the device stays in download mode and reads the chip codes
+"""
+
+import sys
+import time
+import struct
+import threading
+from datetime import datetime
+from serial_port import TransportClosed, TransportTimeout, find_ports, open_port, pty_pair
+from poll_scheduler import AdaptivePoller, poll_until
+
+# Host sends each byte, the device answers with its bitwise inverse
+HANDSHAKE = (0xA0, 0x0A, 0x50, 0x05)
+
+CMD_GET_HW_SW_VER = 0xFC
+CMD_GET_HW_CODE = 0xFD
+CMD_GET_BL_VER = 0xFE
+CMD_GET_TARGET_CONFIG = 0xD8
+CMD_GET_ME_ID = 0xE1
+CMD_WRITE32 = 0xD4
+CMD_READ32 = 0xD1
+
+PORT_NAMES = ["MediaTek PreLoader USB VCOM", "MediaTek USB Port", "VID_0E8D&PID_2000", "VID_0E8D&PID_0003"]
+WATCHDOG_OFF = 0x22000000
+
+# hw_code -> (chip, watchdog register); chips seen in Nokia/budget MediaTek phones
+CHIPS = {
+    0x0717: ("MT6761", 0x10007000),
+    0x0766: ("MT6765", 0x10007000),
+    0x0707: ("MT6768", 0x10007000),
+    0x0788: ("MT6771", 0x10007000),
+    0x0690: ("MT6763", 0x10007000),
+    0x0725: ("MT6779", 0x10007000),
+    0x0813: ("MT6785", 0x10007000),
+    0x0699: ("MT6739", 0x10007000),
+    0x0996: ("MT6853", 0x10007000),
+    0x0989: ("MT6833", 0x10007000),
+}
+
+WORD = struct.Struct(">H")
+DWORD = struct.Struct(">I")
+
+
+class BromError(Exception):
+    pass
+
+
+class BromClient:
+    """Command layer over any serial_port.Transport (big-endian, every byte echoed)"""
+
+    def __init__(self, transport, timeout=1.0):
+        self.transport = transport
+        self.timeout = timeout
+
+    def _read(self, size):
+        return self.transport.read_exact(size, self.timeout)
+
+    def _echo(self, data):
+        """Send data and check the device echoes it back unchanged"""
+        self.transport.write(data)
+        echoed = self._read(len(data))
+        if echoed != data:
+            raise BromError(f"Echo mismatch: sent {data.hex()}, got {echoed.hex()}")
+
+    def _status(self, what):
+        status = WORD.unpack(self._read(2))[0]
+        if status > 0xFF:
+            raise BromError(f"{what} failed with status {status:#06x}")
+        return status
+
+    def handshake(self, deadline=2.0):
+        """Hammer 0xA0 until the device answers 0x5F, then finish the sequence"""
+        end = time.monotonic() + deadline
+        while True:
+            if time.monotonic() > end:
+                raise BromError("No handshake response (not in BROM/PreLoader mode?)")
+            self.transport.write(bytes([HANDSHAKE[0]]))
+            # PreLoader prints "READY" first; anything else is noise from before the sync
+            reply = self.transport.read(64, 0.01)
+            if reply.endswith(bytes([HANDSHAKE[0] ^ 0xFF])):
+                # Earlier 0xA0s may still be answered: drain until the line goes quiet
+                while self.transport.read(64, 0.005):
+                    pass
+                break
+        for byte in HANDSHAKE[1:]:
+            self.transport.write(bytes([byte]))
+            reply = self._read(1)
+            if reply != bytes([byte ^ 0xFF]):
+                raise BromError(f"Handshake broke at {byte:#04x}: got {reply.hex()}")
+        return True
+
+    def hw_code(self):
+        self._echo(bytes([CMD_GET_HW_CODE]))
+        code = WORD.unpack(self._read(2))[0]
+        self._status("GET_HW_CODE")
+        return code
+
+    def hw_sw_version(self):
+        self._echo(bytes([CMD_GET_HW_SW_VER]))
+        subcode, hw_ver, sw_ver = struct.unpack(">HHH", self._read(6))
+        self._status("GET_HW_SW_VER")
+        return {"hw_subcode": subcode, "hw_ver": hw_ver, "sw_ver": sw_ver}
+
+    def bl_version(self):
+        """BROM echoes the command byte back; PreLoader answers with its version"""
+        self.transport.write(bytes([CMD_GET_BL_VER]))
+        version = self._read(1)[0]
+        return "brom" if version == CMD_GET_BL_VER else "preloader", version
+
+    def target_config(self):
+        self._echo(bytes([CMD_GET_TARGET_CONFIG]))
+        config = DWORD.unpack(self._read(4))[0]
+        self._status("GET_TARGET_CONFIG")
+        return {
+            "raw": config,
+            "secure_boot": bool(config & 0x1),
+            "sla": bool(config & 0x2),
+            "daa": bool(config & 0x4),
+        }
+
+    def me_id(self):
+        self._echo(bytes([CMD_GET_ME_ID]))
+        length = DWORD.unpack(self._read(4))[0]
+        value = self._read(length)
+        self._status("GET_ME_ID")
+        return value.hex()
+
+    def read32(self, address, count=1):
+        self._echo(bytes([CMD_READ32]))
+        self._echo(DWORD.pack(address))
+        self._echo(DWORD.pack(count))
+        self._status("READ32")
+        values = [DWORD.unpack(self._read(4))[0] for _ in range(count)]
+        self._status("READ32 data")
+        return values
+
+    def write32(self, address, *values):
+        self._echo(bytes([CMD_WRITE32]))
+        self._echo(DWORD.pack(address))
+        self._echo(DWORD.pack(len(values)))
+        self._status("WRITE32")
+        for value in values:
+            self._echo(DWORD.pack(value))
+        self._status("WRITE32 data")
+
+    def disable_watchdog(self, chip_code):
+        _, register = CHIPS.get(chip_code, (None, 0x10007000))
+        self.write32(register, WATCHDOG_OFF)
+
+
+class BromSession:
+    """Result of catching a device: the open client plus what it told us"""
+
+    def __init__(self, port, client, info):
+        self.port = port
+        self.client = client
+        self.info = info
+
+    def release(self):
+        """Close the port so SP Flash Tool (or the next pipeline stage) can take the device"""
+        self.client.transport.close()
+
+
+def catch_device(transport, log=print, hold=True):
+    """Handshake, identify and (optionally) stop the watchdog; returns the info dict"""
+    started = time.perf_counter()
+    client = BromClient(transport)
+    client.handshake()
+    handshake_ms = (time.perf_counter() - started) * 1000
+
+    mode, bl_version = client.bl_version()
+    code = client.hw_code()
+    info = {
+        "mode": mode,
+        "bl_version": bl_version,
+        "hw_code": f"{code:#06x}",
+        "chip": CHIPS.get(code, ("unknown", None))[0],
+    }
+    info.update(client.hw_sw_version())
+    info["target_config"] = client.target_config()
+    if mode == "brom":
+        info["me_id"] = client.me_id()
+    if hold:
+        client.disable_watchdog(code)
+        info["watchdog"] = "disabled"
+    info["handshake_ms"] = round(handshake_ms, 1)
+    info["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    log(f"{info['chip']} ({info['hw_code']}) in {mode} mode, handshake {info['handshake_ms']} ms, "
+        f"secure boot {'on' if info['target_config']['secure_boot'] else 'off'}")
+    return client, info
+
+
+def wait_and_catch(timeout=60, port=None, handoff=None, log=print):
+    """Poll for the VCOM port at burst rate and handshake the moment it appears
+
+    handoff(session) runs while the device is held in download mode; without one
+    the port is released straight away for SP Flash Tool.
+    """
+    poller = AdaptivePoller(fast=0.02)
+    found = [port] if port else poll_until(lambda: find_ports(PORT_NAMES), timeout, poller)
+    if not found:
+        log("No MediaTek download port appeared")
+        return None
+
+    log(f"MediaTek port {found[0]} appeared - handshaking")
+    transport = open_port(found[0])
+    try:
+        client, info = catch_device(transport, log)
+    except (BromError, TransportTimeout, TransportClosed) as e:
+        transport.close()
+        log(f"Handshake failed: {e}")
+        return None
+
+    session = BromSession(found[0], client, info)
+    if handoff:
+        handoff(session)
+    else:
+        session.release()
+        log("Device held in download mode - start the SP Flash Tool download now")
+    return session
+
+
+class SimulatedMtkDevice:
+    """BROM/PreLoader target on the device end of a transport pair
+
+    If the watchdog is not disabled within window seconds the device "reboots"
+    and closes its end, like a real phone leaving the PreLoader window.
+    """
+
+    def __init__(self, transport, hw_code=0x0766, mode="brom", window=None, noise=b"READY"):
+        self.transport = transport
+        self.hw_code = hw_code
+        self.mode = mode
+        self.window = window
+        self.noise = noise
+        self.watchdog_disabled = False
+        self.memory = {}
+        self.thread = None
+        self.error = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="sim-mtk", daemon=True)
+        self.thread.start()
+        return self
+
+    def _read(self, size):
+        remaining = None
+        if self.window and not self.watchdog_disabled:
+            remaining = max(0.0, self.started + self.window - time.monotonic())
+        return self.transport.read_exact(size, remaining)
+
+    def _echo(self, size):
+        data = self._read(size)
+        self.transport.write(data)
+        return data
+
+    def _word(self, value):
+        self.transport.write(WORD.pack(value))
+
+    def _run(self):
+        self.started = time.monotonic()
+        try:
+            if self.mode == "preloader" and self.noise:
+                self.transport.write(self.noise)
+            index = 0
+            while index < len(HANDSHAKE):
+                byte = self._read(1)[0]
+                if byte == HANDSHAKE[index]:
+                    self.transport.write(bytes([byte ^ 0xFF]))
+                    index += 1
+                else:
+                    index = 1 if byte == HANDSHAKE[0] else 0
+                    if index:
+                        self.transport.write(bytes([byte ^ 0xFF]))
+            while True:
+                self._command(self._read(1)[0])
+        except (TransportTimeout, TransportClosed):
+            pass  # Watchdog fired (the device rebooted out of download mode) or the host let go
+        except Exception as e:
+            self.error = e
+        finally:
+            self.transport.close()
+
+    def _command(self, command):
+        if command == CMD_GET_BL_VER:
+            self.transport.write(bytes([CMD_GET_BL_VER if self.mode == "brom" else 0x01]))
+            return
+        self.transport.write(bytes([command]))
+        if command == CMD_GET_HW_CODE:
+            self._word(self.hw_code)
+            self._word(0)
+        elif command == CMD_GET_HW_SW_VER:
+            self.transport.write(struct.pack(">HHH", 0x8A00, 0xCA00, 0x0000))
+            self._word(0)
+        elif command == CMD_GET_TARGET_CONFIG:
+            self.transport.write(DWORD.pack(0x5))
+            self._word(0)
+        elif command == CMD_GET_ME_ID:
+            self.transport.write(DWORD.pack(16) + bytes(range(16)))
+            self._word(0)
+        elif command in (CMD_READ32, CMD_WRITE32):
+            address = DWORD.unpack(self._echo(4))[0]
+            count = DWORD.unpack(self._echo(4))[0]
+            self._word(0)
+            for i in range(count):
+                if command == CMD_READ32:
+                    self.transport.write(DWORD.pack(self.memory.get(address + 4 * i, 0)))
+                else:
+                    value = DWORD.unpack(self._echo(4))[0]
+                    self.memory[address + 4 * i] = value
+                    if address + 4 * i == CHIPS.get(self.hw_code, (None, 0x10007000))[1] and value == WATCHDOG_OFF:
+                        self.watchdog_disabled = True
+            self._word(0)
+        else:
+            self._word(0x1D0D)  # Unsupported command
+
+
+def simulate(mode="brom", window=3.0, log=print):
+    """Catch a simulated device over a pty and show what the client learns"""
+    host, target = pty_pair()
+    device = SimulatedMtkDevice(target, mode=mode, window=window).start()
+    client, info = catch_device(host, log)
+    time.sleep(window + 0.5)
+    alive = device.thread.is_alive()
+    log(f"After {window}s: device {'still in download mode' if alive else 'rebooted'}")
+    host.close()
+    return info
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "simulate":
+        mode = sys.argv[2] if len(sys.argv) > 2 else "brom"
+        for key, value in simulate(mode).items():
+            print(f"  {key}: {value}")
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] == "catch":
+        timeout = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Waiting {timeout:.0f}s for a MediaTek download port...")
+        wait_and_catch(timeout, sys.argv[3] if len(sys.argv) > 3 else None)
+        return
+    print("Usage: python mtk_brom.py catch [timeout] [COMx]")
+    print("       python mtk_brom.py simulate [brom|preloader]")
+
+
+if __name__ == "__main__":
+    main()
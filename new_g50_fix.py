@@ -4,9 +4,15 @@ New Nokia G50 - Tesco SIM Calling Issues
 Phone works but can't make outgoing calls
 """
 
-import subprocess
+from command_runner import run_command
 import time
 
+PLUGIN_MANIFEST = {
+    "description": "Outgoing call fixes for a working G50 on a new SIM",
+    "models": ["Nokia G50"],
+    "capabilities": {"fix-calling": "fix_new_g50_calling"},
+}
+
 def fix_new_g50_calling():
     print("=== New Nokia G50 - Tesco SIM Calling Fix ===")
     print("SIM works but can't make outgoing calls")
@@ -24,7 +30,7 @@ def fix_new_g50_calling():
     print("Resetting network registration...")
     for cmd in commands:
         try:
-            subprocess.run(cmd, timeout=5)
+            run_command(cmd, timeout=5)
             time.sleep(2)
         except:
             print(f"Command failed: {' '.join(cmd[2:])}")
@@ -4,14 +4,28 @@ Nokia G50 SIM/Network Analyzer
 Diagnoses and fixes SIM connectivity issues after physical damage
 """
 
-import subprocess
+from command_runner import run_command
 import time
 from datetime import datetime
+from device_profiles import get_database
+from diagnosis_rules import RuleEngine
+from fastboot_state import get_fastboot_state
+from script_templates import get_generator, profile_context
+from results_store import get_store
+from modem_probe import probe_all
+from dumpsys_parser import dumpsys, service_call
+
+PLUGIN_MANIFEST = {
+    "description": "SIM/network diagnosis for a dropped G50",
+    "models": ["Nokia G50"],
+    "capabilities": {"analyze": "main"},
+}
 
 class NokiaG50Analyzer:
     def __init__(self):
         self.device_connected = False
         self.adb_available = False
+        self.profile = get_database().by_model("Nokia G50")
         
     def log(self, message):
         timestamp = datetime.now().strftime("%H:%M:%S")
@@ -20,7 +34,7 @@ class NokiaG50Analyzer:
     def check_adb_connection(self):
         """Check if G50 is connected via ADB"""
         try:
-            result = subprocess.run(["adb", "devices"], capture_output=True, text=True)
+            result = run_command(["adb", "devices"])
             if "device" in result.stdout and not "List of devices" in result.stdout.replace("List of devices attached", ""):
                 self.device_connected = True
                 self.adb_available = True
@@ -32,8 +46,14 @@ class NokiaG50Analyzer:
     def check_fastboot_connection(self):
         """Check if G50 is in fastboot mode"""
         try:
-            result = subprocess.run(["fastboot", "devices"], capture_output=True, text=True)
-            if result.stdout.strip():
+            fastboot = get_fastboot_state()
+            serials = fastboot.devices()
+            for serial in serials:
+                snapshot = fastboot.snapshot(serial)
+                if snapshot:
+                    self.log(f"Fastboot {serial}: unlocked={snapshot.unlocked} "
+                             f"slot={snapshot.current_slot} max-download-size={snapshot.max_download_size}")
+            if serials:
                 self.device_connected = True
                 return True
         except:
@@ -46,18 +66,13 @@ class NokiaG50Analyzer:
             return None
         
         info = {}
-        commands = {
-            "model": "getprop ro.product.model",
-            "baseband": "getprop ro.baseband",
-            "radio": "getprop ro.radio.version", 
-            "imei": "service call iphonesubinfo 1",
-            "sim_state": "getprop gsm.sim.state",
-            "network_type": "getprop gsm.network.type"
-        }
-        
-        for key, cmd in commands.items():
+        for key, cmd in self.profile["probes"].items():
             try:
-                result = subprocess.run(["adb", "shell", cmd], capture_output=True, text=True)
+                if cmd.startswith("service call"):
+                    # Parcel hex dump -> the string it carries (IMEI only when Luhn-valid)
+                    info[key] = service_call(cmd).facts().get(key, "Unknown")
+                    continue
+                result = run_command(["adb", "shell", cmd])
                 info[key] = result.stdout.strip()
             except:
                 info[key] = "Unknown"
@@ -74,7 +89,7 @@ class NokiaG50Analyzer:
         
         # Check SIM detection
         try:
-            result = subprocess.run(["adb", "shell", "getprop", "gsm.sim.state"], capture_output=True, text=True)
+            result = run_command(["adb", "shell", "getprop", "gsm.sim.state"])
             sim_state = result.stdout.strip()
             
             self.log(f"SIM State: {sim_state}")
@@ -102,7 +117,7 @@ class NokiaG50Analyzer:
         
         try:
             # Check baseband version
-            result = subprocess.run(["adb", "shell", "getprop", "ro.baseband"], capture_output=True, text=True)
+            result = run_command(["adb", "shell", "getprop", "ro.baseband"])
             baseband = result.stdout.strip()
             self.log(f"Baseband Version: {baseband}")
             
@@ -111,7 +126,7 @@ class NokiaG50Analyzer:
                 return False
             
             # Check radio interface
-            result = subprocess.run(["adb", "shell", "getprop", "ril.version"], capture_output=True, text=True)
+            result = run_command(["adb", "shell", "getprop", "ril.version"])
             ril = result.stdout.strip()
             self.log(f"RIL Version: {ril}")
             
@@ -121,86 +136,153 @@ class NokiaG50Analyzer:
             self.log(f"Error checking baseband: {e}")
             return False
     
+    def check_modem_at(self, imei=None):
+        """Query the modem directly on its AT port - works without USB debugging
+
+        With several phones on the bench the port is the one whose +CGSN matches
+        the IMEI adb reported; without an IMEI only a lone port is trusted.
+        """
+        self.log("=== Modem AT Diagnosis ===")
+        results = probe_all()
+        if not results:
+            self.log("No AT modem port exposed (diagnostic USB interface not enabled)")
+            return {}
+        
+        if imei:
+            matches = [(port, facts) for port, facts in results.items() if facts.get("at_imei") == imei]
+            if not matches:
+                self.log(f"No AT port answers with IMEI {imei} - modem facts skipped")
+                return {}
+        elif len(results) > 1:
+            self.log(f"{len(results)} AT ports and no IMEI to tell them apart - modem facts skipped")
+            return {}
+        else:
+            matches = list(results.items())
+        port, facts = matches[0]
+        for key, value in facts.items():
+            if key != "port":
+                self.log(f"{port} {key}: {value}")
+        facts.pop("port")
+        return facts
+    
     def run_network_diagnostics(self):
         """Run comprehensive network diagnostics"""
         self.log("=== Network Diagnostics ===")
         
+        results = {}
         if not self.adb_available:
-            return
+            return results
         
         diagnostics = [
-            ("Network Operator", "getprop gsm.operator.alpha"),
-            ("Network Type", "getprop gsm.network.type"),
-            ("Signal Strength", "dumpsys telephony.registry | grep mSignalStrength"),
-            ("Data Connection", "getprop gsm.data.state"),
-            ("Radio Power", "getprop gsm.radio.power")
+            ("operator", "Network Operator", "getprop gsm.operator.alpha"),
+            ("network_type", "Network Type", "getprop gsm.network.type"),
+            ("data_state", "Data Connection", "getprop gsm.data.state"),
+            ("radio_power", "Radio Power", "getprop gsm.radio.power")
         ]
         
-        for name, cmd in diagnostics:
+        for key, name, cmd in diagnostics:
             try:
-                result = subprocess.run(["adb", "shell"] + cmd.split(), capture_output=True, text=True)
+                result = run_command(["adb", "shell"] + cmd.split())
                 value = result.stdout.strip()
+                results[key] = value
                 self.log(f"{name}: {value}")
             except:
                 self.log(f"{name}: Unable to retrieve")
+        
+        # Full dumps are large: parse them as they stream instead of grepping on the device
+        for service in ("telephony.registry", "connectivity"):
+            try:
+                facts = dumpsys(service).facts()
+            except OSError:
+                self.log(f"dumpsys {service}: Unable to retrieve")
+                continue
+            for key, value in facts.items():
+                self.log(f"{key}: {value}")
+            results.update(facts)
+        
+        return results
+    
+    def check_battery(self):
+        """Battery level, health and temperature from dumpsys battery"""
+        if not self.adb_available:
+            return {}
+        try:
+            facts = dumpsys("battery").facts()
+        except OSError:
+            return {}
+        if facts:
+            self.log(f"Battery: {facts.get('battery_level')}% {facts.get('battery_status')}, "
+                     f"health {facts.get('battery_health')}, {facts.get('battery_temp_c')} C")
+        return facts
+    
+    def collect_facts(self):
+        """Gather a fact snapshot for the rule engine"""
+        facts = {"adb_connected": False, "fastboot_connected": False}
+        
+        if self.check_adb_connection():
+            facts["adb_connected"] = True
+            info = self.get_device_info() or {}
+            facts.update(info)
+            facts.update(self.run_network_diagnostics())
+            facts.update(self.check_battery())
+        elif self.check_fastboot_connection():
+            facts["fastboot_connected"] = True
+        imei = facts.get("imei") if facts.get("imei") != "Unknown" else None
+        facts.update(self.check_modem_at(imei))
+        
+        return facts
     
     def create_g50_recovery_script(self):
         """Create Nokia G50 specific recovery script"""
-        script_content = """@echo off
-echo ========================================
-echo Nokia G50 SIM/Network Recovery
-echo ========================================
-echo.
-echo This script attempts to fix SIM connectivity issues
-echo.
-echo Prerequisites:
-echo 1. Enable USB Debugging (Developer Options)
-echo 2. Install ADB drivers
-echo 3. Device connected and recognized
-echo.
-echo Recovery Methods:
-echo 1. Reset Network Settings
-echo 2. Flash Modem/Baseband
-echo 3. Factory Reset (last resort)
-echo.
-set /p choice=Select method (1-3): 
-
-if "%choice%"=="1" (
-    echo Resetting network settings...
-    adb shell settings put global airplane_mode_on 1
-    timeout /t 3 /nobreak >nul
-    adb shell settings put global airplane_mode_on 0
-    adb shell am broadcast -a android.intent.action.AIRPLANE_MODE --ez state false
-    echo Network reset complete
-)
-
-if "%choice%"=="2" (
-    echo WARNING: Flashing modem requires bootloader unlock
-    echo This will void warranty and may brick device
-    set /p confirm=Type YES to continue: 
-    if "%confirm%"=="YES" (
-        echo Rebooting to fastboot...
-        adb reboot bootloader
-        echo Flash modem.img from Nokia G50 firmware
-        echo fastboot flash modem modem.img
-    )
-)
-
-if "%choice%"=="3" (
-    echo WARNING: This will erase all data!
-    set /p confirm=Type FACTORY to continue: 
-    if "%confirm%"=="FACTORY" (
-        adb shell recovery --wipe_data
-    )
-)
-
-pause
-"""
+        if get_generator().write("g50_recovery.bat.tmpl", "nokia_g50_recovery.bat", **profile_context(self.profile)):
+            self.log("Nokia G50 recovery script created")
+        else:
+            self.log("Nokia G50 recovery script up to date")
+    
+    def report_verdicts(self, facts):
+        """Run the profile rule set over the facts and log ranked verdicts"""
+        engine = RuleEngine(self.profile["rules"])
+        engine.update(facts)
+        verdicts = engine.verdicts()
         
-        with open("nokia_g50_recovery.bat", "w") as f:
-            f.write(script_content)
+        self.log("=== Recommendations ===")
+        for rank, verdict in enumerate(verdicts, 1):
+            self.log(f"{rank}. {verdict['verdict']}")
+            for evidence in verdict["evidence"]:
+                self.log(f"   evidence: {evidence}")
+            for action in verdict["actions"]:
+                self.log(f"   - {action}")
         
-        self.log("Nokia G50 recovery script created")
+        return verdicts
+    
+    def get_serial(self):
+        try:
+            result = run_command(["adb", "get-serialno"])
+            serial = result.stdout.strip()
+            return serial if result.ok and serial and serial != "unknown" else None
+        except OSError:
+            return None
+    
+    def record_results(self, facts, verdicts):
+        """Store this run and report what changed since the device was last diagnosed"""
+        serial = self.get_serial() if facts.get("adb_connected") else None
+        store = get_store()
+        imei = facts.get("imei") if facts.get("imei") != "Unknown" else None
+        store.record_run("analyze_g50", facts, serial=serial, imei=imei,
+                         model=facts.get("model") or self.profile["model"],
+                         verdict=verdicts[0]["id"] if verdicts else None)
+        if not serial:
+            return
+        
+        changes = store.changes_since_last(serial=serial)
+        if changes is None:
+            self.log("First recorded diagnosis of this device")
+        elif not changes:
+            self.log("Nothing changed since the last diagnosis")
+        else:
+            self.log("=== Changes since last diagnosis ===")
+            for key, (before, after) in changes.items():
+                self.log(f"{key}: {before} -> {after}")
     
     def analyze_g50(self):
         """Main analysis function for Nokia G50"""
@@ -209,45 +291,21 @@ pause
         
         # Check connections
         self.log("Checking device connection...")
-        
-        if self.check_adb_connection():
+        facts = self.collect_facts()
+        if facts["adb_connected"]:
             self.log("Device connected via ADB")
             
-            # Get device info
-            info = self.get_device_info()
-            if info:
-                self.log("=== Device Information ===")
-                for key, value in info.items():
-                    self.log(f"{key.upper()}: {value}")
+            self.log("=== Device Information ===")
+            for key in self.profile["probes"]:
+                self.log(f"{key.upper()}: {facts.get(key)}")
             
             # Run diagnostics
-            sim_ok = self.check_sim_hardware()
-            baseband_ok = self.check_baseband_modem()
-            self.run_network_diagnostics()
-            
-            # Provide recommendations
-            self.log("=== Recommendations ===")
-            if not sim_ok:
-                self.log("1. Check SIM card physically - may be damaged")
-                self.log("2. Try SIM in another phone")
-                self.log("3. Clean SIM contacts")
-            
-            if not baseband_ok:
-                self.log("1. Modem/baseband corruption detected")
-                self.log("2. May need firmware reflash")
-                self.log("3. Consider professional repair")
-            
-            if sim_ok and baseband_ok:
-                self.log("1. Try network reset first")
-                self.log("2. Check with carrier")
-                self.log("3. Software issue likely")
-                
-        elif self.check_fastboot_connection():
-            self.log("Device in fastboot mode - ready for firmware flash")
-            
-        else:
-            self.log("Device not detected")
-            self.log("Enable USB debugging or enter fastboot mode")
+            self.check_sim_hardware()
+            self.check_baseband_modem()
+        
+        # Provide recommendations
+        verdicts = self.report_verdicts(facts)
+        self.record_results(facts, verdicts)
         
         # Create recovery script
         self.create_g50_recovery_script()
@@ -14,8 +14,9 @@ echo Recovery Methods:
 echo 1. Reset Network Settings
 echo 2. Flash Modem/Baseband
 echo 3. Factory Reset (last resort)
+echo 4. Sideload OTA package (recovery: Apply update from ADB)
 echo.
-set /p choice=Select method (1-3): 
+set /p choice=Select method (1-4): 
 
 if "%choice%"=="1" (
     echo Resetting network settings...
@@ -40,10 +41,20 @@ if "%choice%"=="2" (
 
 if "%choice%"=="3" (
     echo WARNING: This will erase all data!
+    echo Back up nvram and userdata first: python android_doctor.py backup
     set /p confirm=Type FACTORY to continue: 
     if "%confirm%"=="FACTORY" (
         adb shell recovery --wipe_data
     )
 )
 
+if "%choice%"=="4" set /p ota=Path to Nokia G50 OTA zip: 
+if "%choice%"=="4" (
+    echo Rebooting to recovery - select "Apply update from ADB" when it appears
+    adb reboot recovery
+    echo Waiting for recovery's sideload mode...
+    adb wait-for-sideload
+    python android_doctor.py sideload "%ota%"
+)
+
 pause
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Partition Backup - Streams partitions off a device into a content-addressed archive
+Chunks are hashed and compressed on a thread pool while the next chunk is read;
+zero chunks are recorded without being stored and known chunks are never stored twice
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from command_runner import run_command, open_stream
+
+CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_ARCHIVE = Path(__file__).parent / "backups"
+
+# Partitions worth saving before a wipe/format; the rest are in the firmware package
+DEFAULT_PARTITIONS = ("nvram", "nvdata", "nvcfg", "protect1", "protect2", "persist",
+                      "proinfo", "seccfg", "frp", "metadata", "userdata")
+
+
+def _codecs():
+    """Available chunk codecs, best first; gzip is always there"""
+    codecs = {}
+    try:
+        import zstandard
+
+        local = threading.local()
+
+        def zstd_compress(data):
+            # Compressor objects are not thread safe: one per worker thread
+            if not hasattr(local, "compressor"):
+                local.compressor = zstandard.ZstdCompressor(level=3)
+            return local.compressor.compress(data)
+
+        def zstd_decompress(data):
+            return zstandard.ZstdDecompressor().decompress(data)
+
+        codecs["zstd"] = ("zst", zstd_compress, zstd_decompress)
+    except ImportError:
+        pass
+    try:
+        import lz4.frame
+
+        codecs["lz4"] = ("lz4", lz4.frame.compress, lz4.frame.decompress)
+    except ImportError:
+        pass
+    codecs["gzip"] = ("gz", lambda data: gzip.compress(data, compresslevel=1, mtime=0), gzip.decompress)
+    codecs["raw"] = ("bin", bytes, bytes)
+    return codecs
+
+
+CODECS = _codecs()
+EXTENSIONS = {ext: name for name, (ext, _, _) in CODECS.items()}
+
+
+def best_codec():
+    return next(iter(CODECS))
+
+
+def read_full(stream, size):
+    """Read exactly size bytes unless the stream ends (pipes return short reads)"""
+    data = stream.read(size)
+    if not data or len(data) == size:
+        return data
+    parts = [data]
+    remaining = size - len(data)
+    while remaining:
+        more = stream.read(remaining)
+        if not more:
+            break
+        parts.append(more)
+        remaining -= len(more)
+    return b"".join(parts)
+
+
+class FileDevice:
+    """Fake device backed by a directory of <partition>.img files"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.serial = f"file:{self.directory.name}"
+
+    def partitions(self):
+        return {path.stem: path.stat().st_size for path in sorted(self.directory.glob("*.img"))}
+
+    def open(self, name):
+        return open(self.directory / f"{name}.img", "rb")
+
+
+class AdbDevice:
+    """Reads /dev/block/by-name partitions over adb (needs a root shell)"""
+
+    def __init__(self, serial=None, timeout=60):
+        self.serial = serial
+        self.timeout = timeout
+
+    def _adb(self):
+        return ["adb", "-s", self.serial] if self.serial else ["adb"]
+
+    def partitions(self):
+        script = "for p in /dev/block/by-name/*; do echo ${p##*/} $(blockdev --getsize64 $(readlink -f $p)); done"
+        result = run_command(self._adb() + ["shell", "su", "-c", script], timeout=self.timeout)
+        sizes = {}
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1].isdigit():
+                sizes[parts[0]] = int(parts[1])
+        return sizes
+
+    def open(self, name):
+        return open_stream(self._adb() + ["exec-out", "su", "-c",
+                                          f"dd if=/dev/block/by-name/{name} bs=1048576 2>/dev/null"])
+
+
+class ChunkStore:
+    """chunks/<aa>/<sha256>.<ext>: one compressed file per distinct chunk"""
+
+    def __init__(self, root):
+        self.root = Path(root) / "chunks"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.known = {}  # sha256 -> extension, scanned once
+        for path in self.root.glob("*/*.*"):
+            self.known[path.stem] = path.suffix[1:]
+
+    def path(self, digest, ext):
+        return self.root / digest[:2] / f"{digest}.{ext}"
+
+    def claim(self, digest):
+        """True if the caller should store this chunk (first time it is seen)"""
+        with self.lock:
+            if digest in self.known:
+                return False
+            self.known[digest] = None
+            return True
+
+    def put(self, digest, ext, payload):
+        path = self.path(digest, ext)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".chunk.", dir=path.parent)
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.known[digest] = ext
+
+    def get(self, digest):
+        with self.lock:
+            ext = self.known.get(digest)
+        if ext is None:
+            raise KeyError(f"Chunk {digest} missing from archive")
+        data = CODECS[EXTENSIONS[ext]][2](self.path(digest, ext).read_bytes())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Chunk {digest} is corrupt")
+        return data
+
+
+class BackupStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.read = 0
+        self.zero = 0
+        self.duplicate = 0
+        self.stored_raw = 0
+        self.stored = 0
+        self.started = time.perf_counter()
+
+    def add(self, **counts):
+        with self.lock:
+            for key, value in counts.items():
+                setattr(self, key, getattr(self, key) + value)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "read": self.read,
+            "zero": self.zero,
+            "duplicate": self.duplicate,
+            "stored_raw": self.stored_raw,
+            "stored": self.stored,
+            "seconds": round(elapsed, 3),
+            "mb_per_s": round(self.read / elapsed / 1e6, 1) if elapsed else 0.0,
+        }
+
+
+class BackupEngine:
+    """Streams partitions into a ChunkStore and writes one JSON manifest per backup"""
+
+    def __init__(self, archive_dir=DEFAULT_ARCHIVE, workers=None, chunk_size=CHUNK_SIZE, codec=None):
+        self.archive_dir = Path(archive_dir)
+        self.store = ChunkStore(self.archive_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.codec = codec or best_codec()
+        self.zero_chunk = bytes(chunk_size)
+
+    def log(self, message):
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        print(f"[{timestamp}] [BACKUP] {message}")
+
+    def _pack(self, data, stats):
+        """Worker: hash, dedup and compress one chunk; returns its digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        if not self.store.claim(digest):
+            stats.add(duplicate=len(data))
+            return digest
+        ext, compress, _ = CODECS[self.codec]
+        payload = compress(data)
+        if len(payload) >= len(data):
+            ext, payload = CODECS["raw"][0], data
+        self.store.put(digest, ext, payload)
+        stats.add(stored_raw=len(data), stored=len(payload))
+        return digest
+
+    def is_zero(self, data):
+        if len(data) == self.chunk_size:
+            return data == self.zero_chunk
+        return data.count(0) == len(data)
+
+    def backup_partition(self, device, name, size, pool, stats):
+        """Read one partition sequentially while the pool packs earlier chunks"""
+        chunks = []
+        read = 0
+        inflight = threading.BoundedSemaphore(self.workers * 2)  # caps buffered chunks
+
+        def release(_):
+            inflight.release()
+
+        stream = device.open(name)
+        try:
+            while True:
+                data = read_full(stream, self.chunk_size)
+                if not data:
+                    break
+                read += len(data)
+                stats.add(read=len(data))
+                if self.is_zero(data):
+                    stats.add(zero=len(data))
+                    chunks.append(len(data))  # zero run: length only
+                    continue
+                inflight.acquire()
+                future = pool.submit(self._pack, data, stats)
+                future.add_done_callback(release)
+                chunks.append(future)
+        finally:
+            stream.close()
+
+        entries = [chunk if isinstance(chunk, int) else chunk.result() for chunk in chunks]
+        if size and read < size:
+            self.log(f"WARNING: {name} short read ({read} of {size} bytes)")
+        zero_bytes = sum(entry for entry in entries if isinstance(entry, int))
+        return {"size": read, "zero_bytes": zero_bytes, "chunks": entries}
+
+    def backup(self, device, partitions=None, label=None):
+        """Back up partitions (default: all the device reports); returns the manifest path"""
+        available = device.partitions()
+        if not available:
+            raise RuntimeError("Device reported no partitions (is adb root available?)")
+        names = [p for p in (partitions or available) if p in available]
+        missing = set(partitions or ()) - set(available)
+        if missing:
+            self.log(f"Skipping unknown partitions: {', '.join(sorted(missing))}")
+
+        stats = BackupStats()
+        manifest = {
+            "device": device.serial,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "chunk_size": self.chunk_size,
+            "codec": self.codec,
+            "partitions": {},
+        }
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for name in names:
+                self.log(f"{name}: {available[name] / 1e6:.1f} MB")
+                manifest["partitions"][name] = self.backup_partition(device, name, available[name], pool, stats)
+
+        manifest["stats"] = stats.summary()
+        label = label or f"{device.serial.replace(':', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        path = self.archive_dir / f"{label}.json"
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=1)
+        summary = manifest["stats"]
+        self.log(f"Backup complete: {summary['read'] / 1e6:.1f} MB read at {summary['mb_per_s']} MB/s, "
+                 f"{summary['zero'] / 1e6:.1f} MB zero, {summary['duplicate'] / 1e6:.1f} MB duplicate, "
+                 f"{summary['stored'] / 1e6:.1f} MB stored ({self.codec})")
+        return path
+
+    def restore(self, manifest_path, name, out_path):
+        """Rebuild one partition image from the archive; zero runs become sparse holes"""
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        entry = manifest["partitions"][name]
+        with open(out_path, "wb") as out:
+            for chunk in entry["chunks"]:
+                if isinstance(chunk, int):
+                    out.seek(chunk, os.SEEK_CUR)
+                else:
+                    out.write(self.store.get(chunk))
+            out.truncate()
+        return out_path
+
+
+def make_fake_device(directory, size_mb=64, seed=1):
+    """Synthetic device: a mostly-empty userdata, a duplicated nvram pair and random boot"""
+    import random
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    mb = 1024 * 1024
+    pattern = bytes(rng.getrandbits(8) for _ in range(mb))
+
+    with open(directory / "userdata.img", "wb") as f:
+        for i in range(size_mb):
+            f.write(pattern if i % 8 == 0 else bytes(mb))
+    with open(directory / "boot.img", "wb") as f:
+        f.write(os.urandom(16 * mb))
+    text = b"NVRAM calibration " * (mb // 18)
+    for name in ("nvram", "protect1", "protect2"):
+        (directory / f"{name}.img").write_bytes(text)
+    return FileDevice(directory)
+
+
+def main_backup(args):
+    """backup [serial|fake device dir] [partition ...]"""
+    target = args[0] if args else None
+    device = FileDevice(target) if target and Path(target).is_dir() else AdbDevice(target)
+    partitions = args[1:] or (None if isinstance(device, FileDevice) else list(DEFAULT_PARTITIONS))
+    return BackupEngine().backup(device, partitions)
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "fake":
+        directory = sys.argv[2] if len(sys.argv) > 2 else "fake_device"
+        make_fake_device(directory, int(sys.argv[3]) if len(sys.argv) > 3 else 64)
+        print(f"Fake device written to {directory}")
+        return
+    if len(sys.argv) >= 5 and sys.argv[1] == "restore":
+        engine = BackupEngine(Path(sys.argv[2]).parent)
+        engine.restore(sys.argv[2], sys.argv[3], sys.argv[4])
+        print(f"Restored {sys.argv[3]} to {sys.argv[4]}")
+        return
+    if len(sys.argv) < 2 or sys.argv[1] != "backup":
+        print("Usage: python partition_backup.py backup [serial|dir] [partition ...]")
+        print("       python partition_backup.py restore <manifest.json> <partition> <out.img>")
+        print("       python partition_backup.py fake [dir] [userdata_mb]")
+        print(f"Codecs available: {', '.join(CODECS)}")
+        return
+
+    main_backup(sys.argv[2:])
+
+
+if __name__ == "__main__":
+    main()
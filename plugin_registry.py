@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Plugin Registry - Discovers per-model tools without importing them
+Each model module declares a PLUGIN_MANIFEST literal; manifests are read with ast,
+cached per file, and a module is only imported when a matching device needs it
+"""
+
+import os
+import ast
+import sys
+import time
+import marshal
+import importlib
+from pathlib import Path
+
+WORKING_DIR = Path(__file__).parent
+CACHE_PATH = WORKING_DIR / "tools" / "plugin_manifest.cache"
+CACHE_VERSION = 1
+MANIFEST_NAME = "PLUGIN_MANIFEST"
+
+
+def read_manifest(path):
+    """The module's PLUGIN_MANIFEST literal, or None; the module is never executed"""
+    with open(path, "rb") as f:
+        source = f.read()
+    if MANIFEST_NAME.encode() not in source:
+        return None  # Most files: skip the parse entirely
+    try:
+        tree = ast.parse(source, filename=str(path))
+    except SyntaxError:
+        return None
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == MANIFEST_NAME
+                                                for t in node.targets):
+            try:
+                manifest = ast.literal_eval(node.value)
+            except ValueError:
+                return None
+            return manifest if isinstance(manifest, dict) else None
+    return None
+
+
+class Plugin:
+    """A plugin module known from its manifest; imported on first call"""
+
+    def __init__(self, module, manifest, plugin_dir=WORKING_DIR):
+        self.module = module
+        self.plugin_dir = str(plugin_dir)
+        self.description = manifest.get("description", "")
+        self.models = manifest.get("models", [])
+        self.modes = manifest.get("modes", [])
+        self.capabilities = manifest.get("capabilities", {})
+        self._loaded = None
+
+    def serves(self, model, mode=None):
+        if "*" not in self.models and model.strip().lower() not in {m.lower() for m in self.models}:
+            return False
+        return mode is None or not self.modes or mode in self.modes
+
+    def load(self):
+        if self._loaded is None:
+            if self.plugin_dir not in sys.path:
+                sys.path.append(self.plugin_dir)
+            self._loaded = importlib.import_module(self.module)
+        return self._loaded
+
+    def call(self, capability, argv=()):
+        """Run a capability as if its script were started with argv"""
+        entry = getattr(self.load(), self.capabilities[capability])
+        saved = sys.argv
+        sys.argv = [f"{self.module}.py"] + list(argv)
+        try:
+            return entry()
+        finally:
+            sys.argv = saved
+
+
+class PluginRegistry:
+    """Manifest index over the plugin directory"""
+
+    def __init__(self, manifests, plugin_dir=WORKING_DIR):
+        self.plugins = [Plugin(module, manifest, plugin_dir) for module, manifest in sorted(manifests.items())]
+
+    @classmethod
+    def load(cls, plugin_dir=WORKING_DIR, cache_path=CACHE_PATH):
+        """Scan for manifests, re-reading only files whose size or mtime changed"""
+        plugin_dir = Path(plugin_dir)
+        cached = {}
+        try:
+            with open(cache_path, "rb") as f:
+                version, entries = marshal.load(f)
+            if version == CACHE_VERSION:
+                cached = entries
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+        entries = {}
+        changed = False
+        with os.scandir(plugin_dir) as scan:
+            for entry in scan:
+                if not entry.name.endswith(".py") or entry.name == "plugin_registry.py":
+                    continue
+                stat = entry.stat()
+                key = (stat.st_mtime_ns, stat.st_size)
+                previous = cached.get(entry.name)
+                if previous is not None and previous[0] == key:
+                    entries[entry.name] = previous
+                    continue
+                entries[entry.name] = (key, read_manifest(entry.path))
+                changed = True
+
+        if changed or entries.keys() != cached.keys():
+            try:
+                Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+                with open(cache_path, "wb") as f:
+                    marshal.dump((CACHE_VERSION, entries), f)
+            except OSError:
+                pass  # Read-only install, rescan next time
+
+        return cls({name[:-3]: manifest for name, (_, manifest) in entries.items() if manifest}, plugin_dir)
+
+    def for_model(self, model, mode=None):
+        from device_profiles import get_database
+
+        profile = get_database().by_model(model)
+        name = profile["model"] if profile else model
+        return [plugin for plugin in self.plugins if plugin.serves(name, mode)]
+
+    def find(self, model, capability, mode=None):
+        """First plugin serving the model that offers the capability"""
+        for plugin in self.for_model(model, mode):
+            if capability in plugin.capabilities:
+                return plugin
+        return None
+
+    def capabilities(self, model, mode=None):
+        return sorted({capability for plugin in self.for_model(model, mode) for capability in plugin.capabilities})
+
+
+_registry = None
+
+
+def get_registry():
+    """Shared registry, scanned on first use"""
+    global _registry
+    if _registry is None:
+        _registry = PluginRegistry.load()
+    return _registry
+
+
+def benchmark(models=50):
+    """Registry startup with many model plugins: cold scan, cached scan, and importing everything"""
+    import shutil
+    import tempfile
+
+    workdir = Path(tempfile.mkdtemp(prefix="plugin_bench_"))
+    try:
+        body = "import json, zipfile, sqlite3, asyncio\n\n" + "\n".join(
+            f"def step_{i}(facts):\n    return facts.get('k{i}')\n" for i in range(200)) + "\ndef main():\n    pass\n"
+        for i in range(models):
+            manifest = {"models": [f"Model {i}"], "capabilities": {"analyze": "main"}}
+            (workdir / f"model_{i:03d}.py").write_text(f'"""Model {i}"""\n\nPLUGIN_MANIFEST = {manifest!r}\n\n{body}')
+        cache = workdir / "plugins.cache"
+
+        def timed(label, func):
+            started = time.perf_counter()
+            result = func()
+            print(f"{label:<28} {(time.perf_counter() - started) * 1000:8.2f} ms")
+            return result
+
+        print(f"{models} model plugins")
+        timed("cold scan (ast)", lambda: PluginRegistry.load(workdir, cache))
+        registry = timed("cached scan", lambda: PluginRegistry.load(workdir, cache))
+        timed("resolve + import one", lambda: registry.find("Model 7", "analyze").load())
+        timed("import every module", lambda: [plugin.load() for plugin in registry.plugins])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 50)
+        return
+    registry = get_registry()
+    for plugin in registry.plugins:
+        models = ", ".join(plugin.models)
+        print(f"{plugin.module:<22} {models:<20} {', '.join(sorted(plugin.capabilities))}")
+        if plugin.description:
+            print(f"{'':<22} {plugin.description}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Poll Scheduler - Adaptive polling for the device monitors
+Polls fast while a device is expected, backs off while idle and fires
+status ticks from a monotonic deadline instead of wall-clock seconds
+"""
+
+import time
+import threading
+
+FAST_INTERVAL = 0.1      # Burst rate while the user is doing a key combo
+NORMAL_INTERVAL = 1.0    # Rate right after any device activity
+IDLE_INTERVAL = 5.0      # Ceiling for the back-off while nothing happens
+BACKOFF = 1.5
+STATUS_INTERVAL = 30
+
+
+class FastForward:
+    """Poll clock for replay benchmarks: waits return at once and move the clock on instead
+
+    Real time still passes (command time counts), so deadlines measured on this
+    clock expire as if every skipped wait had been slept through.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.skipped = 0.0
+
+    def monotonic(self):
+        return time.monotonic() + self.skipped
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.skipped += max(0.0, seconds)
+
+
+_fast_forward = None
+
+
+def fast_forward():
+    """Make every poller skip its waits from now on (command_trace bench); returns the clock"""
+    global _fast_forward
+    if _fast_forward is None:
+        _fast_forward = FastForward()
+    return _fast_forward
+
+
+def monotonic():
+    """Default poller clock: time.monotonic, or the fast-forward clock once installed"""
+    return _fast_forward.monotonic() if _fast_forward is not None else time.monotonic()
+
+
+class AdaptivePoller:
+    """Decides when the next poll and the next status line are due
+
+    Deadlines are measured from the start of each poll, so a slow poll
+    (PowerShell WMI queries take ~1s) eats into the wait instead of adding to it.
+    """
+
+    def __init__(self, fast=FAST_INTERVAL, normal=NORMAL_INTERVAL, idle_max=IDLE_INTERVAL,
+                 backoff=BACKOFF, status_every=STATUS_INTERVAL, clock=monotonic, sleep=None):
+        self.fast = fast
+        self.normal = normal
+        self.idle_max = idle_max
+        self.backoff = backoff
+        self.status_every = status_every
+        self.clock = clock
+        self.wakeup = threading.Event()
+        self.sleep = sleep or self._sleep
+
+        now = self.clock()
+        self.interval = normal
+        self.burst_until = 0.0
+        self.poll_started = now
+        self.next_status = now + status_every
+        self.polls = 0
+
+    def _sleep(self, seconds):
+        if _fast_forward is not None and self.clock is monotonic:
+            _fast_forward.sleep(seconds)
+            return
+        # Event wait so expect() from another thread can cut a long idle sleep short
+        self.wakeup.wait(seconds)
+        self.wakeup.clear()
+
+    def expect(self, seconds):
+        """A device should appear soon (key combo in progress): poll at burst rate"""
+        self.burst_until = max(self.burst_until, self.clock() + seconds)
+        self.wakeup.set()
+
+    def in_burst(self):
+        return self.clock() < self.burst_until
+
+    def begin_poll(self):
+        """Mark the start of a poll; call right before querying devices"""
+        self.poll_started = self.clock()
+        self.polls += 1
+
+    def record(self, activity):
+        """Feed back whether the last poll saw any change"""
+        if activity:
+            self.interval = self.normal
+        else:
+            self.interval = min(self.interval * self.backoff, self.idle_max)
+
+    def current_interval(self):
+        return self.fast if self.in_burst() else self.interval
+
+    def wait(self):
+        """Sleep until the next poll is due"""
+        delay = self.poll_started + self.current_interval() - self.clock()
+        if delay > 0:
+            self.sleep(delay)
+
+    def status_due(self):
+        """True once per status interval, regardless of how long polls take"""
+        now = self.clock()
+        if now < self.next_status:
+            return False
+        while self.next_status <= now:
+            self.next_status += self.status_every
+        return True
+
+
+def poll_until(check, window, poller=None, clock=monotonic, sleep=None):
+    """Call check() at burst rate until it returns something truthy or window expires"""
+    poller = poller or AdaptivePoller(clock=clock, sleep=sleep)
+    poller.expect(window)
+    while True:
+        poller.begin_poll()
+        result = check()
+        if result:
+            return result
+        if not poller.in_burst():
+            return result
+        poller.record(False)
+        poller.wait()
@@ -3,17 +3,14 @@
 Quick Device Monitor for Nokia G11 - Windows Compatible
 """
 
-import time
-import subprocess
 from datetime import datetime
+from command_runner import powershell
+from poll_scheduler import AdaptivePoller
 
 def get_devices():
     """Get MediaTek/Android devices"""
     try:
-        result = subprocess.run([
-            "powershell", "-Command",
-            "Get-WmiObject -Class Win32_PnPEntity | Where-Object {$_.Name -like '*MediaTek*' -or $_.Name -like '*Android*' -or $_.Name -like '*Nokia*' -or $_.Name -like '*MTK*' -or $_.Name -like '*PreLoader*'} | Select-Object Name"
-        ], capture_output=True, text=True, shell=True)
+        result = powershell("Get-WmiObject -Class Win32_PnPEntity | Where-Object {$_.Name -like '*MediaTek*' -or $_.Name -like '*Android*' -or $_.Name -like '*Nokia*' -or $_.Name -like '*MTK*' -or $_.Name -like '*PreLoader*'} | Select-Object Name")
         
         if result.stdout and "MediaTek" in result.stdout:
             return result.stdout.strip()
@@ -32,10 +29,13 @@ def monitor_device():
     print("\nPress Ctrl+C to stop\n")
     
     detection_count = 0
+    poller = AdaptivePoller()
     
     try:
         while True:
+            poller.begin_poll()
             devices = get_devices()
+            poller.record(bool(devices))
             if devices:
                 detection_count += 1
                 timestamp = datetime.now().strftime("%H:%M:%S")
@@ -59,11 +59,11 @@ def monitor_device():
                 print("\a")  # System beep
             
             # Status update every 30 seconds
-            if int(time.time()) % 30 == 0:
+            if poller.status_due():
                 timestamp = datetime.now().strftime("%H:%M:%S")
                 print(f"[{timestamp}] Monitoring... (Detections: {detection_count})")
             
-            time.sleep(1)
+            poller.wait()
             
     except KeyboardInterrupt:
         print(f"\nMonitoring stopped. Total detections: {detection_count}")
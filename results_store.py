@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Results Store - Persistent diagnosis history in SQLite
+Every probe result is kept per device and run; inserts are buffered and written
+in batches so long diagnosis sessions never wait on the disk
+"""
+
+import sys
+import time
+import atexit
+import sqlite3
+import threading
+from pathlib import Path
+from datetime import datetime
+
+DEFAULT_DB = Path(__file__).parent / "logs" / "diagnosis.db"
+BATCH_SIZE = 200  # Runs buffered before a write transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    serial TEXT,
+    imei TEXT,
+    model TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    latest_run INTEGER
+);
+CREATE INDEX IF NOT EXISTS devices_imei ON devices(imei);
+CREATE INDEX IF NOT EXISTS devices_model ON devices(model, latest_run);
+
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    device_id INTEGER REFERENCES devices(id),
+    started REAL NOT NULL,
+    source TEXT NOT NULL,
+    verdict TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_device_started ON runs(device_id, started);
+
+CREATE TABLE IF NOT EXISTS probes (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (run_id, key)
+) WITHOUT ROWID;
+"""
+
+
+def device_key(serial=None, imei=None):
+    """Devices are identified by adb/fastboot serial, else IMEI; None when neither is known"""
+    if serial:
+        return f"serial:{serial}"
+    if imei:
+        return f"imei:{imei}"
+    return None
+
+
+class ResultsStore:
+    """SQLite-backed run history; record_run() only appends to an in-memory batch"""
+
+    def __init__(self, path=DEFAULT_DB, batch_size=BATCH_SIZE):
+        self.path = Path(path)
+        if str(path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = []
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def record_run(self, source, probes, serial=None, imei=None, model=None, verdict=None, started=None):
+        """Queue one diagnosis run (probes: {key: value}); flushed in batches"""
+        run = (source, {key: None if value is None else str(value) for key, value in probes.items()},
+               serial, imei, model, verdict, started or time.time())
+        with self.lock:
+            self.pending.append(run)
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write every queued run in a single transaction"""
+        with self.lock:
+            pending, self.pending = self.pending, []
+            if not pending:
+                return 0
+            with self.db:
+                cursor = self.db.cursor()
+                probe_rows = []
+                for source, probes, serial, imei, model, verdict, started in pending:
+                    key = device_key(serial, imei)
+                    if key is None:  # Nothing to tell this device from the next: keep the run only
+                        cursor.execute("INSERT INTO runs (device_id, started, source, verdict) VALUES (NULL, ?, ?, ?)",
+                                       (started, source, verdict))
+                        probe_rows.extend((cursor.lastrowid, name, value) for name, value in probes.items())
+                        continue
+                    cursor.execute(
+                        "INSERT INTO devices (key, serial, imei, model, first_seen, last_seen) "
+                        "VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET last_seen = excluded.last_seen, "
+                        "serial = COALESCE(excluded.serial, serial), imei = COALESCE(excluded.imei, imei), "
+                        "model = COALESCE(excluded.model, model)",
+                        (key, serial, imei, model, started, started))
+                    device_id = cursor.execute("SELECT id FROM devices WHERE key = ?", (key,)).fetchone()[0]
+                    cursor.execute("INSERT INTO runs (device_id, started, source, verdict) VALUES (?, ?, ?, ?)",
+                                   (device_id, started, source, verdict))
+                    run_id = cursor.lastrowid
+                    cursor.execute("UPDATE devices SET latest_run = ? WHERE id = ?", (run_id, device_id))
+                    probe_rows.extend((run_id, name, value) for name, value in probes.items())
+                cursor.executemany("INSERT OR REPLACE INTO probes (run_id, key, value) VALUES (?, ?, ?)", probe_rows)
+            return len(pending)
+
+    def _device_id(self, serial=None, imei=None):
+        if serial:
+            row = self.db.execute("SELECT id FROM devices WHERE key = ?", (device_key(serial),)).fetchone()
+        else:
+            row = self.db.execute("SELECT id FROM devices WHERE imei = ? ORDER BY last_seen DESC LIMIT 1",
+                                  (imei,)).fetchone()
+        return row[0] if row else None
+
+    def _probes(self, run_id):
+        return dict(self.db.execute("SELECT key, value FROM probes WHERE run_id = ?", (run_id,)))
+
+    def history(self, serial=None, imei=None, limit=20):
+        """Most recent runs of one device: [(run_id, started, source, verdict)]"""
+        self.flush()
+        device_id = self._device_id(serial, imei)
+        if device_id is None:
+            return []
+        return self.db.execute("SELECT id, started, source, verdict FROM runs WHERE device_id = ? "
+                               "ORDER BY started DESC LIMIT ?", (device_id, limit)).fetchall()
+
+    def changes_since_last(self, serial=None, imei=None):
+        """Probe differences between a device's two latest runs: {key: (before, after)}
+
+        Only keys both runs probed are compared; different tools record different probes.
+        """
+        runs = self.history(serial, imei, limit=2)
+        if len(runs) < 2:
+            return None
+        after, before = self._probes(runs[0][0]), self._probes(runs[1][0])
+        return {key: (before[key], after[key])
+                for key in sorted(before.keys() & after.keys())
+                if before[key] != after[key]}
+
+    def sim_absent_rate(self):
+        """Per model: (devices, devices whose latest run with a SIM state saw no SIM, rate)"""
+        self.flush()
+        rows = self.db.execute(
+            "SELECT d.model, COUNT(*), SUM(p.value LIKE '%ABSENT%') FROM devices d "
+            "JOIN probes p ON p.key = 'sim_state' AND p.run_id = ("
+            "  SELECT r.id FROM runs r JOIN probes q ON q.run_id = r.id AND q.key = 'sim_state' "
+            "  WHERE r.device_id = d.id ORDER BY r.started DESC, r.id DESC LIMIT 1) "
+            "GROUP BY d.model ORDER BY d.model").fetchall()
+        return [(model, total, absent or 0, (absent or 0) / total) for model, total, absent in rows]
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Shared store; pending runs are flushed at exit"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultsStore()
+            atexit.register(_store.flush)
+        return _store
+
+
+def benchmark(runs=20000, devices=2000):
+    """Insert throughput (batched vs one commit per run) and query latency"""
+    import random
+    import tempfile
+
+    rng = random.Random(3)
+    models = ["Nokia G50", "Nokia G11", "Nokia G21", "Nokia X20"]
+    with tempfile.TemporaryDirectory() as tmp:
+        def fill(store, count, flush_each):
+            started = time.perf_counter()
+            for i in range(count):
+                serial = f"SN{i % devices:05d}"
+                store.record_run("bench", {
+                    "sim_state": rng.choice(["READY", "ABSENT", "READY", "NOT_READY"]),
+                    "baseband": rng.choice(["MOLY.LR12A.R3", ""]),
+                    "operator": rng.choice(["Vodafone", "EE", ""]),
+                    "network_type": rng.choice(["LTE", "Unknown"]),
+                }, serial=serial, model=models[i % devices % len(models)], started=1e9 + i)
+                if flush_each:
+                    store.flush()
+            store.flush()
+            return time.perf_counter() - started
+
+        unbatched = fill(ResultsStore(Path(tmp) / "single.db", batch_size=1), runs // 10, True)
+        store = ResultsStore(Path(tmp) / "batched.db")
+        batched = fill(store, runs, False)
+        print(f"One transaction per run: {runs // 10 / unbatched:10.0f} runs/s")
+        print(f"Batched ({BATCH_SIZE} per commit): {runs / batched:10.0f} runs/s")
+
+        for label, query in (("changes since last diagnosis", lambda: store.changes_since_last("SN00042")),
+                             ("SIM-ABSENT rate by model", store.sim_absent_rate)):
+            started = time.perf_counter()
+            for _ in range(100):
+                query()
+            print(f"{label:<30} {(time.perf_counter() - started) * 10:8.3f} ms")
+        store.close()
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark()
+        return
+
+    store = get_store()
+    if len(sys.argv) >= 3 and sys.argv[1] == "changes":
+        changes = store.changes_since_last(serial=sys.argv[2])
+        if changes is None:
+            print("Fewer than two diagnoses recorded for this device")
+        elif not changes:
+            print("Nothing changed since the last diagnosis")
+        for key, (before, after) in (changes or {}).items():
+            print(f"{key}: {before!r} -> {after!r}")
+    elif len(sys.argv) >= 3 and sys.argv[1] == "history":
+        for run_id, started, source, verdict in store.history(serial=sys.argv[2]):
+            print(f"#{run_id} {datetime.fromtimestamp(started):%Y-%m-%d %H:%M:%S} {source}: {verdict or '-'}")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "sim-absent":
+        for model, total, absent, rate in store.sim_absent_rate():
+            print(f"{model or 'unknown'}: {absent}/{total} devices without SIM ({rate:.0%})")
+    else:
+        print("Usage: python results_store.py changes <serial>")
+        print("       python results_store.py history <serial>")
+        print("       python results_store.py sim-absent")
+        print("       python results_store.py bench")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Script Templates - Generates the recovery batch scripts from templates/
+Templates are compiled once per process and unchanged scripts are never rewritten
+"""
+
+import os
+import re
+import sys
+import hashlib
+import threading
+from pathlib import Path
+
+TEMPLATES_DIR = Path(__file__).parent / "templates"
+
+# ${name} placeholders; $$ is a literal dollar sign
+PLACEHOLDER_PATTERN = re.compile(r"\$(?:\{([A-Za-z_][A-Za-z0-9_]*)\}|(\$))")
+
+
+class ScriptTemplate:
+    """A template split once into literal text and placeholder slots"""
+
+    def __init__(self, name, text):
+        self.name = name
+        self.parts = []
+        self.fields = set()
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            self.parts.append((False, text[position:match.start()]))
+            if match.group(2):
+                self.parts.append((False, "$"))
+            else:
+                self.parts.append((True, match.group(1)))
+                self.fields.add(match.group(1))
+            position = match.end()
+        self.parts.append((False, text[position:]))
+
+    def render(self, context):
+        missing = self.fields - context.keys()
+        if missing:
+            raise KeyError(f"Template {self.name} needs: {', '.join(sorted(missing))}")
+        return "".join(context[value] if is_field else value for is_field, value in self.parts)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ScriptGenerator:
+    """Renders templates and writes scripts only when their content changed"""
+
+    def __init__(self, templates_dir=TEMPLATES_DIR):
+        self.templates_dir = Path(templates_dir)
+        self.templates = {}
+        self.known = {}  # path -> (mtime_ns, size, sha256) of what is on disk
+        self.lock = threading.Lock()
+        self.written = 0
+        self.skipped = 0
+
+    def template(self, name):
+        """Compiled template, reloaded only if the template file changed"""
+        path = self.templates_dir / name
+        mtime = path.stat().st_mtime_ns
+        with self.lock:
+            cached = self.templates.get(name)
+            if cached and cached[0] == mtime:
+                return cached[1]
+        compiled = ScriptTemplate(name, path.read_text(encoding="utf-8"))
+        with self.lock:
+            self.templates[name] = (mtime, compiled)
+        return compiled
+
+    def render(self, name, **context):
+        return self.template(name).render(context)
+
+    def _disk_hash(self, path):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            known = self.known.get(path)
+        if known and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            return known[2]
+        digest = content_hash(path.read_bytes())
+        with self.lock:
+            self.known[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def _store(self, path, text):
+        path = Path(path)
+        data = text.replace("\n", os.linesep).encode("utf-8")
+        digest = content_hash(data)
+
+        if self._disk_hash(path) == digest:
+            with self.lock:
+                self.skipped += 1
+            return False
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        stat = path.stat()
+        with self.lock:
+            self.known[path] = (stat.st_mtime_ns, stat.st_size, digest)
+            self.written += 1
+        return True
+
+    def write(self, name, path, **context):
+        """Render a template to path; returns False when the file was already current"""
+        return self._store(path, self.render(name, **context))
+
+    def write_batch(self, name, jobs):
+        """Render one template for many (path, context) pairs with a single compile"""
+        template = self.template(name)
+        return sum(self._store(path, template.render(context)) for path, context in jobs)
+
+
+def profile_context(profile):
+    """Template variables for a device profile"""
+    return {
+        "model": profile["model"],
+        "firmware_dir": profile["firmware"]["dir"],
+        "flash_tool": profile["firmware"].get("flash_tool", ""),
+        "chipset": profile["chipset"],
+        # Images the fastboot script flashes; the doctor swaps in cached sparse copies
+        **{f"{name}_image": f"firmware\\{profile['firmware']['dir']}\\{name}.img"
+           for name in ("boot", "recovery", "system")},
+    }
+
+
+def script_slug(profile):
+    return profile["model"].lower().replace(" ", "_")
+
+
+_generator = None
+
+
+def get_generator():
+    """Shared generator so templates compile once per process"""
+    global _generator
+    if _generator is None:
+        _generator = ScriptGenerator()
+    return _generator
+
+
+def main():
+    from device_profiles import get_database
+
+    out_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "scripts"
+    generator = get_generator()
+    for profile in get_database().profiles:
+        context = profile_context(profile)
+        slug = script_slug(profile)
+        generator.write("flash.bat.tmpl", out_dir / f"flash_{slug}.bat", **context)
+        generator.write("fastboot_recovery.bat.tmpl", out_dir / f"fastboot_recovery_{slug}.bat", **context)
+        generator.write("emergency_flash.bat.tmpl", out_dir / f"emergency_flash_{slug}.bat", **context)
+    print(f"Scripts in {out_dir}: {generator.written} written, {generator.skipped} unchanged")
+
+
+if __name__ == "__main__":
+    main()
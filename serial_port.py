@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Serial Port - Byte transports for the download-mode protocol clients
+Real COM ports go through pyserial; pty pairs let simulated devices stand in on Linux
+"""
+
+import os
+import re
+import sys
+import time
+import select
+
+COM_PORT_PATTERN = re.compile(r"\((COM\d+)\)")
+
+
+class TransportTimeout(Exception):
+    pass
+
+
+class TransportClosed(Exception):
+    """The other end went away (EOF, or EIO on a pty): no more data will come"""
+
+
+class Transport:
+    """Minimal byte pipe: read() returns what is available, read_exact() waits for all of it
+
+    read() returns b"" only when the timeout passes and raises TransportClosed once
+    the other end is gone, so waiting without a timeout cannot spin forever.
+    """
+
+    def read(self, size, timeout=None):
+        raise NotImplementedError
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def read_exact(self, size, timeout=5.0):
+        end = time.monotonic() + timeout if timeout is not None else None
+        parts = []
+        remaining = size
+        while remaining:
+            left = None if end is None else end - time.monotonic()
+            if left is not None and left <= 0:
+                raise TransportTimeout(f"Timed out after {size - remaining} of {size} bytes")
+            data = self.read(remaining, left)
+            if data:
+                parts.append(data)
+                remaining -= len(data)
+        return b"".join(parts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FdTransport(Transport):
+    """Transport over a raw file descriptor (pty master/slave, pipe, socket)"""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def read(self, size, timeout=None):
+        if self.fd is None:
+            raise TransportClosed("Transport is closed")
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return b""
+        try:
+            data = os.read(self.fd, size)
+        except OSError as e:
+            raise TransportClosed(f"Peer closed: {e}")  # EIO on a pty
+        if not data:
+            raise TransportClosed("Peer closed")
+        return data
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            written = os.write(self.fd, view)
+            view = view[written:]
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SerialTransport(Transport):
+    """A COM port through pyserial (installed with requirements.txt)"""
+
+    def __init__(self, port, baudrate=115200):
+        try:
+            import serial
+        except ImportError:
+            raise RuntimeError("pyserial is required for COM port access: pip install pyserial")
+        self.port = serial.Serial(port, baudrate=baudrate, timeout=0)
+
+    def read(self, size, timeout=None):
+        self.port.timeout = timeout
+        try:
+            return self.port.read(size)
+        except OSError as e:  # serial.SerialException: the device left the bus
+            raise TransportClosed(str(e))
+
+    def write(self, data):
+        self.port.write(data)
+        self.port.flush()
+
+    def close(self):
+        self.port.close()
+
+
+def pty_pair():
+    """(host, device) transports joined by a raw pseudo-terminal, for simulated devices"""
+    import pty
+    import tty
+
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    return FdTransport(slave), FdTransport(master)
+
+
+def socket_pair():
+    """(host, device) transports over a socketpair; faster than a pty for benchmarks"""
+    import socket
+
+    host, device = socket.socketpair()
+    for sock in (host, device):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    return FdTransport(host.detach()), FdTransport(device.detach())
+
+
+def find_ports(patterns):
+    """COM ports whose device name matches any of patterns, e.g. ["QDLoader 9008"]"""
+    try:
+        from serial.tools import list_ports
+
+        return [port.device for port in list_ports.comports()
+                if any(p.lower() in f"{port.description} {port.hwid}".lower() for p in patterns)]
+    except ImportError:
+        pass
+
+    if sys.platform != "win32":
+        return []
+    from command_runner import powershell
+
+    filters = " -or ".join(f"$_.Name -like '*{p}*'" for p in patterns)
+    result = powershell(f"Get-WmiObject -Class Win32_PnPEntity | Where-Object {{{filters}}} | Select-Object -ExpandProperty Name")
+    return COM_PORT_PATTERN.findall(result.stdout)
+
+
+def open_port(port, baudrate=115200):
+    return SerialTransport(port, baudrate)
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Sparse Image - Converts raw partition images to Android sparse format in parallel
+Worker processes classify 4 KB blocks into raw, fill and zero runs; the result is
+cached next to the source under its content hash so fastboot sends only real data
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+SPARSE_MAGIC = 0xED26FF3A
+MAJOR_VERSION = 1
+MINOR_VERSION = 0
+FILE_HEADER = struct.Struct("<IHHHHIIII")   # magic, major, minor, file hdr, chunk hdr, block size, blocks, chunks, crc
+CHUNK_HEADER = struct.Struct("<HHII")       # type, reserved, blocks, total bytes
+BLOCK_SIZE = 4096
+
+CHUNK_RAW = 0xCAC1
+CHUNK_FILL = 0xCAC2
+CHUNK_DONT_CARE = 0xCAC3
+CHUNK_CRC32 = 0xCAC4
+
+SEGMENT_SIZE = 64 * 1024 * 1024   # Bytes per worker task; a multiple of BLOCK_SIZE
+MIN_IMAGE_SIZE = 32 * 1024 * 1024  # Smaller images are flashed raw
+INDEX_NAME = ".sparse_index.json"
+COPY_SIZE = 4 * 1024 * 1024
+MAX_CHUNK_BLOCKS = (0xFFFFFFFF - CHUNK_HEADER.size) // BLOCK_SIZE  # Raw chunk total_sz is a uint32
+
+ZERO_BLOCK = bytes(BLOCK_SIZE)
+ZERO_SPAN = bytes(BLOCK_SIZE * 64)   # Zero check 256 KB at a time before going block by block
+
+_locks = {}                 # Resolved image path -> lock, so parallel flash jobs convert once
+_locks_guard = threading.Lock()
+
+
+def is_sparse(path):
+    with open(path, "rb") as f:
+        head = f.read(4)
+    return len(head) == 4 and struct.unpack("<I", head)[0] == SPARSE_MAGIC
+
+
+def _image_lock(path):
+    with _locks_guard:
+        return _locks.setdefault(str(Path(path).resolve()), threading.Lock())
+
+
+def _atomic_write(target, write):
+    """Call write(file) on a unique temp file beside target, then move it into place"""
+    fd, partial = tempfile.mkstemp(dir=target.parent, prefix=target.name + ".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            write(out)
+        os.replace(partial, target)
+    except BaseException:
+        Path(partial).unlink(missing_ok=True)
+        raise
+
+
+def split_runs(runs, limit=MAX_CHUNK_BLOCKS):
+    """Runs as written: raw runs split so no chunk's total size overflows, as libsparse does"""
+    chunks = []
+    for kind, blocks, fill in runs:
+        while kind == CHUNK_RAW and blocks > limit:
+            chunks.append([kind, limit, fill])
+            blocks -= limit
+        chunks.append([kind, blocks, fill])
+    return chunks
+
+
+def scan_segment(path, offset, length, zero_as_dont_care=False):
+    """Classify one segment's blocks; returns (sha256 digest, runs)
+
+    A run is [type, blocks, fill value]; adjacent blocks of the same kind (and
+    fill value) merge. A short final block is padded with zeros, as fastboot does.
+    """
+    digest = hashlib.sha256()
+    runs = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    digest.update(data)
+    if len(data) % BLOCK_SIZE:
+        data += bytes(BLOCK_SIZE - len(data) % BLOCK_SIZE)
+
+    zero = (CHUNK_DONT_CARE, None) if zero_as_dont_care else (CHUNK_FILL, 0)
+    span_blocks = len(ZERO_SPAN) // BLOCK_SIZE
+    last_type = last_fill = None
+    start = 0
+    while start < len(data):
+        # startswith compares in place; slicing or memoryview equality is several times slower
+        if data.startswith(ZERO_SPAN, start):
+            kind, fill, blocks = zero[0], zero[1], span_blocks
+        elif data.startswith(ZERO_BLOCK, start):
+            kind, fill, blocks = zero[0], zero[1], 1
+        else:
+            head = data[start:start + 4]
+            blocks = 1
+            if data.startswith(head * (BLOCK_SIZE // 4), start):
+                kind, fill = CHUNK_FILL, struct.unpack("<I", head)[0]
+            else:
+                kind, fill = CHUNK_RAW, None
+        start += blocks * BLOCK_SIZE
+        if kind == last_type and fill == last_fill:
+            runs[-1][1] += blocks
+        else:
+            runs.append([kind, blocks, fill])
+            last_type, last_fill = kind, fill
+    return digest.digest(), runs
+
+
+class SparseConverter:
+    """Parallel raw -> sparse conversion with a content-addressed cache
+
+    zero_as_dont_care writes zero runs as DONT_CARE (smallest transfer, but the
+    device keeps whatever those blocks held); the default FILL 0 reproduces the
+    raw image exactly.
+    """
+
+    def __init__(self, workers=None, segment_size=SEGMENT_SIZE, zero_as_dont_care=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.segment_size = segment_size
+        self.zero_as_dont_care = zero_as_dont_care
+
+    def scan(self, path):
+        """(content hash, merged runs) for a raw image, segments scanned across the pool"""
+        size = Path(path).stat().st_size
+        segments = [(offset, min(self.segment_size, size - offset)) for offset in range(0, size, self.segment_size)]
+        tree = hashlib.sha256()
+        runs = []
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(segments)) or 1) as pool:
+            futures = [pool.submit(scan_segment, str(path), offset, length, self.zero_as_dont_care)
+                       for offset, length in segments]
+            for future in futures:
+                digest, segment_runs = future.result()
+                tree.update(digest)
+                for run in segment_runs:
+                    if runs and runs[-1][0] == run[0] and runs[-1][2] == run[2]:
+                        runs[-1][1] += run[1]
+                    else:
+                        runs.append(run)
+        mode = "dc" if self.zero_as_dont_care else "fill"
+        return f"{tree.hexdigest()[:16]}-{mode}", runs
+
+    def write(self, source, runs, target):
+        """Write the sparse image for already-classified runs"""
+        chunks = split_runs(runs)
+        total_blocks = sum(chunk[1] for chunk in chunks)
+        target = Path(target)
+        with open(source, "rb") as src:
+            _atomic_write(target, lambda out: self._write_chunks(src, out, chunks, total_blocks))
+        return target
+
+    def _write_chunks(self, src, out, chunks, total_blocks):
+        out.write(FILE_HEADER.pack(SPARSE_MAGIC, MAJOR_VERSION, MINOR_VERSION, FILE_HEADER.size,
+                                   CHUNK_HEADER.size, BLOCK_SIZE, total_blocks, len(chunks), 0))
+        block = 0
+        buffer = bytearray(COPY_SIZE)
+        for kind, blocks, fill in chunks:
+            if kind == CHUNK_RAW:
+                length = blocks * BLOCK_SIZE
+                out.write(CHUNK_HEADER.pack(kind, 0, blocks, CHUNK_HEADER.size + length))
+                src.seek(block * BLOCK_SIZE)
+                view = memoryview(buffer)
+                while length:
+                    read = src.readinto(view[:min(length, COPY_SIZE)])
+                    if not read:  # Short final block
+                        out.write(bytes(length))
+                        break
+                    out.write(view[:read])
+                    length -= read
+            elif kind == CHUNK_FILL:
+                out.write(CHUNK_HEADER.pack(kind, 0, blocks, CHUNK_HEADER.size + 4))
+                out.write(struct.pack("<I", fill))
+            else:
+                out.write(CHUNK_HEADER.pack(kind, 0, blocks, CHUNK_HEADER.size))
+            block += blocks
+
+    def convert(self, source, log=None):
+        """Sparse version of source, from the cache when its content was converted before
+
+        Returns (path, stats); stats["cached"] tells whether conversion was skipped.
+        """
+        source = Path(source)
+        with _image_lock(source):
+            return self._convert(source, log)
+
+    def _convert(self, source, log):
+        stat = source.stat()
+        index_path = source.parent / INDEX_NAME
+        try:
+            index = json.loads(index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            index = {}
+
+        mode = "dc" if self.zero_as_dont_care else "fill"
+        entry = index.get(source.name)
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size \
+                and entry["key"].endswith(mode):
+            target = source.parent / entry["file"]
+            if target.exists():
+                return target, {"cached": True, "raw": stat.st_size, "sparse": target.stat().st_size, "seconds": 0.0}
+
+        started = time.perf_counter()
+        key, runs = self.scan(source)
+        target = source.parent / f"{source.stem}.{key}.simg"
+        cached = target.exists()
+        if not cached:
+            if log:
+                log(f"Writing sparse {target.name} ({len(runs)} chunks)")
+            self.write(source, runs, target)
+        entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "key": key, "file": target.name}
+        with _image_lock(index_path):
+            # Re-read: other images in this directory may have been indexed meanwhile
+            try:
+                index = json.loads(index_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                index = {}
+            previous = index.get(source.name)
+            if previous and previous["file"] != target.name:
+                # Superseded copy of an older version of the source: multi-GB, never served again
+                (source.parent / previous["file"]).unlink(missing_ok=True)
+            index[source.name] = entry
+            text = json.dumps(index, indent=1).encode("utf-8")
+            _atomic_write(index_path, lambda out: out.write(text))
+        return target, {"cached": cached, "raw": stat.st_size, "sparse": target.stat().st_size,
+                        "seconds": round(time.perf_counter() - started, 3)}
+
+
+def prepare_for_flash(image, log=None, converter=None):
+    """Path to hand to fastboot: a cached sparse copy for large raw images, else the image itself"""
+    image = Path(image)
+    if image.stat().st_size < MIN_IMAGE_SIZE or is_sparse(image):
+        return image
+    target, stats = (converter or SparseConverter()).convert(image, log)
+    if stats["sparse"] >= stats["raw"] * 0.9:
+        return image  # Dense image: the chunk headers buy nothing
+    if log:
+        log(f"{image.name}: flashing sparse {stats['sparse'] / 1e6:.1f} MB instead of {stats['raw'] / 1e6:.1f} MB")
+    return target
+
+
+def unsparse(sparse_path, out_path):
+    """Expand a sparse image back to raw (DONT_CARE as zeros); returns bytes written"""
+    with open(sparse_path, "rb") as f, open(out_path, "wb") as out:
+        magic, major, _, file_header, chunk_header, block_size, blocks, chunks, _ = \
+            FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != SPARSE_MAGIC or major != MAJOR_VERSION:
+            raise ValueError(f"{sparse_path} is not a sparse image")
+        f.seek(file_header)
+        for _ in range(chunks):
+            kind, _, count, total = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+            f.seek(chunk_header - CHUNK_HEADER.size, 1)
+            length = count * block_size
+            if kind == CHUNK_RAW:
+                while length:
+                    data = f.read(min(length, COPY_SIZE))
+                    out.write(data)
+                    length -= len(data)
+            elif kind == CHUNK_FILL:
+                pattern = f.read(4) * (block_size // 4)
+                for _ in range(count):
+                    out.write(pattern)
+            elif kind == CHUNK_DONT_CARE:
+                out.seek(length, 1)
+            elif kind == CHUNK_CRC32:
+                f.read(4)
+            else:
+                raise ValueError(f"Unknown chunk type {kind:#x}")
+        out.truncate(blocks * block_size)
+        return blocks * block_size
+
+
+def make_test_image(path, size_mb=512, seed=7):
+    """Filesystem-like raw image: mostly zeros, some fill patterns, scattered random extents"""
+    import random
+
+    rng = random.Random(seed)
+    blocks = size_mb * 1024 * 1024 // BLOCK_SIZE
+    with open(path, "wb") as f:
+        f.truncate(blocks * BLOCK_SIZE)
+        block = 0
+        while block < blocks:
+            block += rng.randint(64, 4096)
+            extent = min(rng.randint(8, 1024), blocks - block)
+            if extent <= 0:
+                break
+            f.seek(block * BLOCK_SIZE)
+            if rng.random() < 0.2:
+                f.write(struct.pack("<I", rng.getrandbits(32)) * (extent * BLOCK_SIZE // 4))
+            else:
+                f.write(rng.randbytes(extent * BLOCK_SIZE))
+            block += extent
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def benchmark(size_mb=512, workers=None):
+    """Transfer reduction and conversion throughput on a synthetic image, verified by round trip"""
+    import shutil
+    import tempfile
+
+    workdir = Path(tempfile.mkdtemp(prefix="sparse_bench_"))
+    try:
+        raw = workdir / "userdata.img"
+        make_test_image(raw, size_mb)
+        size = raw.stat().st_size
+        print(f"{raw.name}: {size / 1e6:.0f} MB raw")
+
+        parallel = workers or os.cpu_count() or 1
+        for label, count in [("1 worker", 1)] + ([(f"{parallel} workers", parallel)] if parallel > 1 else []):
+            for stale in workdir.glob("*.simg"):
+                stale.unlink()
+            (workdir / INDEX_NAME).unlink(missing_ok=True)
+            started = time.perf_counter()
+            target, stats = SparseConverter(count).convert(raw)
+            elapsed = time.perf_counter() - started
+            print(f"{label:<12} {elapsed:7.2f}s {size / elapsed / 1e6:8.1f} MB/s  "
+                  f"-> {stats['sparse'] / 1e6:.1f} MB ({stats['sparse'] / size:.1%} of raw)")
+
+        started = time.perf_counter()
+        _, stats = SparseConverter(workers).convert(raw)
+        print(f"{'cache hit':<12} {(time.perf_counter() - started) * 1000:7.2f} ms (cached={stats['cached']})")
+
+        target, stats = SparseConverter(workers, zero_as_dont_care=True).convert(raw)
+        print(f"{'dont-care':<12} -> {stats['sparse'] / 1e6:.1f} MB with zero runs as DONT_CARE")
+
+        restored = workdir / "restored.img"
+        unsparse(next(workdir.glob("userdata.*-fill.simg")), restored)
+        print(f"Round trip identical: {file_sha256(restored) == file_sha256(raw)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 512)
+        return
+    if len(sys.argv) >= 4 and sys.argv[1] == "unsparse":
+        print(f"Wrote {unsparse(sys.argv[2], sys.argv[3])} bytes to {sys.argv[3]}")
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] not in ("-h", "--help"):
+        dont_care = "--dont-care" in sys.argv
+        for image in [arg for arg in sys.argv[1:] if arg != "--dont-care"]:
+            target, stats = SparseConverter(zero_as_dont_care=dont_care).convert(image, print)
+            how = "cached" if stats["cached"] else f"{stats['seconds']}s"
+            print(f"{image} -> {target} ({stats['raw'] / 1e6:.1f} MB -> {stats['sparse'] / 1e6:.1f} MB, {how})")
+        return
+    print("Usage: python sparse_image.py <raw.img> [...] [--dont-care]")
+    print("       python sparse_image.py unsparse <sparse.img> <raw.img>")
+    print("       python sparse_image.py bench [size_mb]")
+
+
+if __name__ == "__main__":
+    main()
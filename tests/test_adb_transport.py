@@ -0,0 +1,65 @@
+import os
+import threading
+
+import pytest
+
+from adb_transport import AdbClient, AdbError, FakeAdbd, file_sha256, push_tree
+
+
+@pytest.fixture
+def adbd(tmp_path):
+    fake = FakeAdbd(tmp_path / "device").start()
+    yield fake
+    fake.close()
+
+
+def client_for(fake, timeout=5.0):
+    return AdbClient(FakeAdbd.SERIAL, port=fake.port, timeout=timeout)
+
+
+def test_sideload_serves_the_whole_package(adbd, tmp_path):
+    package = tmp_path / "ota.zip"
+    package.write_bytes(os.urandom(3 * 64 * 1024 + 123))
+    stats = client_for(adbd).sideload(str(package), log=lambda message: None)
+    assert stats["bytes"] == package.stat().st_size
+    assert adbd.received["sideload"] == file_sha256(package)
+
+
+def test_sideload_survives_pauses_longer_than_the_connect_timeout(tmp_path):
+    fake = FakeAdbd(tmp_path / "device", latency=0.3).start()
+    try:
+        package = tmp_path / "ota.zip"
+        package.write_bytes(os.urandom(1024))
+        client_for(fake, timeout=0.1).sideload(str(package), log=lambda message: None)
+        assert fake.received["sideload"] == file_sha256(package)
+    finally:
+        fake.close()
+
+
+def test_wait_for_sideload_blocks_until_recovery_is_ready(adbd):
+    adbd.in_sideload.clear()
+    with pytest.raises(AdbError, match="sideload"):
+        client_for(adbd).wait_for("sideload", timeout=0.2)
+    threading.Timer(0.2, adbd.in_sideload.set).start()
+    client_for(adbd).wait_for("sideload", timeout=5)
+
+
+@pytest.mark.parametrize("pipelined", [True, False])
+def test_push_delivers_every_file(adbd, tmp_path, pipelined):
+    tree = tmp_path / "media"
+    tree.mkdir()
+    for i in range(20):
+        (tree / f"file_{i:02d}.bin").write_bytes(os.urandom(70 * 1024 if i % 2 else 10))
+    pairs = push_tree(tree, "/sdcard/")
+    stats = client_for(adbd).push(pairs, pipelined=pipelined)
+    assert stats["files"] == 20
+    assert {remote: adbd.received[remote] for _, remote in pairs} == \
+        {remote: file_sha256(local) for local, remote in pairs}
+
+
+def test_push_without_statuses_fails(adbd, tmp_path):
+    adbd._sync = lambda conn, send: threading.Event().wait(2)  # Device swallows the files
+    local = tmp_path / "a.bin"
+    local.write_bytes(b"data")
+    with pytest.raises(AdbError, match="0 of 1"):
+        client_for(adbd, timeout=0.3).push([(str(local), "/sdcard/a.bin")])
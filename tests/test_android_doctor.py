@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("requests")
+
+import android_doctor
+
+
+class FakeCapture:
+    def __init__(self, serial, out_dir=None):
+        self.serial = serial
+
+    def capture(self, seconds):
+        return []
+
+
+def test_boot_log_capture_counts_as_detection(monkeypatch, tmp_path):
+    monkeypatch.setattr(android_doctor.log_capture, "adb_devices", lambda: ["S1"])
+    monkeypatch.setattr(android_doctor.log_capture, "LogCapture", FakeCapture)
+    doctor = android_doctor.AndroidDoctor()
+    doctor.logs_dir = tmp_path
+    assert doctor.capture_boot_logs(seconds=1) is True
+    assert (doctor.device_detected, doctor.device_type, doctor.adb_serial) == (True, "adb", "S1")
+    assert doctor.boot_log_findings == []
+
+
+def test_no_device_is_not_detected(monkeypatch):
+    monkeypatch.setattr(android_doctor.log_capture, "adb_devices", lambda: [])
+    doctor = android_doctor.AndroidDoctor()
+    assert doctor.capture_boot_logs(seconds=1) is False
+    assert not doctor.device_detected
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from batch_runner import BatchRunner, SimulatedDeviceLayer, load_manifest
+from results_store import ResultsStore
+
+ACTIONS = ["diagnose", "network-reset", "flash", "verify"]
+
+
+def write_manifest(path, devices=100, **extra):
+    manifest = {
+        "defaults": {"model": "Nokia G50"},
+        "devices": [{"serial": f"SIM{i:03d}", "action": ACTIONS[i % len(ACTIONS)],
+                     "sim_state": "ABSENT" if i % 5 == 0 else "READY"} for i in range(devices)],
+    }
+    manifest.update(extra)
+    path.write_text(json.dumps(manifest), encoding="utf-8")
+    return path
+
+
+def test_hundred_device_manifest_streams_every_result(tmp_path):
+    _, jobs = load_manifest(write_manifest(tmp_path / "fleet.json"))
+    results = tmp_path / "results.jsonl"
+    progress = []
+    runner = BatchRunner(SimulatedDeviceLayer(latency=0.0), concurrency=16, results_path=results,
+                         progress=progress.append)
+
+    summary = runner.run(jobs)
+
+    assert summary["total"] == 100
+    assert summary["statuses"] == {"ok": 100}
+    records = [json.loads(line) for line in results.read_text(encoding="utf-8").splitlines()]
+    assert sorted(record["id"] for record in records) == sorted(job["id"] for job in jobs)
+    assert {record["action"] for record in records} == set(ACTIONS)
+    assert sum(1 for message in progress if message.startswith("[")) == 100
+
+
+def test_failures_are_reported_per_job():
+    jobs = [{"id": f"{i}", "serial": f"S{i}", "action": "verify"} for i in range(100)]
+    summary = BatchRunner(SimulatedDeviceLayer(latency=0.0, failure_rate=0.3, seed=1), concurrency=8,
+                          progress=lambda message: None).run(jobs)
+    assert summary["statuses"]["fail"] > 0
+    assert sum(summary["statuses"].values()) == 100
+
+
+def test_diagnose_results_reach_the_store(tmp_path):
+    _, jobs = load_manifest(write_manifest(tmp_path / "fleet.json", devices=40))
+    store = ResultsStore(":memory:")
+    BatchRunner(SimulatedDeviceLayer(latency=0.0), concurrency=4, store=store,
+                progress=lambda message: None).run(jobs)
+    ((model, devices, absent, rate),) = store.sim_absent_rate()
+    assert model == "Nokia G50"
+    assert devices == 10  # Every fourth job is a diagnose
+    assert absent == 2
+
+
+@pytest.mark.parametrize("entry, message", [
+    ({"model": "Nokia G50"}, "no serial or port"),
+    ({"serial": "X", "action": "explode"}, "unknown action"),
+])
+def test_invalid_manifest_entries_are_rejected(tmp_path, entry, message):
+    path = tmp_path / "bad.json"
+    path.write_text(json.dumps({"devices": [entry]}), encoding="utf-8")
+    with pytest.raises(ValueError, match=message):
+        load_manifest(path)
@@ -0,0 +1,42 @@
+from battery_watch import CAUGHT, CYCLE_RECORD, DRAINED, LOOPING, BatteryDrainWatch, read_cycle_log
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run_loop(tmp_path, period, visible, cycles, until):
+    """Device visible for `visible` seconds every `period` seconds, `cycles` times"""
+    clock = FakeClock()
+    probe = lambda: "MediaTek PreLoader USB VCOM" if clock.now < period * cycles and clock.now % period < visible else None
+    watch = BatteryDrainWatch(probe=probe, log_path=tmp_path / "cycles.bin", clock=clock, sleep=lambda seconds: None)
+    watch.log = lambda message: None
+    states = []
+    while clock.now < until:
+        states.append(watch.step())
+        clock.now += 1
+    watch.log_file.close()
+    return watch, states
+
+
+def test_long_period_loop_is_not_declared_drained_early(tmp_path):
+    # 20 s visible every 200 s: the old visible-time "period" gave a 120 s quiet limit
+    watch, states = run_loop(tmp_path, period=200, visible=20, cycles=5, until=950)
+    assert DRAINED not in states
+    assert CAUGHT not in states
+    assert watch.stats.count == 4
+    assert watch.stats.mean == 200
+
+
+def test_loop_stop_is_detected_and_cycles_logged(tmp_path):
+    watch, states = run_loop(tmp_path, period=60, visible=15, cycles=4, until=600)
+    assert states[-1] == DRAINED
+    assert states.count(LOOPING) > 180
+    records = list(read_cycle_log(tmp_path / "cycles.bin"))
+    assert (tmp_path / "cycles.bin").stat().st_size == 4 * CYCLE_RECORD.size == 64
+    assert [(visible, period) for _, visible, period in records] == [(15, 60)] * 3 + [(15, 0)]
+    assert records[0][0] > 1e9  # Appearance epoch, not a monotonic reading
@@ -0,0 +1,129 @@
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from batch_runner import SimulatedDeviceLayer
+from bench_cluster import BenchAgent, ClusterDeviceLayer, Coordinator, never_delivered, post_json, serve
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def failing_agent():
+    calls = []
+
+    def run(job):
+        calls.append(job)
+        raise RuntimeError("flash tool crashed")
+
+    server = serve({("POST", "/run"): run}, "127.0.0.1", 0)
+    yield f"http://127.0.0.1:{server.server_address[1]}", calls
+    server.shutdown()
+
+
+def register(layer, name, url, serials):
+    layer.register({"name": name, "url": url, "capacity": 2, "devices": [{"serial": s} for s in serials]})
+
+
+def test_refused_connections_are_the_only_retryable_errors(failing_agent):
+    url, _ = failing_agent
+    with pytest.raises(OSError) as refused:
+        post_json(f"http://127.0.0.1:{free_port()}/run", {}, timeout=2)
+    assert never_delivered(refused.value)
+    with pytest.raises(OSError) as server_error:
+        post_json(f"{url}/run", {}, timeout=2)
+    assert not never_delivered(server_error.value)
+    assert not never_delivered(ConnectionResetError())
+
+
+def test_agent_error_fails_the_job_once_and_keeps_the_agent(failing_agent):
+    url, calls = failing_agent
+    layer = ClusterDeviceLayer(route_timeout=1)
+    register(layer, "pc0", url, ["S1"])
+    record = layer.diagnose({"id": "1", "serial": "S1", "action": "diagnose"})
+    assert record["status"] == "error"
+    assert "500" in record["message"]
+    assert len(calls) == 1  # Not re-run: it may have half flashed the device
+    assert [agent.name for agent in layer.live_agents()] == ["pc0"]
+
+
+def test_unreachable_agent_is_dropped_and_the_job_reported():
+    layer = ClusterDeviceLayer(route_timeout=0.2)
+    register(layer, "gone", f"http://127.0.0.1:{free_port()}", ["S1"])
+    record = layer.flash({"id": "1", "serial": "S1", "action": "flash"})
+    assert record["status"] == "error"
+    assert layer.live_agents() == []
+
+
+def test_jobs_are_routed_to_the_agents_owning_their_devices():
+    coordinator = Coordinator(host="127.0.0.1", port=0, token="s3cret")
+    url = f"http://127.0.0.1:{coordinator.port}"
+    agents = []
+    try:
+        for a in range(2):
+            serials = [f"S{a}{d}" for d in range(5)]
+            devices = [{"serial": serial} for serial in serials]
+            agent = BenchAgent(f"pc{a}", url, SimulatedDeviceLayer(latency=0.0), lambda devices=devices: devices,
+                               capacity=2, token="s3cret")
+            threading.Thread(target=agent.heartbeat_forever, daemon=True).start()
+            agents.append(agent)
+        assert coordinator.wait_for_agents(2, timeout=10) == 2
+        jobs = [{"id": f"{i}", "serial": f"S{i % 2}{i % 5}", "action": "diagnose", "model": "Nokia G50"}
+                for i in range(20)]
+        summary = coordinator.run(jobs, progress=lambda message: None)
+        assert summary["statuses"] == {"ok": 20}
+        assert sum(stats["completed"] for stats in summary["agents"].values()) == 20
+    finally:
+        for agent in agents:
+            agent.stop()
+        coordinator.stop()
+
+
+def raw_post(url, body, token=None):
+    request = urllib.request.Request(url, data=body, headers={"X-Bench-Token": token} if token else {})
+    with pytest.raises(urllib.error.HTTPError) as refused:
+        urllib.request.urlopen(request, timeout=5)
+    return refused.value.code
+
+
+def test_requests_without_the_shared_token_are_refused():
+    calls = []
+    server = serve({("POST", "/run"): lambda job: calls.append(job) or {"status": "ok"}}, "127.0.0.1", 0, token="s3cret")
+    url = f"http://127.0.0.1:{server.server_address[1]}/run"
+    try:
+        assert raw_post(url, b'{"action": "flash"}') == 401
+        assert raw_post(url, b'{"action": "flash"}', token="guess") == 401
+        assert post_json(url, {"action": "flash"}, timeout=5, token="s3cret") == {"status": "ok"}
+        assert calls == [{"action": "flash"}]
+    finally:
+        server.shutdown()
+
+
+def test_fake_agents_cannot_register_with_the_coordinator():
+    coordinator = Coordinator(host="127.0.0.1", port=0, token="s3cret")
+    url = f"http://127.0.0.1:{coordinator.port}/register"
+    status = {"name": "rogue", "url": "http://127.0.0.1:1", "devices": [{"serial": "S1"}]}
+    try:
+        with pytest.raises(urllib.error.HTTPError):
+            post_json(url, status, timeout=5, token="wrong")
+        assert coordinator.layer.live_agents() == []
+        post_json(url, status, timeout=5, token="s3cret")
+        assert [agent.name for agent in coordinator.layer.live_agents()] == ["rogue"]
+    finally:
+        coordinator.stop()
+
+
+@pytest.mark.parametrize("body", [b"{not json", b"[1, 2]", b"\xff\xfe"])
+def test_bad_request_bodies_get_a_400(body):
+    server = serve({("POST", "/run"): lambda job: {"status": "ok"}}, "127.0.0.1", 0)
+    try:
+        assert raw_post(f"http://127.0.0.1:{server.server_address[1]}/run", body) == 400
+    finally:
+        server.shutdown()
@@ -0,0 +1,78 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from command_runner import CommandResult
+from command_trace import ReplayBackend, TraceWriter, read_trace
+
+ROOT = Path(__file__).resolve().parent.parent
+
+POLL_SCRIPT = """
+import time
+from command_runner import run_command
+
+while True:
+    try:
+        run_command(["adb", "devices"], timeout=5)
+    except FileNotFoundError:
+        pass
+    time.sleep(0.01)
+"""
+
+POLLER_SCRIPT = """
+from command_runner import run_command
+from poll_scheduler import AdaptivePoller
+
+poller = AdaptivePoller(normal=5, idle_max=5)
+while True:
+    poller.begin_poll()
+    try:
+        run_command(["adb", "devices"], timeout=5)
+    except FileNotFoundError:
+        pass
+    poller.record(False)
+    poller.wait()
+"""
+
+
+def write_trace(path, count=5):
+    writer = TraceWriter(str(path))
+    for i in range(count):
+        writer.record(CommandResult(["adb", "devices"], 0, f"List of devices attached\nS{i}\tdevice\n", "",
+                                    False, 0.5), writer.started)
+    writer.close()
+
+
+def test_trace_round_trip(tmp_path):
+    write_trace(tmp_path / "trace.bin")
+    commands = list(read_trace(tmp_path / "trace.bin"))
+    assert [c["stdout"].split()[-2] for c in commands] == ["S0", "S1", "S2", "S3", "S4"]
+    assert all(c["args"] == ["adb", "devices"] and c["duration"] == 0.5 for c in commands)
+
+
+def test_replay_serves_in_order_and_loops_only_when_asked(tmp_path):
+    write_trace(tmp_path / "trace.bin", count=2)
+    looping = ReplayBackend(tmp_path / "trace.bin", speed=0, loop_trace=True)
+    served = [looping.next_command(["adb", "devices"])["stdout"] for _ in range(4)]
+    assert [out.split()[-2] for out in served] == ["S0", "S1", "S0", "S1"]
+    assert looping.next_command(["fastboot", "devices"]) is None
+
+
+def test_monitor_replay_stops_at_the_end_of_the_trace(tmp_path):
+    write_trace(tmp_path / "trace.bin")
+    (tmp_path / "poll.py").write_text(POLL_SCRIPT)
+    result = subprocess.run([sys.executable, str(ROOT / "command_trace.py"), "bench", str(tmp_path / "trace.bin"),
+                             str(tmp_path / "poll.py")], capture_output=True, text=True, timeout=60, cwd=ROOT)
+    assert "Served 5 commands" in result.stdout
+    assert "(end of trace reached)" in result.stdout
+
+
+def test_bench_fast_forwards_poll_waits(tmp_path):
+    write_trace(tmp_path / "trace.bin")
+    (tmp_path / "poll.py").write_text(POLLER_SCRIPT)
+    result = subprocess.run([sys.executable, str(ROOT / "command_trace.py"), "bench", str(tmp_path / "trace.bin"),
+                             str(tmp_path / "poll.py")], capture_output=True, text=True, timeout=15, cwd=ROOT)
+    assert "(end of trace reached)" in result.stdout
+    # Five polls 5 s apart: at least 20 s of waits skipped instead of slept through
+    skipped = float(result.stdout.split("Fast-forwarded ")[1].split("s")[0])
+    assert skipped >= 20
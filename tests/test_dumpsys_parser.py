@@ -0,0 +1,165 @@
+import sys
+
+import pytest
+
+from command_runner import run_command
+from dumpsys_parser import (BatteryParser, ConnectivityParser, ParcelParser, TelephonyRegistryParser, luhn_valid,
+                            sample_dump)
+
+TELEPHONY_REGISTRY = """\
+last known state:
+  Phone Id=0
+  mCallState=0
+  mRingingCallState=0
+  mServiceState={mVoiceRegState=0(IN_SERVICE), mDataRegState=0(IN_SERVICE), mChannelNumber=1300, \
+mOperatorAlphaLong=Telia, mOperatorAlphaShort=Telia, isEmergencyOnly=false, mIsManualNetworkSelection=false}
+  mSignalStrength=SignalStrength:{mCdma=Invalid,mGsm=Invalid,mWcdma=Invalid,mTdscdma=Invalid,\
+mLte=CellSignalStrengthLte: rssi=-67 rsrp=-95 rsrq=-11 rssnr=2147483647 cqi=2147483647 ta=2147483647 level=3 \
+parametersUseForLevel=0,mNr=Invalid,primary=CellSignalStrengthLte,voiceRAT=13}
+  mDataConnectionState=2
+  Phone Id=1
+  mServiceState={mVoiceRegState=1(OUT_OF_SERVICE), mDataRegState=1(OUT_OF_SERVICE), mOperatorAlphaLong=null}
+  mSignalStrength=SignalStrength:{mCdma=Invalid,mGsm=Invalid,mWcdma=Invalid,mTdscdma=Invalid,mLte=Invalid,\
+mNr=Invalid,primary=CellSignalStrengthLte}
+local logs:
+  2024-06-01 12:00:00.000 notifySignalStrength: subId=1 phoneId=0 ss=SignalStrength:{mLte=CellSignalStrengthLte: \
+rssi=-113 rsrp=-140 level=0}
+  mDataConnectionState=0
+"""
+
+# Android 8 prints the service state and signal strength as bare word lists
+TELEPHONY_REGISTRY_LEGACY = """\
+  mCallState=0
+  mServiceState=0 0 voice home data home Telia Telia 24001  Telia Telia 24001  LTE LTE CSS not supported 0 0 \
+RoamInd=-1 DefRoamInd=-1 EmergOnly=false
+  mSignalStrength=SignalStrength: 14 99 -120 -160 -120 -1 -1 99 2147483647 2147483647 2147483647 2147483647 \
+2147483647 gsm|lte
+  mDataConnectionState=0
+"""
+
+BATTERY = """\
+Current Battery Service state:
+  AC powered: false
+  USB powered: true
+  Wireless powered: false
+  Max charging current: 500000
+  Max charging voltage: 5000000
+  Charge counter: 3843000
+  status: 2
+  health: 2
+  present: true
+  level: 85
+  scale: 100
+  voltage: 4203
+  temperature: 312
+  technology: Li-ion
+Battery history:
+    +1h02m03s004ms (2) 085 c0900020 status=charging health=good plug=usb temp=312 volt=4203
+"""
+
+CONNECTIVITY = """\
+NetworkFactories for:
+Active default network: 100
+Current Networks:
+  NetworkAgentInfo{network{100}  handle{432902426637}  ni{MOBILE[LTE] CONNECTED extra: internet}  \
+created{2024-06-01T12:00:00Z}  nc{[ Transports: CELLULAR Capabilities: MMS&SUPL&INTERNET&NOT_RESTRICTED&TRUSTED&\
+NOT_VPN&VALIDATED&NOT_ROAMING LinkUpBandwidth>=51200Kbps ]}  score{...}}
+  NetworkAgentInfo{network{101}  handle{437197393933}  ni{WIFI CONNECTED}  nc{[ Transports: WIFI \
+Capabilities: INTERNET&NOT_RESTRICTED&TRUSTED&NOT_VPN ]}}
+"""
+
+# service call iphonesubinfo 1
+IMEI_REPLY = """\
+Result: Parcel(
+  0x00000000: 00000000 0000000f 00350033 00390036 '........3.5.6.9.'
+  0x00000010: 00380033 00330030 00360035 00330034 '3.8.0.3.5.6.4.3.'
+  0x00000020: 00300038 00000039                   '8.0.9...        ')
+"""
+
+DENIED_REPLY = """\
+Result: Parcel(0x00000000: ffffffff 00000024 00650052 00750071 '....$...R.e.q.u.'
+  0x00000010: 00720069 00730065 00520020 00410045 'i.r.e.s. .R.E.A.'
+  0x00000020: 005f0044 00520050 00560049 004c0049 'D._.P.R.I.V.I.L.'
+  0x00000030: 00470045 00440045 0050005f 004f0048 'E.G.E.D._.P.H.O.'
+  0x00000040: 0045004e 0053005f 00410054 00450054 'N.E._.S.T.A.T.E.'
+  0x00000050: 00000000                            '....            ')
+"""
+
+
+def test_telephony_registry():
+    parser = TelephonyRegistryParser().feed_text(TELEPHONY_REGISTRY)
+    phones = parser.result()
+    assert phones[0]["mServiceState"] == {"voice": "IN_SERVICE", "data": "IN_SERVICE", "operator": "Telia",
+                                          "emergency_only": False}
+    assert phones[1]["mServiceState"]["operator"] == ""
+    assert parser.facts() == {"signal_rat": "LTE", "signal_dbm": -95, "signal_level": 3,
+                              "voice_reg_state": "IN_SERVICE", "data_reg_state": "IN_SERVICE",
+                              "data_connection": "CONNECTED", "signal_strength": "LTE -95 dBm (level 3)"}
+    assert parser.done  # The event history after "local logs:" is never parsed
+
+
+def test_legacy_telephony_registry():
+    facts = TelephonyRegistryParser().feed_text(TELEPHONY_REGISTRY_LEGACY).facts()
+    assert facts["voice_reg_state"] == "IN_SERVICE"
+    assert (facts["signal_rat"], facts["signal_dbm"], facts["signal_level"]) == ("GSM", -85, 4)
+    assert facts["data_connection"] == "DISCONNECTED"
+
+
+def test_battery():
+    parser = BatteryParser().feed_text(BATTERY)
+    assert parser.facts() == {"battery_level": 85, "battery_status": "charging", "battery_health": "good",
+                              "battery_temp_c": 31.2, "battery_voltage_mv": 4203, "charger": "usb"}
+    assert "temp" not in parser.result()  # History lines are not state fields
+
+
+def test_connectivity():
+    parser = ConnectivityParser().feed_text(CONNECTIVITY)
+    assert parser.facts() == {"default_network": "MOBILE[LTE]", "default_transport": "CELLULAR",
+                              "internet_validated": True}
+    assert [network["transports"] for network in parser.result()["networks"]] == [["CELLULAR"], ["WIFI"]]
+    assert ConnectivityParser().feed_text("Active default network: none\n").facts() == {"default_network": "none"}
+
+
+def test_imei_from_a_service_call():
+    assert ParcelParser().feed_text(IMEI_REPLY).facts() == {"imei": "356938035643809"}
+    assert luhn_valid("356938035643809")
+    assert not luhn_valid("356938035643808")
+
+
+def test_service_call_exception_is_reported():
+    parser = ParcelParser().feed_text(DENIED_REPLY)
+    assert parser.result() == {"exception": -1, "value": "Requires READ_PRIVILEGED_PHONE_STATE"}
+    assert parser.facts() == {"imei_error": "Requires READ_PRIVILEGED_PHONE_STATE"}
+
+
+CHUNKED_WRITER = """
+import sys, time
+data = open(sys.argv[1], "rb").read()
+for i in range(0, len(data), 7):
+    sys.stdout.buffer.write(data[i:i + 7])
+    sys.stdout.buffer.flush()
+    if i % 70 == 0:
+        time.sleep(0.001)
+"""
+
+
+@pytest.mark.parametrize("parser_class, text", [
+    (TelephonyRegistryParser, TELEPHONY_REGISTRY),
+    (BatteryParser, BATTERY),
+    (ConnectivityParser, CONNECTIVITY),
+    (ParcelParser, IMEI_REPLY),
+])
+def test_output_split_across_chunks_parses_the_same(tmp_path, parser_class, text):
+    """7-byte writes split lines and words mid-way, the way a slow adb pipe delivers them"""
+    source = tmp_path / "dump.txt"
+    source.write_text(text)
+    streamed = parser_class()
+    run_command([sys.executable, "-c", CHUNKED_WRITER, str(source)], timeout=30, on_line=streamed.feed, capture=False)
+    assert streamed.facts() == parser_class().feed_text(text).facts()
+    assert streamed.lines == len(text.splitlines())
+
+
+def test_large_dumps_stop_parsing_after_the_state_block():
+    parser = BatteryParser().feed_text(sample_dump("battery", size_mb=1))
+    assert parser.done
+    assert parser.facts()["battery_level"] == 85
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import edl_client
+from edl_client import FirehoseError, simulated_session
+from serial_port import TransportClosed, pty_pair, socket_pair
+
+
+@pytest.fixture
+def session():
+    client, device = simulated_session()
+    yield client, device
+    client.transport.close()
+
+
+def test_sahara_upload_and_firehose_configure(session):
+    client, device = session
+    assert client.max_payload == edl_client.DEFAULT_MAX_PAYLOAD
+    assert device.error is None
+
+
+def test_partition_table_is_read_back(session):
+    client, _ = session
+    table = client.partitions()
+    assert list(table) == ["boot", "system", "userdata"]
+    assert table["boot"] == (34, 16384)
+
+
+def test_program_and_read_round_trip(session):
+    client, device = session
+    data = os.urandom(64 * client.sector_size)
+    client.program(100000, data)
+    assert client.read(100000, 64) == data
+    assert bytes(device.disk[100000 * client.sector_size:][:len(data)]) == data
+
+
+def test_reads_past_the_end_are_refused(session):
+    client, device = session
+    with pytest.raises(FirehoseError):
+        client.read(len(device.disk) // client.sector_size, 1)
+
+
+@pytest.mark.parametrize("pair", [pty_pair, socket_pair])
+def test_read_exact_without_timeout_stops_when_the_device_drops(pair):
+    host, device = pair()
+    device.write(b"ab")
+    device.close()
+    with pytest.raises(TransportClosed):
+        host.read_exact(4, None)
+    host.close()
+
+
+def test_read_returns_nothing_only_on_timeout():
+    host, device = socket_pair()
+    assert host.read(4, 0.01) == b""
+    device.write(b"x")
+    assert host.read(4, 1.0) == b"x"
+    host.close()
+    device.close()
+
+
+def test_ufs_storage_uses_4096_byte_sectors():
+    client, device = simulated_session(memory="ufs")
+    try:
+        assert client.sector_size == device.sector_size == 4096
+        table = client.partitions()
+        assert table["boot"] == (34, 2048)
+        data = os.urandom(3 * 4096)
+        client.program(table["system"][0], data)
+        assert client.read(table["system"][0], 3) == data
+        assert device.error is None
+    finally:
+        client.transport.close()
+
+
+def test_sector_size_mismatch_is_refused():
+    client, _ = simulated_session(memory="ufs")
+    try:
+        client.sector_size = 512
+        with pytest.raises(FirehoseError):
+            client.read(1, 1)
+    finally:
+        client.transport.close()
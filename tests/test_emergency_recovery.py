@@ -0,0 +1,14 @@
+from emergency_recovery import EmergencyRecovery
+
+
+def test_edl_device_resolves_to_the_g50_profile():
+    recovery = EmergencyRecovery("Nokia G11")  # An MTK profile: no EDL mode of its own
+    profile = recovery.edl_profile("Qualcomm HS-USB QDLoader 9008 (COM5) USB\\VID_05C6&PID_9008\\5&1A2B")
+    assert profile["model"] == "Nokia G50"
+    assert profile["firehose"]["memory"] == "ufs"
+    assert recovery.edl_profile()["model"] == "Nokia G50"
+
+
+def test_model_with_an_edl_mode_is_used_directly():
+    recovery = EmergencyRecovery("Nokia G50")
+    assert recovery.edl_profile() is recovery.profile
@@ -0,0 +1,122 @@
+import multiprocessing
+import time
+
+import pytest
+
+from event_ring import DATA_OFFSET, DOORBELL_OFFSET, DOORBELLS, RECORD, SEQ, EventRing
+
+CAPACITY = 64
+SAMPLE = ("USB\\VID_0E8D&PID_2000\\5&2A1B", "preloader", "Nokia G11")
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "events.ring"
+
+
+@pytest.fixture
+def writer(path):
+    ring = EventRing.create(path, CAPACITY)
+    yield ring
+    ring.close()
+
+
+def publish(ring, count):
+    return [ring.publish("progress", *SAMPLE, progress=i % 101) for i in range(count)]
+
+
+def test_reader_starts_at_the_live_edge(writer, path):
+    publish(writer, 3)
+    reader = EventRing.attach(path)
+    assert reader.read() == []
+    writer.publish("detected", *SAMPLE)
+    (event,) = reader.read()
+    assert (event.seq, event.kind, event.device, event.mode, event.model) == (4, "detected", *SAMPLE)
+    reader.close()
+
+
+def test_lapped_reader_skips_ahead_and_counts_drops(writer, path):
+    reader = EventRing.attach(path)
+    reader.next_seq = 1
+    publish(writer, 200)
+    events = reader.read()
+    assert [event.seq for event in events] == list(range(137, 201))
+    assert reader.dropped == 136
+    reader.close()
+
+
+def test_torn_record_is_rejected(writer, path):
+    publish(writer, CAPACITY)
+    reader = EventRing.attach(path)
+    reader.next_seq = 1
+    # The writer has started overwriting seq 1's slot with seq 65: it zeroes the sequence first
+    SEQ.pack_into(writer.map, DATA_OFFSET + (65 & (CAPACITY - 1)) * RECORD.size, 0)
+    events = reader.read()
+    assert [event.seq for event in events] == list(range(2, CAPACITY + 1))
+    assert reader.dropped == 1
+    reader.close()
+
+
+def test_writer_restart_continues_the_sequence(path):
+    writer = EventRing.create(path, CAPACITY)
+    publish(writer, 5)
+    reader = EventRing.attach(path)
+    writer.close()
+
+    writer = EventRing.create(path, CAPACITY)
+    assert writer.publish("status", *SAMPLE) == 6
+    assert [event.seq for event in reader.read()] == [6]
+    reader.close()
+    writer.close()
+
+    resized = EventRing.create(path, CAPACITY * 2)  # A different layout starts over
+    assert resized.last_seq() == 0
+    resized.close()
+
+
+def _drain(path, count, results):
+    ring = EventRing.attach(path)
+    ring.next_seq = 1
+    seqs = []
+    while ring.next_seq <= count:
+        events = ring.wait(timeout=5)
+        if not events:
+            break
+        seqs.extend(event.seq for event in events)
+    results.put((seqs, ring.dropped))
+    ring.close()
+
+
+def test_reader_process_accounts_for_every_event(writer, path):
+    results = multiprocessing.Queue()
+    reader = multiprocessing.Process(target=_drain, args=(path, 20000, results))
+    reader.start()
+    publish(writer, 20000)
+    seqs, dropped = results.get(timeout=30)
+    reader.join(10)
+    assert seqs == sorted(set(seqs))
+    assert seqs[-1] == 20000
+    assert len(seqs) + dropped == 20000
+
+
+def _sleeper(path, results):
+    ring = EventRing.attach(path)
+    events = ring.wait(timeout=10)
+    results.put((time.monotonic_ns() - events[0].mono_ns if events else None, [e.kind for e in events]))
+    ring.close()
+
+
+def test_doorbell_wakes_a_sleeping_reader(writer, path):
+    results = multiprocessing.Queue()
+    reader = multiprocessing.Process(target=_sleeper, args=(path, results))
+    reader.start()
+    deadline = time.monotonic() + 10
+    while not any(bell & 1 for bell in DOORBELLS.unpack_from(writer.map, DOORBELL_OFFSET)):
+        assert time.monotonic() < deadline, "reader never went to sleep on its doorbell"
+        time.sleep(0.01)
+    writer.publish("detected", *SAMPLE)
+    latency, kinds = results.get(timeout=10)
+    reader.join(10)
+    assert kinds == ["detected"]
+    assert latency < 40e6  # Rung awake, well inside the 50 ms select timeout
+    assert DOORBELLS.unpack_from(writer.map, DOORBELL_OFFSET) == (0,) * 12  # Slot released on close
@@ -0,0 +1,57 @@
+import queue
+
+import firmware_prefetch
+from firmware_prefetch import FirmwarePrefetcher
+
+
+class QuickQueue(queue.Queue):
+    """Idle worker gives up after 10 ms instead of 5 s"""
+
+    def get(self, block=True, timeout=None):
+        return super().get(block, 0.01 if timeout else timeout)
+
+
+def make_prefetcher(tmp_path, prepared):
+    prefetcher = FirmwarePrefetcher(firmware_dir=tmp_path, stats_path=tmp_path / "stats.jsonl",
+                                    log=lambda message: None,
+                                    preparer=lambda profile, *args, **kwargs: prepared.append(profile["model"]))
+    prefetcher.queue = QuickQueue()
+    return prefetcher
+
+
+def test_prefetch_after_the_worker_went_idle_still_runs(tmp_path):
+    prepared = []
+    prefetcher = make_prefetcher(tmp_path, prepared)
+    first = prefetcher.prefetch("Nokia G50")
+    assert first.done.wait(2)
+    worker = prefetcher.worker
+    if worker is not None:
+        worker.join(2)
+    assert prefetcher.worker is None  # The worker cleared itself on the way out
+
+    prefetcher.jobs.clear()
+    second = prefetcher.prefetch("Nokia G50")
+    assert second.done.wait(2)
+    assert prepared == ["Nokia G50", "Nokia G50"]
+
+
+def test_many_prefetches_around_worker_exit_all_complete(tmp_path):
+    prepared = []
+    prefetcher = make_prefetcher(tmp_path, prepared)
+    jobs = []
+    for _ in range(50):
+        prefetcher.jobs.clear()
+        jobs.append(prefetcher.prefetch("Nokia G11"))
+        jobs[-1].done.wait(0.05)
+    assert all(job.done.wait(2) for job in jobs)
+
+
+def test_claim_credits_a_finished_prefetch(tmp_path):
+    prepared = []
+    prefetcher = make_prefetcher(tmp_path, prepared)
+    prefetcher.prefetch("Nokia G50").done.wait(2)
+    assert prefetcher.claim("Nokia G50") == "hit"
+    assert prefetcher.claim("Nokia G50") == "miss"
+    assert prepared == ["Nokia G50", "Nokia G50"]
+    assert firmware_prefetch.get_database().by_model("Unknown Phone") is None
+    assert prefetcher.prefetch("Unknown Phone") is None
@@ -0,0 +1,50 @@
+import pytest
+
+from log_capture import SignatureMatcher
+
+HEALTHY_BOOT = b"""\
+init: [libfs_mgr]fs_mgr_mount_all(): mounting /data
+e2fsck: /dev/block/by-name/metadata: clean, 15/4096 files, 1312/4096 blocks
+fsck.f2fs -a /dev/block/by-name/userdata
+[FSCK] Check node 1 / 1 (0.00%)
+subsys-restart: subsystem_restart_dev(): Restart sequence requested for adsp, restart_level = RELATED
+avb: slot verification failed? no, verified boot state green
+Kernel command line: androidboot.hardware=qcom dm_verity.dev_wait=1 androidboot.verifiedbootstate=green
+DEBUG: avb_slot_verify.c: boot_a: Loading vbmeta struct from partition
+DEBUG: avb_slot_verify returned AVB_SLOT_VERIFY_RESULT_OK
+cmd_exec: running vendor.qti.hardware.perf@2.0-service
+init: Reboot start, reason: reboot, reboot_target: bootloader
+init: Received sys.powerctl='reboot,bootloader' from pid: 1234 (/system/bin/adbd)
+"""
+
+
+def scan(data):
+    return {signature for signature, _, _ in SignatureMatcher().scanner().feed(data)}
+
+
+def test_healthy_boot_lines_match_nothing():
+    assert scan(HEALTHY_BOOT) == set()
+
+
+@pytest.mark.parametrize("line, signature", [
+    (b"init: fs_mgr_mount_all returned an error", "fs-corruption"),
+    (b"e2fsck: /dev/block/dm-5: UNEXPECTED INCONSISTENCY; RUN fsck MANUALLY.", "fs-corruption"),
+    (b"EXT4-fs error (device dm-5): ext4_lookup:1601: inode #2: comm init: deleted inode referenced", "fs-corruption"),
+    (b"subsys-restart: __subsystem_restart_dev(): Restart sequence requested for modem", "modem-crash"),
+    (b"modem subsystem failure reason: mpss_wdog_bite", "modem-crash"),
+    (b"dm-verity device corrupted Force Boot: 5", "dm-verity"),
+    (b"Kernel panic - not syncing: Fatal exception", "kernel-panic"),
+    (b"VerifyPartition: avb_slot_verify failed: ERROR_VERIFICATION", "dm-verity"),
+    (b"dm_verity: corrupted block 1027 on dm-4", "dm-verity"),
+    (b"[ccci1/mcd]md_ex_info: MD exception type 0x2", "modem-crash"),
+    (b"init: Reboot start, reason: reboot,bootloop", "init-reboot"),
+])
+def test_failure_lines_are_recognised(line, signature):
+    assert scan(b"noise\n" + line + b"\nmore noise\n") == {signature}
+
+
+def test_matches_spanning_chunks_are_found():
+    scanner = SignatureMatcher().scanner()
+    line = b"Kernel panic - not syncing: Attempted to kill init!\n"
+    found = scanner.feed(line[:10]) + scanner.feed(line[10:])
+    assert [signature for signature, _, _ in found] == ["kernel-panic"]
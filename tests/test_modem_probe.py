@@ -0,0 +1,66 @@
+import pytest
+
+from modem_probe import QUERIES, FakeModem, ModemProbe, compound, split_compound
+from serial_port import pty_pair
+
+
+@pytest.fixture
+def modem_pair():
+    pairs = []
+
+    def make(**kwargs):
+        host, target = pty_pair()
+        modem = FakeModem(target, latency=0.001, **kwargs).start()
+        pairs.append((host, modem))
+        return host, modem
+
+    yield make
+    for host, modem in pairs:
+        modem.stop()
+        host.close()
+
+
+def test_compound_line_joins_basic_and_extended_commands():
+    assert compound([command for _, command in QUERIES]) == "ATE0+CPIN?;+CSQ;+CREG?;+CGSN;+CGMR;+CGMM"
+
+
+def test_split_compound_assigns_lines_by_prefix_then_order():
+    commands = ["ATE0", "AT+CPIN?", "AT+CSQ", "AT+CGSN", "AT+CGMM"]
+    lines = ["+CPIN: READY", "+CSQ: 18,99", "356938035643809", "TA-1358"]
+    assert split_compound(commands, "OK", lines) == [
+        ("OK", []), ("OK", ["+CPIN: READY"]), ("OK", ["+CSQ: 18,99"]),
+        ("OK", ["356938035643809"]), ("OK", ["TA-1358"])]
+
+
+def test_split_compound_stops_at_the_failing_command():
+    commands = ["AT+CPIN?", "AT+CSQ", "AT+CGSN"]
+    assert split_compound(commands, "+CME ERROR: 10", []) == [("+CME ERROR: 10", []), None, None]
+
+
+@pytest.mark.parametrize("pipelined", [True, False])
+def test_probe_reads_every_fact(modem_pair, pipelined):
+    host, _ = modem_pair(rssi=20, creg=5)
+    facts = ModemProbe(host, timeout=2, pipelined=pipelined).query()
+    assert facts["modem_responding"] is True
+    assert facts["at_sim_state"] == "READY"
+    assert facts["signal"] == "-73 dBm"
+    assert facts["registration"] == "roaming"
+    assert facts["at_imei"] == "356938035643809"
+    assert facts["modem_model"] == "TA-1358"
+
+
+def test_probe_sends_one_command_line(modem_pair):
+    host, modem = modem_pair()
+    lines = []
+    reply = modem.reply
+    modem.reply = lambda line: lines.append(line) or reply(line)
+    ModemProbe(host, timeout=2).query()
+    assert lines == ["ATE0+CPIN?;+CSQ;+CREG?;+CGSN;+CGMR;+CGMM"]
+
+
+def test_missing_sim_does_not_lose_the_other_answers(modem_pair):
+    host, _ = modem_pair(sim="ABSENT")
+    facts = ModemProbe(host, timeout=2).query()
+    assert facts["at_sim_state"] == "ERROR: SIM not inserted"
+    assert facts["signal"] == "-77 dBm"
+    assert facts["at_imei"] == "356938035643809"
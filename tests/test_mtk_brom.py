@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+from mtk_brom import SimulatedMtkDevice, catch_device
+from serial_port import TransportClosed, pty_pair
+
+
+@pytest.mark.parametrize("mode", ["brom", "preloader"])
+def test_catch_identifies_and_holds_the_device(mode):
+    host, target = pty_pair()
+    device = SimulatedMtkDevice(target, mode=mode, window=0.5).start()
+    client, info = catch_device(host, log=lambda message: None)
+    assert info["mode"] == mode
+    assert info["hw_code"] == "0x0766"
+    assert info["watchdog"] == "disabled"
+    assert ("me_id" in info) == (mode == "brom")
+    time.sleep(0.8)
+    assert device.thread.is_alive()  # Held past the watchdog window
+    host.close()
+    device.thread.join(2)
+    assert not device.thread.is_alive()
+    assert device.error is None
+
+
+def test_unheld_device_reboots_and_the_host_sees_it_close():
+    host, target = pty_pair()
+    device = SimulatedMtkDevice(target, window=0.3).start()
+    catch_device(host, log=lambda message: None, hold=False)
+    device.thread.join(2)
+    assert not device.thread.is_alive()
+    with pytest.raises(TransportClosed):
+        host.read_exact(1, None)
+    host.close()
@@ -0,0 +1,52 @@
+import pytest
+
+import nokia_g50_analyzer
+from nokia_g50_analyzer import NokiaG50Analyzer
+
+BENCH = {
+    "COM5": {"port": "COM5", "modem_responding": True, "at_imei": "356938035643809", "at_sim_state": "READY"},
+    "COM7": {"port": "COM7", "modem_responding": True, "at_imei": "490154203237518", "at_sim_state": "not inserted"},
+}
+
+
+@pytest.fixture
+def bench(monkeypatch):
+    def install(ports):
+        monkeypatch.setattr(nokia_g50_analyzer, "probe_all",
+                            lambda: {port: dict(facts) for port, facts in ports.items()})
+    return install
+
+
+def test_port_is_matched_by_imei(bench):
+    bench(BENCH)
+    facts = NokiaG50Analyzer().check_modem_at("490154203237518")
+    assert facts["at_sim_state"] == "not inserted"
+    assert "port" not in facts
+
+
+def test_unknown_imei_yields_no_modem_facts(bench):
+    bench(BENCH)
+    assert NokiaG50Analyzer().check_modem_at("000000000000000") == {}
+
+
+def test_several_ports_without_imei_are_not_guessed(bench):
+    bench(BENCH)
+    assert NokiaG50Analyzer().check_modem_at() == {}
+    bench({"COM5": BENCH["COM5"]})
+    assert NokiaG50Analyzer().check_modem_at()["at_imei"] == "356938035643809"
+
+
+def test_analysis_matches_the_modem_by_the_adb_imei(bench, monkeypatch):
+    bench(BENCH)
+    analyzer = NokiaG50Analyzer()
+    reported = {}
+    monkeypatch.setattr(analyzer, "check_adb_connection", lambda: True)
+    monkeypatch.setattr(analyzer, "get_device_info", lambda: {"imei": "490154203237518", "sim_state": "ABSENT"})
+    for name in ("run_network_diagnostics", "check_battery"):
+        monkeypatch.setattr(analyzer, name, lambda: {})
+    for name in ("check_sim_hardware", "check_baseband_modem", "create_g50_recovery_script"):
+        monkeypatch.setattr(analyzer, name, lambda: None)
+    monkeypatch.setattr(analyzer, "report_verdicts", lambda facts: reported.update(facts) or [])
+    monkeypatch.setattr(analyzer, "record_results", lambda facts, verdicts: None)
+    analyzer.analyze_g50()
+    assert reported["at_sim_state"] == "not inserted"
@@ -0,0 +1,65 @@
+import json
+import os
+
+import pytest
+
+from partition_backup import BackupEngine, FileDevice, make_fake_device
+
+CHUNK = 256 * 1024
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return BackupEngine(tmp_path / "archive", workers=2, chunk_size=CHUNK)
+
+
+def stored_chunks(engine):
+    return sorted(path.name for path in engine.store.root.glob("*/*.*"))
+
+
+def test_backup_and_restore_round_trip(tmp_path, engine):
+    device = make_fake_device(tmp_path / "device", size_mb=8)
+    manifest = engine.backup(device, label="fake")
+    partitions = json.loads(manifest.read_text())["partitions"]
+    assert sorted(partitions) == ["boot", "nvram", "protect1", "protect2", "userdata"]
+    assert partitions["userdata"]["zero_bytes"] == 7 * 1024 * 1024
+
+    for name in partitions:
+        out = engine.restore(manifest, name, tmp_path / f"{name}.restored")
+        assert out.read_bytes() == (tmp_path / "device" / f"{name}.img").read_bytes()
+
+
+def test_repeated_blocks_are_stored_once(tmp_path, engine):
+    block = os.urandom(CHUNK)
+    other = os.urandom(CHUNK)
+    device_dir = tmp_path / "device"
+    device_dir.mkdir()
+    (device_dir / "a.img").write_bytes(block + other)
+    (device_dir / "b.img").write_bytes(block + other)
+    (device_dir / "c.img").write_bytes(block * 3 + bytes(CHUNK) + other)
+
+    manifest = engine.backup(FileDevice(device_dir), label="dedup")
+    stats = json.loads(manifest.read_text())["stats"]
+    assert len(stored_chunks(engine)) == 2
+    assert stats["stored_raw"] == 2 * CHUNK
+    assert stats["zero"] == CHUNK
+    assert stats["duplicate"] == stats["read"] - stats["zero"] - 2 * CHUNK
+
+    # A second backup of the same device adds nothing to the store
+    before = stored_chunks(engine)
+    second = json.loads(engine.backup(FileDevice(device_dir), label="again").read_text())["stats"]
+    assert stored_chunks(engine) == before
+    assert second["stored"] == 0
+
+
+def test_corrupt_chunks_are_detected_on_restore(tmp_path, engine):
+    device_dir = tmp_path / "device"
+    device_dir.mkdir()
+    (device_dir / "nvram.img").write_bytes(os.urandom(CHUNK))  # Incompressible: stored raw
+    manifest = engine.backup(FileDevice(device_dir), label="corrupt")
+    (chunk,) = engine.store.root.glob("*/*.*")
+    chunk.write_bytes(chunk.read_bytes()[::-1])
+    # A fresh engine reads the damaged archive the way a later restore would
+    restorer = BackupEngine(tmp_path / "archive", chunk_size=CHUNK)
+    with pytest.raises(ValueError, match="corrupt"):
+        restorer.restore(manifest, "nvram", tmp_path / "nvram.restored")
@@ -0,0 +1,47 @@
+import pytest
+
+from results_store import ResultsStore
+
+
+@pytest.fixture
+def store():
+    store = ResultsStore(":memory:", batch_size=1000)
+    yield store
+    store.close()
+
+
+def test_runs_are_grouped_per_device(store):
+    for i in range(3):
+        store.record_run("analyze", {"sim_state": "READY", "n": i}, serial="S1", model="Nokia G50", started=i)
+    store.record_run("analyze", {"sim_state": "READY"}, imei="356938035643809", model="Nokia G50", started=5)
+    assert [run[3] for run in store.history(serial="S1")] == [None] * 3
+    assert len(store.history(imei="356938035643809")) == 1
+    assert store.db.execute("SELECT COUNT(*) FROM devices").fetchone()[0] == 2
+
+
+def test_unidentified_runs_create_no_device(store):
+    store.record_run("run_diagnosis", {"detected": False}, model="Nokia G50", verdict="not detected")
+    store.record_run("run_diagnosis", {"detected": False}, model="Nokia G50", verdict="not detected")
+    store.flush()
+    assert store.db.execute("SELECT COUNT(*) FROM devices").fetchone()[0] == 0
+    assert store.db.execute("SELECT COUNT(*) FROM runs WHERE device_id IS NULL").fetchone()[0] == 2
+    assert store.sim_absent_rate() == []
+
+
+def test_sim_absent_rate_uses_the_latest_run_with_a_sim_state(store):
+    store.record_run("analyze_g50", {"sim_state": "ABSENT"}, serial="S1", model="Nokia G50", started=1)
+    store.record_run("run_diagnosis", {"detected": True}, serial="S1", model="Nokia G50", started=2)
+    store.record_run("analyze_g50", {"sim_state": "ABSENT"}, serial="S2", model="Nokia G50", started=1)
+    store.record_run("analyze_g50", {"sim_state": "READY"}, serial="S2", model="Nokia G50", started=3)
+    store.record_run("run_diagnosis", {"detected": True}, serial="S3", model="Nokia G50", started=1)
+    assert store.sim_absent_rate() == [("Nokia G50", 2, 1, 0.5)]
+
+
+def test_changes_compare_only_shared_probes(store):
+    store.record_run("analyze_g50", {"sim_state": "ABSENT", "baseband": ""}, serial="S1", started=1)
+    store.record_run("batch", {"sim_state": "READY", "network_type": "LTE"}, serial="S1", started=2)
+    assert store.changes_since_last(serial="S1") == {"sim_state": ("ABSENT", "READY")}
+    store.record_run("batch", {"sim_state": "READY", "network_type": "LTE"}, serial="S1", started=3)
+    assert store.changes_since_last(serial="S1") == {}
+    assert store.changes_since_last(serial="S9") is None
+
@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+
+from sparse_image import (CHUNK_FILL, CHUNK_RAW, INDEX_NAME, MAX_CHUNK_BLOCKS, SparseConverter, file_sha256,
+                          is_sparse, make_test_image, split_runs, unsparse)
+
+
+def test_round_trip_restores_the_raw_image(tmp_path):
+    raw = tmp_path / "userdata.img"
+    make_test_image(raw, size_mb=8)
+    target, stats = SparseConverter(workers=2, segment_size=1024 * 1024).convert(raw)
+    assert is_sparse(target)
+    assert stats["sparse"] < stats["raw"]
+    restored = tmp_path / "restored.img"
+    assert unsparse(target, restored) == raw.stat().st_size
+    assert file_sha256(restored) == file_sha256(raw)
+
+
+def test_dont_care_round_trip_matches_where_data_was_written(tmp_path):
+    raw = tmp_path / "system.img"
+    make_test_image(raw, size_mb=4, seed=3)
+    target, _ = SparseConverter(workers=1, zero_as_dont_care=True).convert(raw)
+    restored = tmp_path / "restored.img"
+    unsparse(target, restored)
+    assert file_sha256(restored) == file_sha256(raw)  # A fresh file reads back zeros
+
+
+def test_second_conversion_is_served_from_the_cache(tmp_path):
+    raw = tmp_path / "boot.img"
+    make_test_image(raw, size_mb=2)
+    first, stats = SparseConverter(workers=1).convert(raw)
+    assert not stats["cached"]
+    again, stats = SparseConverter(workers=1).convert(raw)
+    assert stats["cached"] and again == first
+
+
+def test_changed_source_replaces_the_old_sparse_copy(tmp_path):
+    raw = tmp_path / "boot.img"
+    make_test_image(raw, size_mb=8)
+    first, _ = SparseConverter(workers=1).convert(raw)
+    make_test_image(raw, size_mb=8, seed=5)
+    os.utime(raw, ns=(raw.stat().st_atime_ns, raw.stat().st_mtime_ns + 10**9))  # A rebuild a second later
+    second, stats = SparseConverter(workers=1).convert(raw)
+    assert not stats["cached"] and second != first
+    assert second.exists() and not first.exists()
+    assert sorted(p.name for p in tmp_path.glob("*.simg")) == [second.name]
+
+
+def test_parallel_conversions_of_one_image_write_it_once(tmp_path):
+    raw = tmp_path / "vendor.img"
+    make_test_image(raw, size_mb=4)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(SparseConverter(workers=1).convert(raw)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({target for target, _ in results}) == 1
+    assert sorted(stats["cached"] for _, stats in results) == [False, True, True, True]
+    assert not list(tmp_path.glob("*.part"))
+    index = json.loads((tmp_path / INDEX_NAME).read_text(encoding="utf-8"))
+    assert index["vendor.img"]["file"] == results[0][0].name
+
+
+def test_index_keeps_every_image_converted_in_parallel(tmp_path):
+    images = []
+    for i in range(3):
+        images.append(tmp_path / f"part{i}.img")
+        make_test_image(images[-1], size_mb=1, seed=i)
+    threads = [threading.Thread(target=SparseConverter(workers=1).convert, args=(image,)) for image in images]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    index = json.loads((tmp_path / INDEX_NAME).read_text(encoding="utf-8"))
+    assert sorted(index) == ["part0.img", "part1.img", "part2.img"]
+
+
+def test_raw_runs_are_split_below_the_chunk_size_limit():
+    runs = [[CHUNK_RAW, 2 * MAX_CHUNK_BLOCKS + 5, None], [CHUNK_FILL, 3 * MAX_CHUNK_BLOCKS, 0]]
+    assert split_runs(runs) == [[CHUNK_RAW, MAX_CHUNK_BLOCKS, None], [CHUNK_RAW, MAX_CHUNK_BLOCKS, None],
+                                [CHUNK_RAW, 5, None], [CHUNK_FILL, 3 * MAX_CHUNK_BLOCKS, 0]]
+    assert 12 + MAX_CHUNK_BLOCKS * 4096 <= 0xFFFFFFFF
@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+
+from batch_runner import BatchRunner
+from usb_topology import SAMPLE_TOPOLOGY, Topology, TransferScheduler, upstream
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def flash(serial):
+    return {"id": f"flash-{serial}", "serial": serial, "action": "flash"}
+
+
+@pytest.fixture
+def topology():
+    return Topology.from_dict(SAMPLE_TOPOLOGY)
+
+
+def test_synthetic_topology_chains(topology):
+    assert len(topology.devices) == 12
+    assert topology.chain("PHONE13") == ["1-1", "1"]
+    assert topology.chain("UNKNOWN") == []
+    assert upstream("1-2.3.1") == ["1-2.3", "1-2", "1"]
+    assert topology.throughput("1-1") == 35.0  # USB 2.0 link until measured
+    measured = Topology.from_dict({"hubs": {"1": {"speed": 480, "throughput": 20}}, "devices": []})
+    assert measured.throughput("1") == 20
+
+
+def test_hub_admits_up_to_its_slots(topology):
+    scheduler = TransferScheduler(topology)
+    scheduler.rate.update({"1-1": 12.0, "1": 12.0, "2-1": 12.0, "2": 12.0})  # 35 MB/s / 12 MB/s -> 3 slots
+    assert scheduler.slots("1-1") == 3
+    assert [scheduler.try_acquire(flash(f"PHONE1{port}")) for port in range(1, 5)] == [True, True, True, False]
+    assert scheduler.try_acquire(flash("PHONE21"))  # Other hub
+    scheduler.release(flash("PHONE11"))
+    assert scheduler.try_acquire(flash("PHONE14"))
+
+
+def test_light_jobs_bypass_admission(topology):
+    scheduler = TransferScheduler(topology)
+    scheduler.rate["1-1"] = 35.0  # One transfer fills the hub
+    assert scheduler.try_acquire(flash("PHONE11"))
+    assert not scheduler.try_acquire(flash("PHONE12"))
+    assert scheduler.try_acquire({"id": "d", "serial": "PHONE12", "action": "diagnose"})
+    assert scheduler.active["1-1"] == 1
+
+
+def test_slots_are_learned_from_measured_throughput(topology, tmp_path):
+    clock = Clock()
+    scheduler = TransferScheduler(topology, clock=clock, state_path=tmp_path / "throughput.json")
+
+    scheduler.try_acquire(flash("PHONE11"))
+    clock.now += 10
+    scheduler.release(flash("PHONE11"), 100e6)  # Alone: 10 MB/s per transfer
+    assert scheduler.rate["1-1"] == pytest.approx(10.0)
+    assert scheduler.slots("1-1") == 4  # 35 / 10
+
+    for port in range(1, 5):
+        assert scheduler.try_acquire(flash(f"PHONE1{port}"))
+    clock.now += 20
+    for port in range(1, 5):
+        scheduler.release(flash(f"PHONE1{port}"), 100e6)  # Shared: 5 MB/s each, the hub is the limit
+    assert scheduler.capacity["1-1"] < 35.0
+    assert scheduler.slots("1-1") < 4
+
+    scheduler.save()
+    assert TransferScheduler(topology, state_path=tmp_path / "throughput.json").slots("1-1") == scheduler.slots("1-1")
+
+
+class PreparingLayer:
+    """Flash jobs convert images (slow, no USB traffic) before they transfer"""
+
+    def __init__(self, scheduler, clock):
+        self.scheduler = scheduler
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.prepared = []
+        self.admitted_while_preparing = []
+
+    def prepare(self, job):
+        with self.lock:
+            self.prepared.append(job["id"])
+            if job["id"] in self.scheduler.transfers:
+                self.admitted_while_preparing.append(job["id"])
+            self.clock.now += 30  # Conversion time must not count against the hub
+
+    def flash(self, job):
+        assert job["id"] in self.prepared
+        with self.lock:
+            self.clock.now += 1
+        return {"status": "ok", "bytes": 10e6}
+
+    def diagnose(self, job):
+        return {"status": "ok"}
+
+
+def test_images_are_prepared_before_admission(topology):
+    clock = Clock()
+    scheduler = TransferScheduler(topology, clock=clock)
+    layer = PreparingLayer(scheduler, clock)
+    jobs = [flash("PHONE11"), {"id": "d", "serial": "PHONE12", "action": "diagnose"}]
+    summary = BatchRunner(layer, concurrency=4, scheduler=scheduler, progress=lambda message: None).run(jobs)
+
+    assert summary["statuses"] == {"ok": 2}
+    assert layer.prepared == ["flash-PHONE11"]
+    assert layer.admitted_while_preparing == []
+    assert scheduler.rate["1-1"] == pytest.approx(10.0)  # 10 MB in the 1 s transfer, not 31 s
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+USB Topology - Knows which hub and root port every phone hangs off
+Heavy transfers (flash) are admitted per hub from measured throughput so a shared hub
+never gets oversubscribed, while light diagnostics run without waiting
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+
+SYSFS_USB = Path("/sys/bus/usb/devices")
+THROUGHPUT_PATH = Path(__file__).parent / "logs" / "usb_throughput.json"
+
+HEAVY_ACTIONS = ("flash",)
+
+# Usable bulk throughput (MB/s) per negotiated link speed (Mbit/s) until something is measured
+LINK_THROUGHPUT = {1.5: 0.1, 12: 1.0, 480: 35.0, 5000: 380.0, 10000: 750.0, 20000: 1500.0}
+DEFAULT_SPEED = 480
+
+MEASURE_WEIGHT = 0.3  # EWMA weight of a new throughput sample
+SATURATED = 0.9  # A shared transfer below this share of the lone rate = the hub is the limit
+
+WINDOWS_LOCATION = re.compile(r"USB\((\d+)\)")
+
+
+def parent_path(path):
+    """'1-2.3.1' -> '1-2.3' -> '1-2' -> '1' (root) -> None"""
+    if "." in path:
+        return path.rsplit(".", 1)[0]
+    if "-" in path:
+        return path.split("-", 1)[0]
+    return None
+
+
+def upstream(path):
+    """Every hub and root port between a device and its host controller, nearest first"""
+    chain = []
+    node = parent_path(path)
+    while node is not None:
+        chain.append(node)
+        node = parent_path(node)
+    return chain
+
+
+def link_throughput(speed):
+    """Usable MB/s for a link speed in Mbit/s"""
+    speed = speed or DEFAULT_SPEED
+    known = [s for s in sorted(LINK_THROUGHPUT) if s <= speed]
+    return LINK_THROUGHPUT[known[-1] if known else min(LINK_THROUGHPUT)]
+
+
+class UsbDevice:
+    """A phone's place in the USB tree"""
+
+    def __init__(self, serial, path, speed=None):
+        self.serial = serial
+        self.path = path
+        self.speed = speed
+
+    def to_dict(self):
+        return {"serial": self.serial, "path": self.path, "speed": self.speed}
+
+
+class Topology:
+    """Devices by serial plus the speed (and optionally measured throughput) of every hub"""
+
+    def __init__(self, devices=(), hubs=None):
+        self.devices = {device.serial: device for device in devices}
+        self.hubs = dict(hubs or {})  # path -> {"speed": Mbit/s, "throughput": MB/s}
+
+    @classmethod
+    def from_file(cls, path):
+        """Synthetic or recorded topology
+
+        Layout (JSON):
+            {
+              "hubs": {"1": {"speed": 5000}, "1-1": {"speed": 480, "throughput": 30}},
+              "devices": [{"serial": "G50A1B2C3", "path": "1-1.2", "speed": 480}]
+            }
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls.from_dict(data)
+
+    @classmethod
+    def from_dict(cls, data):
+        devices = [UsbDevice(entry["serial"], entry["path"], entry.get("speed")) for entry in data.get("devices", [])]
+        return cls(devices, data.get("hubs", {}))
+
+    @classmethod
+    def from_sysfs(cls, root=SYSFS_USB):
+        """Linux: every USB device with a serial, and every hub's speed"""
+        devices, hubs = [], {}
+        for entry in sorted(Path(root).iterdir()):
+            if ":" in entry.name:
+                continue  # Interfaces, not devices
+            root = entry.name.startswith("usb")
+            path = entry.name[3:] if root else entry.name
+            speed = _read_number(entry / "speed")
+            if (_read_number(entry / "maxchild") or 0) > 0:
+                hubs[path] = {"speed": speed}
+            serial = _read_text(entry / "serial")
+            if serial and not root:  # Root hubs report the controller's PCI address
+                devices.append(UsbDevice(serial, path, speed))
+        return cls(devices, hubs)
+
+    @classmethod
+    def from_windows(cls):
+        """Windows: location paths of present USB devices (link speed is not exposed)"""
+        from command_runner import powershell
+
+        result = powershell("""Get-PnpDevice -PresentOnly | Where-Object { $_.InstanceId -like 'USB\\VID_*' } |
+            ForEach-Object { $_.InstanceId + '|' + ((Get-PnpDeviceProperty -InstanceId $_.InstanceId
+            -KeyName DEVPKEY_Device_LocationPaths -ErrorAction SilentlyContinue).Data -join ';') }""")
+        devices, controllers = [], {}
+        for line in (result.stdout or "").splitlines():
+            instance, _, locations = line.strip().partition("|")
+            serial = instance.rsplit("\\", 1)[-1]
+            location = locations.split(";")[0]
+            if "&" in serial or "#USBROOT(" not in location:
+                continue  # Windows-generated instance ID, not a device serial
+            controller, _, ports = location.partition("#USBROOT(")
+            bus = controllers.setdefault(controller, len(controllers) + 1)
+            hops = WINDOWS_LOCATION.findall(ports)
+            if hops:
+                devices.append(UsbDevice(serial, f"{bus}-" + ".".join(hops)))
+        return cls(devices)
+
+    @classmethod
+    def detect(cls):
+        """The host's live topology, or an empty one where it can't be read"""
+        try:
+            if SYSFS_USB.is_dir():
+                return cls.from_sysfs()
+            if os.name == "nt":
+                return cls.from_windows()
+        except OSError:
+            pass
+        return cls()
+
+    def device(self, serial):
+        return self.devices.get(serial) if serial else None
+
+    def chain(self, serial):
+        """Hubs and root port shared with other devices, nearest first"""
+        device = self.device(serial)
+        return upstream(device.path) if device else []
+
+    def throughput(self, hub):
+        info = self.hubs.get(hub, {})
+        return info.get("throughput") or link_throughput(info.get("speed"))
+
+    def to_dict(self):
+        return {"hubs": self.hubs, "devices": [device.to_dict() for device in self.devices.values()]}
+
+
+def _read_text(path):
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return ""
+
+
+def _read_number(path):
+    try:
+        return float(_read_text(path))
+    except ValueError:
+        return None
+
+
+class Transfer:
+    """One admitted heavy job"""
+
+    def __init__(self, hubs, sharing, started):
+        self.hubs = hubs
+        self.started = started
+        self.sharing = dict(sharing)  # hub -> most transfers seen on it while this one ran
+
+
+class TransferScheduler:
+    """Per-hub admission for heavy jobs
+
+    Each hub gets as many concurrent transfers as its capacity divided by what a
+    single transfer achieves. Both start from the link speed and are replaced by
+    measurements: a lone transfer measures the per-transfer rate, and shared
+    transfers that ran slower than a lone one measure the hub itself.
+    """
+
+    def __init__(self, topology, heavy_actions=HEAVY_ACTIONS, log=None, clock=time.monotonic, state_path=None):
+        self.topology = topology
+        self.clock = clock
+        self.heavy_actions = set(heavy_actions)
+        self.log = log or (lambda message: None)
+        self.state_path = Path(state_path) if state_path else None
+        self.cond = threading.Condition()
+        self.active = {}
+        self.capacity = {}
+        self.rate = {}
+        self.transfers = {}
+        if self.state_path and self.state_path.exists():
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+                self.capacity, self.rate = state["capacity"], state["rate"]
+            except (OSError, ValueError, KeyError):
+                pass  # Relearn from this batch
+
+    def save(self):
+        """Keep what was measured so the next batch on this bench starts at the right limits"""
+        if not self.state_path:
+            return
+        with self.cond:
+            state = {"capacity": self.capacity, "rate": self.rate}
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+
+    def is_heavy(self, job):
+        return job["action"] in self.heavy_actions
+
+    def slots(self, hub):
+        capacity = self.capacity.get(hub) or self.topology.throughput(hub)
+        rate = self.rate.get(hub) or capacity
+        return max(1, round(capacity / rate))
+
+    def try_acquire(self, job):
+        """Admit a job if every hub above it has a free slot (light jobs always pass)"""
+        if not self.is_heavy(job):
+            return True
+        hubs = self.topology.chain(job.get("serial"))
+        with self.cond:
+            if any(self.active.get(hub, 0) >= self.slots(hub) for hub in hubs):
+                return False
+            for hub in hubs:
+                self.active[hub] = self.active.get(hub, 0) + 1
+            for transfer in self.transfers.values():
+                for hub in set(transfer.hubs) & set(hubs):
+                    transfer.sharing[hub] = max(transfer.sharing[hub], self.active[hub])
+            self.transfers[job["id"]] = Transfer(hubs, {hub: self.active[hub] for hub in hubs}, self.clock())
+            return True
+
+    def enqueue(self, pending, job):
+        """Add a job to a list next_ready() may be waiting on"""
+        with self.cond:
+            pending.append(job)
+            self.cond.notify_all()
+
+    def next_ready(self, pending):
+        """Block until some pending job can start, admit it and return it"""
+        with self.cond:
+            while True:
+                for job in pending:
+                    if self.try_acquire(job):
+                        return job
+                self.cond.wait(1.0)
+
+    def release(self, job, transferred=None):
+        """Free a job's slots and learn from its throughput (bytes moved, if known)"""
+        with self.cond:
+            transfer = self.transfers.pop(job["id"], None)
+            if transfer is None:
+                return
+            for hub in transfer.hubs:
+                self.active[hub] -= 1
+            elapsed = self.clock() - transfer.started
+            if transferred and elapsed > 0:
+                self._measure(transfer, transferred / elapsed / 1e6)
+            self.cond.notify_all()
+
+    def _measure(self, transfer, rate):
+        for hub, sharing in transfer.sharing.items():
+            before = self.slots(hub)
+            capacity = self.capacity.get(hub) or self.topology.throughput(hub)
+            if sharing == 1:
+                self.rate[hub] = _blend(self.rate.get(hub), rate)
+            elif rate < (self.rate.get(hub) or capacity) * SATURATED:
+                # Slower than alone: the hub is what limits this many transfers
+                self.capacity[hub] = _blend(self.capacity.get(hub), rate * sharing)
+            elif rate * sharing > capacity:
+                self.capacity[hub] = rate * sharing
+            if self.slots(hub) != before:
+                self.log(f"Hub {hub}: {before} -> {self.slots(hub)} concurrent transfers "
+                         f"({self.rate.get(hub, 0):.1f} MB/s each, {self.capacity.get(hub) or self.topology.throughput(hub):.1f} MB/s hub)")
+
+    def report(self):
+        with self.cond:
+            hubs = sorted({hub for device in self.topology.devices.values() for hub in upstream(device.path)})
+            return {hub: {"slots": self.slots(hub), "active": self.active.get(hub, 0),
+                          "rate": round(self.rate.get(hub, 0.0), 1),
+                          "capacity": round(self.capacity.get(hub) or self.topology.throughput(hub), 1)}
+                    for hub in hubs}
+
+
+def _blend(previous, sample):
+    return sample if previous is None else previous + MEASURE_WEIGHT * (sample - previous)
+
+
+class SimulatedUsbLayer:
+    """Device layer whose flash jobs share simulated hub bandwidth
+
+    A phone writes at most device_rate MB/s; a hub delivers its throughput split
+    between active transfers and loses efficiency once oversubscribed.
+    time_scale shrinks simulated seconds to wall-clock seconds.
+    """
+
+    def __init__(self, topology, image_mb=200, device_rate=12.0, time_scale=0.02, chunks=40):
+        self.topology = topology
+        self.image_bytes = int(image_mb * 1e6)
+        self.device_rate = device_rate
+        self.time_scale = time_scale
+        self.chunks = chunks
+        self.lock = threading.Lock()
+        self.active = {}
+        self.started = time.monotonic()
+        self.finished = {}  # action -> simulated seconds until the last one completed
+
+    def done(self, action):
+        with self.lock:
+            self.finished[action] = (time.monotonic() - self.started) / self.time_scale
+
+    def hub_rate(self, hub):
+        """MB/s a single transfer gets through a hub right now"""
+        active = self.active.get(hub, 1)
+        capacity = self.topology.throughput(hub)
+        oversubscribed = active - capacity / self.device_rate
+        efficiency = 1.0 if oversubscribed <= 0 else max(0.35, 1.0 - 0.12 * oversubscribed)
+        return capacity * efficiency / active
+
+    def flash(self, job):
+        hubs = self.topology.chain(job.get("serial"))
+        with self.lock:
+            for hub in hubs:
+                self.active[hub] = self.active.get(hub, 0) + 1
+        try:
+            chunk = self.image_bytes / self.chunks
+            for _ in range(self.chunks):
+                with self.lock:
+                    rate = min([self.device_rate] + [self.hub_rate(hub) for hub in hubs])
+                time.sleep(chunk / 1e6 / rate * self.time_scale)
+        finally:
+            with self.lock:
+                for hub in hubs:
+                    self.active[hub] -= 1
+        self.done("flash")
+        return {"status": "ok", "simulated": True, "bytes": self.image_bytes}
+
+    def _light(self, job):
+        time.sleep(0.5 * self.time_scale)
+        self.done(job["action"])
+        return {"status": "ok", "simulated": True}
+
+    diagnose = network_reset = verify = _light
+
+
+# Two root ports, each behind a 7-port USB 2.0 hub with six phones on it
+SAMPLE_TOPOLOGY = {
+    "hubs": {"1": {"speed": 5000}, "1-1": {"speed": 480}, "2": {"speed": 5000}, "2-1": {"speed": 480}},
+    "devices": [{"serial": f"PHONE{bus}{port}", "path": f"{bus}-1.{port}", "speed": 480}
+                for bus in (1, 2) for port in range(1, 7)],
+}
+
+
+def simulate(topology=None, image_mb=200, time_scale=0.02):
+    """Flash every phone plus a diagnose per phone, with and without hub scheduling"""
+    import shutil
+    import tempfile
+    from batch_runner import BatchRunner
+
+    topology = topology or Topology.from_dict(SAMPLE_TOPOLOGY)
+    serials = sorted(topology.devices)
+    jobs = [{"id": f"flash-{serial}", "serial": serial, "action": "flash"} for serial in serials]
+    jobs += [{"id": f"diagnose-{serial}", "serial": serial, "action": "diagnose"} for serial in serials]
+    print(f"{len(serials)} phones, {image_mb} MB image each, hubs: "
+          + ", ".join(f"{hub} {topology.throughput(hub):.0f} MB/s" for hub in sorted(topology.hubs)))
+
+    state_path = Path(tempfile.mkdtemp(prefix="usb_sim_")) / "throughput.json"
+    try:
+        for label, scheduled in (("all at once", False), ("scheduler, 1st batch", True), ("scheduler, 2nd batch", True)):
+            layer = SimulatedUsbLayer(topology, image_mb, time_scale=time_scale)
+            scheduler = None
+            if scheduled:
+                scheduler = TransferScheduler(topology, clock=lambda: time.monotonic() / time_scale, state_path=state_path)
+            runner = BatchRunner(layer, concurrency=len(jobs), scheduler=scheduler, progress=lambda message: None)
+            runner.run(jobs)
+            if scheduler:
+                scheduler.save()
+            flashed = layer.finished["flash"]
+            print(f"{label:<21} flashes done in {flashed:6.1f}s simulated "
+                  f"({image_mb * len(serials) / flashed:5.1f} MB/s aggregate), diagnostics done after "
+                  f"{layer.finished['diagnose']:5.1f}s")
+            if scheduler:
+                for hub, state in scheduler.report().items():
+                    print(f"  hub {hub}: {state['slots']} slots, {state['rate']} MB/s per transfer, "
+                          f"{state['capacity']} MB/s capacity")
+    finally:
+        shutil.rmtree(state_path.parent, ignore_errors=True)
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "simulate":
+        simulate(Topology.from_file(sys.argv[2]) if len(sys.argv) > 2 else None)
+        return
+    if len(sys.argv) >= 2 and sys.argv[1] != "show":
+        print("Usage: python usb_topology.py [show|simulate [topology.json]]")
+        return
+    topology = Topology.detect()
+    if not topology.devices:
+        print("No USB devices with a serial number found")
+    for device in sorted(topology.devices.values(), key=lambda d: d.path):
+        chain = " <- ".join(upstream(device.path))
+        speed = f"{device.speed:g} Mbit/s" if device.speed else "speed unknown"
+        print(f"{device.serial:<20} {device.path:<12} {speed:<16} via {chain}")
+
+
+if __name__ == "__main__":
+    main()